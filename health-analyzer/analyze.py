@@ -6,144 +6,375 @@ Usage:
     ./analyze.py --file health/latest.json
     ./analyze.py --file health/latest.json --report daily
     ./analyze.py --file health/latest.json --metric hrv --days 7
+    ./analyze.py ingest health/latest.json --store health/history.db
+    ./analyze.py --file health/history.db --metric hrv --days 90
+    ./analyze.py --file health/latest.json --watch --sink health/flags.jsonl
+    ./analyze.py --file health/latest.json --profile json --profile-output profile.json
+    ./analyze.py serve --store health/history.db --host 0.0.0.0 --port 3400
+    ./analyze.py query --file health/latest.json hrv rhr --bucket week --agg mean,p50,p90
+    ./analyze.py workouts --file health/latest.json --days 30 --age 35
+    ./analyze.py baselines --file health/latest.json
+    ./analyze.py export --file health/history.db --out health/parquet --partition metric,month
+    ./analyze.py batch subjects.csv --format csv --output summary.csv
 """
 
+import asyncio
+import csv
+import functools
 import json
 import sys
-from datetime import datetime, timedelta
+import time
+from datetime import datetime
 from pathlib import Path
-from collections import defaultdict
-from typing import Dict, List, Any
+from typing import Dict, List, Optional, Sequence, Tuple
 import argparse
 
+import baseline
+import batch
+import export
+import parallel
+import profiling
+import query
+import rules
+import server
+import store
+import watch
+import workout_stats
+from cache import read_export_cached
+from loader import read_export
+from series import (DailyRollup, MAX_UTC_OFFSET, MetricSeries, SECONDS_PER_DAY, day_string, extend_series,
+                    np, parse_timestamp, stitch_sessions, tz_for_offset)
+
+
+# Metrics that are summed per day rather than averaged
+CUMULATIVE_METRICS = ['step_count', 'active_energy', 'apple_exercise_time',
+                      'walking_running_distance', 'flights_climbed']
+
+# Metrics read by generate_report and detect_red_flags
+REPORT_METRICS = sorted({'resting_heart_rate', 'heart_rate_variability', 'step_count',
+                         'active_energy', 'apple_exercise_time'}
+                        | set(rules.required_metrics()))
+
+# (metric, label, unit) summarized by the report and batch results
+KEY_METRICS = [
+    ('resting_heart_rate', 'Resting HR', 'bpm'),
+    ('heart_rate_variability', 'HRV', 'ms'),
+    ('step_count', 'Steps/day', 'count'),
+    ('active_energy', 'Active Energy/day', 'kcal'),
+    ('apple_exercise_time', 'Exercise Time/day', 'min'),
+]
+
+# Sleep segments closer together than this belong to the same night
+SLEEP_SESSION_GAP = 2 * 3600
+
+# Short names accepted by --metric
+METRIC_ALIASES = {
+    'hr': 'heart_rate',
+    'rhr': 'resting_heart_rate',
+    'hrv': 'heart_rate_variability',
+    'steps': 'step_count',
+    'energy': 'active_energy',
+    'exercise': 'apple_exercise_time',
+    'sleep': 'sleep_analysis',
+}
+
 
 class HealthAnalyzer:
     """Parse and analyze Apple Health data from Health Auto Export"""
     
-    def __init__(self, filepath: str):
+    def __init__(self, filepath: str, metrics: Optional[Sequence[str]] = None,
+                 workouts: bool = True, use_cache: bool = True, since: Optional[int] = None,
+                 workers: Optional[int] = None, baseline_path: Optional[str] = None):
+        """
+        Args:
+            filepath: Health Auto Export JSON file, a directory or glob of archived
+                exports, or a history store built by `ingest`
+            metrics: Only load these metrics (None loads everything)
+            workouts: Whether to load the workouts list
+            use_cache: Read and write the binary parse cache and the baseline state
+                next to the file
+            since: Only keep points at or after this epoch second
+            workers: Worker processes for parsing a directory or glob (default: CPU count)
+            baseline_path: Where long-term baselines persist between runs (default:
+                `<file>.baselines.json`; without the cache, or for a directory or
+                glob, they are kept in memory only)
+        """
         self.filepath = Path(filepath)
-        self.data = None
-        self.metrics = {}
+        self.wanted_metrics = list(metrics) if metrics is not None else None
+        self.load_workouts = workouts
+        self.use_cache = use_cache
+        self.since = since
+        self.workers = workers
+        if baseline_path is None and use_cache and not parallel.is_multi(str(self.filepath)):
+            baseline_path = baseline.state_path(self.filepath)
+        self.baseline_path = Path(baseline_path) if baseline_path is not None else None
+        self.metrics: Dict[str, MetricSeries] = {}
         self.workouts = []
+        self._rollups: Dict[str, DailyRollup] = {}
+        self._sleep_sessions: Optional[List[Tuple[int, int, int, float]]] = None
+        self._workout_index: Optional[workout_stats.WorkoutIndex] = None
+        self._baselines: Optional[Dict[str, baseline.Baseline]] = None
+        self.rule_timings: Dict[str, float] = {}
         self.load_data()
         
     def load_data(self):
-        """Load health data from JSON file"""
-        if not self.filepath.exists():
-            raise FileNotFoundError(f"Health data file not found: {self.filepath}")
+        """Load columnar metric series from JSON export(s) or the history store"""
+        self.clear_memos()
+        with profiling.phase('load'):
+            if parallel.is_multi(str(self.filepath)):
+                self.metrics, self.workouts = parallel.read_exports(str(self.filepath), self.wanted_metrics,
+                                                                    self.load_workouts, self.workers)
+            elif not self.filepath.exists():
+                raise FileNotFoundError(f"Health data file not found: {self.filepath}")
+            elif store.is_store(self.filepath):
+                self.metrics, self.workouts = store.read_store(self.filepath, self.wanted_metrics,
+                                                               self.load_workouts, self.since)
+            else:
+                read = read_export_cached if self.use_cache else read_export
+                self.metrics, self.workouts = read(self.filepath, self.wanted_metrics, self.load_workouts)
+                
+            if self.since is not None:
+                self.metrics = {name: series.tail(series.index_at(self.since))
+                                for name, series in self.metrics.items()}
+        if profiling.ACTIVE is not None:
+            profiling.ACTIVE.count_points(self.metrics)
+            
+    def clear_memos(self):
+        """Drop memoized rollups and sleep sessions so they are rebuilt on next use"""
+        self._rollups = {}
+        self._sleep_sessions = None
+        self._workout_index = None
+        self._baselines = None
+            
+    def refresh(self) -> Dict[str, int]:
+        """Merge in points added to the source since the last load.
+
+        Only points at or after each metric's latest timestamp are kept from
+        the re-read, and memoized rollups are rebuilt from the first day those
+        points touch. Like the history store this accumulates: points that
+        drop out of a rewritten export stay loaded.
+
+        Returns:
+            New points per changed metric, plus new workouts under 'workouts'
+        """
+        if parallel.is_multi(str(self.filepath)):
+            before = {name: len(series) for name, series in self.metrics.items()}
+            workout_count = len(self.workouts)
+            self.load_data()
+            added = {name: len(series) - before.get(name, 0) for name, series in self.metrics.items()
+                     if len(series) != before.get(name, 0)}
+            added['workouts'] = len(self.workouts) - workout_count
+            return added
             
-        with open(self.filepath, 'r') as f:
-            self.data = json.load(f)
+        highs = {name: int(series.ts[len(series) - 1]) for name, series in self.metrics.items() if len(series)}
+        if store.is_store(self.filepath):
+            fresh, workout_list = store.read_store(self.filepath, self.wanted_metrics, self.load_workouts,
+                                                   min(highs.values()) if highs else self.since)
+        else:
+            fresh, workout_list = read_export(self.filepath, self.wanted_metrics, self.load_workouts, highs)
             
-        # Parse metrics into dict by name
-        for metric in self.data['data']['metrics']:
-            name = metric['name']
-            self.metrics[name] = {
-                'units': metric['units'],
-                'data': metric['data']
-            }
+        added: Dict[str, int] = {}
+        for name, newer in fresh.items():
+            if name in highs:
+                newer = newer.tail(newer.index_at(highs[name]))
+            if len(newer) == 0:
+                continue
+            series = self.metrics.get(name)
+            before = len(series) if series is not None else 0
+            self.metrics[name] = series = extend_series(series, newer) if series is not None else newer
+            if len(series) > before:
+                added[name] = len(series) - before
+            rollup = self._rollups.get(name)
+            if rollup is not None:
+                self._rollups[name] = rollup.splice(series.daily_rollup(int(min(newer.local_days()))))
+        if 'sleep_analysis' in added:
+            self._sleep_sessions = None
+        if added:
+            # Re-read from disk and advanced past the saved high-water marks on next use
+            self._baselines = None
             
-        # Parse workouts
-        self.workouts = self.data['data'].get('workouts', [])
+        known = {(workout.get('start', ''), workout.get('name', '')) for workout in self.workouts}
+        new_workouts = [workout for workout in workout_list
+                        if (workout.get('start', ''), workout.get('name', '')) not in known]
+        self.workouts.extend(new_workouts)
+        if new_workouts:
+            self._workout_index = None
+        added['workouts'] = len(new_workouts)
+        return added
+        
+    def _window_start(self, series: MetricSeries, days: int) -> int:
+        """Index of the first point within the last N days"""
+        return series.index_at(int(time.time()) - days * SECONDS_PER_DAY)
         
     def get_metric_data(self, metric_name: str, days: int = 7) -> List[Dict]:
         """Get metric data for last N days"""
-        if metric_name not in self.metrics:
+        series = self.metrics.get(metric_name)
+        if series is None or len(series) == 0:
             return []
             
-        cutoff = datetime.now() - timedelta(days=days)
-        data_points = []
+        start = self._window_start(series, days)
+        ts, offset, qty, source = series.ts[start:], series.offset[start:], series.qty[start:], series.source[start:]
+        if np is not None:
+            ts, offset, qty, source = ts.tolist(), offset.tolist(), qty.tolist(), source.tolist()
+            
+        sources = series.sources
+        return [
+            {'date': datetime.fromtimestamp(t, tz_for_offset(o)), 'value': q, 'source': sources[s]}
+            for t, o, q, s in zip(ts, offset, qty, source)
+        ]
+    
+    def rollup(self, metric_name: str) -> Optional[DailyRollup]:
+        """Per-day count/sum/min/max/mean/last for a metric, computed once per load"""
+        rollup = self._rollups.get(metric_name)
+        if rollup is None:
+            series = self.metrics.get(metric_name)
+            if series is None or len(series) == 0:
+                return None
+            with profiling.phase('rollups'):
+                rollup = self._rollups[metric_name] = series.daily_rollup()
+        return rollup
         
-        for point in self.metrics[metric_name]['data']:
-            try:
-                date = datetime.strptime(point['date'], '%Y-%m-%d %H:%M:%S %z')
-                if date.replace(tzinfo=None) >= cutoff:
-                    data_points.append({
-                        'date': date,
-                        'value': point['qty'],
-                        'source': point.get('source', 'Unknown')
-                    })
-            except (ValueError, KeyError):
-                continue
-                
-        return sorted(data_points, key=lambda x: x['date'])
+    def _window_rows(self, metric_name: str, days: int) -> Tuple[Optional[DailyRollup], int]:
+        """Rollup for a metric and the index of its first row within the last N days.
+
+        Windows are whole local days: today and the N calendar days before it.
+        """
+        rollup = self.rollup(metric_name)
+        if rollup is None:
+            return None, 0
+        series = self.metrics[metric_name]
+        today = (int(time.time()) + int(series.offset[len(series) - 1])) // SECONDS_PER_DAY
+        return rollup, rollup.index_of(today - days)
     
     def daily_average(self, metric_name: str, days: int = 7) -> Dict[str, float]:
         """Calculate daily averages for a metric"""
-        data = self.get_metric_data(metric_name, days)
-        if not data:
+        rollup, start = self._window_rows(metric_name, days)
+        if rollup is None:
             return {}
-            
-        by_day = defaultdict(list)
-        for point in data:
-            day = point['date'].date()
-            by_day[day].append(point['value'])
-            
-        averages = {}
-        for day, values in sorted(by_day.items()):
-            averages[str(day)] = sum(values) / len(values)
-            
-        return averages
+        return {day_string(d): s / c for d, s, c in
+                zip(rollup.day[start:], rollup.sum[start:], rollup.count[start:])}
     
     def daily_total(self, metric_name: str, days: int = 7) -> Dict[str, float]:
         """Calculate daily totals for cumulative metrics (steps, energy, etc)"""
-        data = self.get_metric_data(metric_name, days)
-        if not data:
+        rollup, start = self._window_rows(metric_name, days)
+        if rollup is None:
             return {}
+        return {day_string(d): s for d, s in zip(rollup.day[start:], rollup.sum[start:])}
+    
+    def query(self, metric_names: Sequence[str], bucket: str = 'day', aggs: Sequence[str] = ('mean',),
+              start: Optional[int] = None, end: Optional[int] = None) -> Dict[str, List[Dict]]:
+        """Bucketed aggregations for several metrics, one pass over each (see query.py).
+
+        Args:
+            metric_names: Metric names or METRIC_ALIASES
+            bucket: 'minute', 'hour', 'day', 'week' or 'month'
+            aggs: Any of sum, mean, min, max, count, p50, p90, p99
+            start: Inclusive local wall-clock bound (query.parse_local_time)
+            end: Exclusive local wall-clock bound
+
+        Returns:
+            Rows per metric name as given, each {'bucket': label, agg: value, ...}
+        """
+        rows = query.run(self.metrics, [METRIC_ALIASES.get(name, name) for name in metric_names],
+                         bucket, aggs, start, end)
+        return {name: rows[METRIC_ALIASES.get(name, name)] for name in metric_names}
+    
+    def sleep_nights(self, days: int = 7) -> Dict[str, float]:
+        """Hours asleep per night for the last N days, keyed by wake-up date.
+
+        Sleep segments are stitched into sessions (gaps up to two hours) once
+        per load; naps ending on the same day add to that night.
+        """
+        series = self.metrics.get('sleep_analysis')
+        if series is None or len(series) == 0:
+            return {}
+        if self._sleep_sessions is None:
+            with profiling.phase('sleep_sessions'):
+                self._sleep_sessions = stitch_sessions(series, SLEEP_SESSION_GAP)
             
-        by_day = defaultdict(list)
-        for point in data:
-            day = point['date'].date()
-            by_day[day].append(point['value'])
-            
-        totals = {}
-        for day, values in sorted(by_day.items()):
-            totals[str(day)] = sum(values)
-            
-        return totals
+        today = (int(time.time()) + int(series.offset[len(series) - 1])) // SECONDS_PER_DAY
+        nights: Dict[str, float] = {}
+        for _, end, offset, hours in self._sleep_sessions:
+            night = (end + offset) // SECONDS_PER_DAY
+            if night >= today - days:
+                key = day_string(night)
+                nights[key] = nights.get(key, 0.0) + hours
+        return nights
+    
+    def recent_workouts(self, days: int = 7) -> List[Dict]:
+        """Workouts that started within the last N days"""
+        cutoff = int(time.time()) - days * SECONDS_PER_DAY
+        recent = []
+        for workout in self.workouts:
+            try:
+                start, _ = parse_timestamp(workout['start'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if start >= cutoff:
+                recent.append(workout)
+        return recent
+    
+    def workout_stats(self, days: Optional[int] = None, max_hr: float = workout_stats.MAX_HR) -> List[Dict]:
+        """Per-workout duration, average/max HR, calories and minutes per HR zone.
+
+        Heart-rate samples are matched to workouts through an interval index
+        built once per load (see workout_stats.py).
+        """
+        if self._workout_index is None:
+            self._workout_index = workout_stats.WorkoutIndex(self.workouts)
+        index = self._workout_index
+        if days is not None:
+            index = index.since(int(time.time()) - days * SECONDS_PER_DAY)
+        return workout_stats.analyze_workouts(index, self.metrics.get('heart_rate'),
+                                              self.metrics.get('active_energy'), max_hr)
+    
+    def baselines(self) -> Dict[str, baseline.Baseline]:
+        """Long-term per-metric baselines (see baseline.py), advanced once per load
+        with the points earlier runs have not seen, then saved"""
+        if self._baselines is None:
+            with profiling.phase('baselines'):
+                self._baselines = baseline.load(self.baseline_path)
+                if baseline.advance_all(self._baselines, self.metrics) and self.baseline_path is not None:
+                    baseline.save(self.baseline_path, self._baselines)
+        return self._baselines
+    
+    def baseline(self, metric_name: str, max_age_days: int = 2) -> Optional[baseline.Baseline]:
+        """A metric's baseline if it has enough history and its latest scored day
+        is no older than `max_age_days`"""
+        current = self.baselines().get(metric_name)
+        series = self.metrics.get(metric_name)
+        if current is None or not current.ready or series is None or len(series) == 0:
+            return None
+        today = (int(time.time()) + int(series.offset[len(series) - 1])) // SECONDS_PER_DAY
+        return current if current.last_day >= today - max_age_days else None
+    
+    def key_metrics(self, days: int = 7) -> Dict[str, Optional[float]]:
+        """Averages over the last N days for each of KEY_METRICS (None without data).
+
+        Rates are averaged per day; cumulative metrics are summed per day
+        before averaging.
+        """
+        values: Dict[str, Optional[float]] = {}
+        for metric_name, _, _ in KEY_METRICS:
+            if metric_name in CUMULATIVE_METRICS:
+                daily = self.daily_total(metric_name, days=days)
+            else:
+                daily = self.daily_average(metric_name, days=days)
+            values[metric_name] = sum(daily.values()) / len(daily) if daily else None
+        return values
     
     def detect_red_flags(self) -> List[str]:
-        """Detect health red flags based on criteria"""
-        flags = []
-        
-        # Check resting HR elevated >10 bpm for 3+ days
-        rhr_data = self.daily_average('resting_heart_rate', days=7)
-        if len(rhr_data) >= 3:
-            values = list(rhr_data.values())
-            recent_avg = sum(values[-3:]) / 3
-            baseline = sum(values) / len(values)
-            if recent_avg > baseline + 10:
-                flags.append(f"⚠️  Resting HR elevated: {recent_avg:.1f} bpm (baseline {baseline:.1f})")
-        
-        # Check HRV declining trend over 5+ days
-        hrv_data = self.daily_average('heart_rate_variability', days=7)
-        if len(hrv_data) >= 5:
-            values = list(hrv_data.values())
-            if len(values) >= 5:
-                early_avg = sum(values[:3]) / 3
-                recent_avg = sum(values[-3:]) / 3
-                if recent_avg < early_avg * 0.85:  # 15% decline
-                    flags.append(f"⚠️  HRV declining: {recent_avg:.1f} ms (was {early_avg:.1f})")
-        
-        # Check zero workouts in last 7 days
-        if len(self.workouts) == 0:
-            flags.append("⚠️  No workouts recorded in last 7 days")
-        
-        # Check step count <2000 for 3+ days
-        steps_data = self.daily_total('step_count', days=7)
-        if len(steps_data) >= 3:
-            values = list(steps_data.values())
-            low_days = sum(1 for v in values[-7:] if v < 2000)
-            if low_days >= 3:
-                flags.append(f"⚠️  Low activity: {low_days} days with <2000 steps")
-        
-        # Check sleep analysis (need to calculate total sleep per day)
-        # Sleep data is more complex - skip for now
-        
+        """Detect health red flags by evaluating the registered rules (see rules.py)"""
+        with profiling.phase('rules'):
+            flags, self.rule_timings = rules.evaluate(self)
         return flags
     
     def generate_report(self, report_type: str = 'summary') -> str:
         """Generate health report"""
+        with profiling.phase('report'):
+            return self._build_report(report_type)
+    
+    def _build_report(self, report_type: str) -> str:
         report = []
         report.append("=" * 60)
         report.append("HEALTH DATA ANALYSIS")
@@ -156,32 +387,10 @@ class HealthAnalyzer:
         report.append("KEY METRICS (7-day averages):")
         report.append("-" * 60)
         
-        # Metrics that should be averaged
-        avg_metrics = [
-            ('resting_heart_rate', 'Resting HR', 'bpm'),
-            ('heart_rate_variability', 'HRV', 'ms'),
-        ]
-        
-        for metric_name, label, unit in avg_metrics:
-            averages = self.daily_average(metric_name, days=7)
-            if averages:
-                recent_avg = sum(averages.values()) / len(averages)
-                report.append(f"  {label:20s}: {recent_avg:8.1f} {unit}")
-            else:
-                report.append(f"  {label:20s}: No data")
-        
-        # Metrics that should be summed daily, then averaged
-        total_metrics = [
-            ('step_count', 'Steps/day', 'count'),
-            ('active_energy', 'Active Energy/day', 'kcal'),
-            ('apple_exercise_time', 'Exercise Time/day', 'min'),
-        ]
-        
-        for metric_name, label, unit in total_metrics:
-            totals = self.daily_total(metric_name, days=7)
-            if totals:
-                daily_avg = sum(totals.values()) / len(totals)
-                report.append(f"  {label:20s}: {daily_avg:8.1f} {unit}")
+        values = self.key_metrics(days=7)
+        for metric_name, label, unit in KEY_METRICS:
+            if values[metric_name] is not None:
+                report.append(f"  {label:20s}: {values[metric_name]:8.1f} {unit}")
             else:
                 report.append(f"  {label:20s}: No data")
         
@@ -209,48 +418,377 @@ class HealthAnalyzer:
         else:
             report.append("  ✅ No red flags detected")
         
+        if report_type == 'detailed':
+            report.append("")
+            report.append("RULE TIMINGS:")
+            report.append("-" * 60)
+            for name, seconds in self.rule_timings.items():
+                report.append(f"  {name:20s}: {seconds * 1000:8.3f} ms")
+        
         report.append("")
         report.append("=" * 60)
         
         return "\n".join(report)
 
 
-def main():
+def analyze_subject(subject: str, file: str, use_cache: bool = True, days: int = 7) -> Dict:
+    """Batch job: key metrics and red flags for one subject's data (runs in a pool worker)"""
+    # workers=1: a directory or glob is parsed inside this worker rather than in a nested pool
+    analyzer = HealthAnalyzer(file, metrics=REPORT_METRICS, use_cache=use_cache, workers=1)
+    flags, _ = rules.evaluate_by_rule(analyzer)
+    return {
+        'subject': subject,
+        'file': file,
+        'status': 'ok',
+        'points': sum(len(series) for series in analyzer.metrics.values()),
+        'workouts': len(analyzer.workouts),
+        'metrics': analyzer.key_metrics(days),
+        'flags': flags,
+    }
+
+
+def ingest_main(argv: List[str]):
+    """`ingest` subcommand: merge export snapshots into the history store"""
+    parser = argparse.ArgumentParser(prog='analyze.py ingest',
+                                     description='Merge Health Auto Export snapshots into a history store')
+    parser.add_argument('files', nargs='+',
+                        help='Export JSON files, directories or globs to ingest, oldest first')
+    parser.add_argument('--store', required=True, help='Path to the SQLite history store')
+    parser.add_argument('--workers', type=int, help='Parser processes (default: CPU count)')
+    args = parser.parse_args(argv)
+    
+    paths = [path for spec in args.files for path in parallel.expand_paths(spec)]
+    if not paths:
+        raise FileNotFoundError(f"No health data files match: {' '.join(args.files)}")
+    # Files are parsed in parallel but merged one at a time, in order
+    for path, series, workout_list in parallel.iter_parsed(paths, workers=args.workers):
+        added = store.merge(args.store, series, workout_list)
+        workouts = added.pop('workouts')
+        print(f"{path}: +{sum(added.values())} points, +{workouts} workouts")
+        for name, count in sorted(added.items()):
+            if count:
+                print(f"  {name:30s} +{count}")
+
+
+def serve_main(argv: List[str]):
+    """`serve` subcommand: receive Health Auto Export POSTs straight into the store"""
+    parser = argparse.ArgumentParser(prog='analyze.py serve',
+                                     description='HTTP endpoint that ingests Health Auto Export payloads')
+    parser.add_argument('--store', required=True, help='Path to the SQLite history store')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to bind (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=server.DEFAULT_PORT, help='Port to listen on')
+    parser.add_argument('--path', default='/', help='URL path accepting POSTs (default: /)')
+    parser.add_argument('--max-body', type=server.parse_size, default=server.MAX_BODY,
+                        help='Largest accepted payload, e.g. 64M (default: 256M)')
+    parser.add_argument('--max-concurrent', type=int, default=2,
+                        help='Payloads decoded at once; further uploads wait (default: 2)')
+    args = parser.parse_args(argv)
+    server.run(args.store, args.host, args.port, args.max_body, args.max_concurrent, args.path)
+
+
+def replay_main(argv: List[str]):
+    """`replay` subcommand: POST recorded exports to a running `serve`"""
+    parser = argparse.ArgumentParser(prog='analyze.py replay',
+                                     description='Replay recorded Health Auto Export payloads against `serve`')
+    parser.add_argument('files', nargs='+', help='Recorded payload files, directories or globs')
+    parser.add_argument('--url', default=f'http://127.0.0.1:{server.DEFAULT_PORT}/', help='Server URL')
+    parser.add_argument('--concurrency', type=int, default=1, help='Uploads in flight at once')
+    args = parser.parse_args(argv)
+    
+    paths = [path for spec in args.files for path in parallel.expand_paths(spec)]
+    if not paths:
+        raise FileNotFoundError(f"No payload files match: {' '.join(args.files)}")
+    results = asyncio.run(server.replay(args.url, paths, args.concurrency))
+    failed = 0
+    for path, status, result, seconds in results:
+        if status == 200:
+            print(f"{path}: {status} +{result['points']} points, +{result['workouts']} workouts "
+                  f"in {seconds * 1000:.0f} ms")
+        else:
+            failed += 1
+            print(f"{path}: {status or 'failed'} {result.get('error', '')}")
+    if failed:
+        raise RuntimeError(f"{failed} of {len(results)} uploads failed")
+
+
+def query_main(argv: List[str]):
+    """`query` subcommand: bucketed aggregations for several metrics from one load"""
+    parser = argparse.ArgumentParser(prog='analyze.py query',
+                                     description='Resample metrics into buckets with aggregations')
+    parser.add_argument('metrics', nargs='+', help='Metric names or aliases (hr, rhr, hrv, steps, ...)')
+    parser.add_argument('--file', required=True, help='Export, directory/glob of exports, or history store')
+    parser.add_argument('--bucket', default='day', choices=query.BUCKETS, help='Bucket size (default: day)')
+    parser.add_argument('--agg', default='mean',
+                        help=f"Comma-separated aggregations from {','.join(query.AGGREGATIONS)} (default: mean)")
+    parser.add_argument('--from', dest='start', type=query.parse_local_time,
+                        help='Start, inclusive: YYYY-MM-DD or "YYYY-MM-DD HH:MM" local time')
+    parser.add_argument('--to', dest='end', type=query.parse_local_time,
+                        help='End, exclusive: YYYY-MM-DD or "YYYY-MM-DD HH:MM" local time')
+    parser.add_argument('--format', default='table', choices=['table', 'json', 'csv'], help='Output format')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the binary parse cache and baseline state')
+    parser.add_argument('--workers', type=int, help='Parser processes for a directory or glob')
+    args = parser.parse_args(argv)
+    
+    aggs = [agg.strip() for agg in args.agg.split(',') if agg.strip()]
+    names = [METRIC_ALIASES.get(name, name) for name in args.metrics]
+    since = args.start - MAX_UTC_OFFSET if args.start is not None else None
+    # Every metric comes out of the same single pass over the file
+    analyzer = HealthAnalyzer(args.file, metrics=names, workouts=False, use_cache=not args.no_cache,
+                              since=since, workers=args.workers)
+    results = analyzer.query(names, args.bucket, aggs, args.start, args.end)
+    
+    if args.format == 'json':
+        print(json.dumps(results, indent=2))
+    elif args.format == 'csv':
+        writer = csv.writer(sys.stdout)
+        writer.writerow(['metric', 'bucket', *aggs])
+        for name, rows in results.items():
+            for row in rows:
+                writer.writerow([name, row['bucket'], *(row[agg] for agg in aggs)])
+    else:
+        for name, rows in results.items():
+            print(f"\n{name.upper()} - {', '.join(aggs)} per {args.bucket}")
+            print("=" * 60)
+            print(f"  {'bucket':16s}" + ''.join(f" {agg:>10s}" for agg in aggs))
+            for row in rows:
+                print(f"  {row['bucket']:16s}" + ''.join(
+                    f" {row[agg]:>10d}" if agg == 'count' else f" {row[agg]:>10.2f}" for agg in aggs))
+            if not rows:
+                print("  No data")
+
+
+def workouts_main(argv: List[str]):
+    """`workouts` subcommand: per-workout heart-rate zones, average/max HR and calories"""
+    parser = argparse.ArgumentParser(prog='analyze.py workouts',
+                                     description='Heart-rate zones and calories per workout')
+    parser.add_argument('--file', required=True, help='Export, directory/glob of exports, or history store')
+    parser.add_argument('--days', type=int, help='Only workouts that started in the last N days')
+    parser.add_argument('--max-hr', type=float, help=f'Maximum heart rate for zones (default: {workout_stats.MAX_HR})')
+    parser.add_argument('--age', type=int, help='Derive maximum heart rate as 220 - age')
+    parser.add_argument('--format', default='table', choices=['table', 'json'], help='Output format')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the binary parse cache and baseline state')
+    parser.add_argument('--workers', type=int, help='Parser processes for a directory or glob')
+    args = parser.parse_args(argv)
+    
+    max_hr = args.max_hr or (workout_stats.max_hr_for_age(args.age) if args.age else workout_stats.MAX_HR)
+    since = int(time.time()) - args.days * SECONDS_PER_DAY if args.days is not None else None
+    analyzer = HealthAnalyzer(args.file, metrics=['heart_rate', 'active_energy'], use_cache=not args.no_cache,
+                              since=since, workers=args.workers)
+    stats = analyzer.workout_stats(args.days, max_hr)
+    
+    if args.format == 'json':
+        print(json.dumps({'max_hr': max_hr, 'workouts': stats}, indent=2))
+        return
+    
+    zones = workout_stats.zone_thresholds(max_hr)
+    print(f"\nWORKOUTS - {len(stats)} analyzed (max HR {max_hr:.0f} bpm)")
+    print("=" * 60)
+    print("  Zones: " + ', '.join(f"{zone} {low:.0f}-{high:.0f}" if high else f"{zone} {low:.0f}+"
+                                  for zone, low, high in zones))
+    print(f"  {'start':25s} {'name':22s} {'min':>5s} {'avg':>5s} {'max':>5s} {'kcal':>6s}  "
+          + ' '.join(f"{zone:>4s}" for zone, _, _ in zones))
+    for w in stats:
+        avg = f"{w['avg_hr']:5.0f}" if w['avg_hr'] is not None else '    -'
+        peak = f"{w['max_hr']:5.0f}" if w['max_hr'] is not None else '    -'
+        kcal = f"{w['kcal']:6.0f}" if w['kcal'] is not None else '     -'
+        print(f"  {w['start']:25s} {w['name'][:22]:22s} {w['minutes']:5.0f} {avg} {peak} {kcal}  "
+              + ' '.join(f"{minutes:4.0f}" for minutes in w['zones'].values()))
+
+
+def baselines_main(argv: List[str]):
+    """`baselines` subcommand: show the long-term baselines after folding in new data"""
+    parser = argparse.ArgumentParser(prog='analyze.py baselines',
+                                     description='Show streaming long-term baselines per metric')
+    parser.add_argument('--file', required=True, help='Export or history store')
+    parser.add_argument('--state', help='Baseline state file (default: <file>.baselines.json, none with --no-cache)')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the binary parse cache and baseline state')
+    args = parser.parse_args(argv)
+    
+    analyzer = HealthAnalyzer(args.file, metrics=sorted(baseline.DAILY_VALUE), workouts=False,
+                              use_cache=not args.no_cache, baseline_path=args.state)
+    print(f"\nBASELINES ({baseline.HALF_LIFE_DAYS}-day half-life)")
+    print("=" * 60)
+    print(f"  {'metric':24s} {'days':>5s} {'mean':>9s} {'std':>8s} {'median':>9s} "
+          f"{'last day':>10s} {'value':>9s} {'z':>6s}")
+    for name, current in sorted(analyzer.baselines().items()):
+        if not current.days:
+            print(f"  {name:24s} {0:5d}  (pending first complete day)")
+            continue
+        z = f"{current.last_z:+6.1f}" if current.last_z is not None else '     -'
+        print(f"  {name:24s} {current.days:5d} {current.mean:9.1f} {current.std:8.1f} {current.median:9.1f} "
+              f"{day_string(current.last_day):>10s} {current.last_value:9.1f} {z}")
+
+
+def export_main(argv: List[str]):
+    """`export` subcommand: write normalized metrics and workouts to Parquet/Arrow or SQLite"""
+    parser = argparse.ArgumentParser(prog='analyze.py export',
+                                     description='Export parsed metrics and workouts in a columnar format')
+    parser.add_argument('--file', required=True, help='Export, directory/glob of exports, or history store')
+    parser.add_argument('--out', required=True,
+                        help='Output directory (parquet, arrow) or database file (sqlite)')
+    parser.add_argument('--format', choices=export.FORMATS,
+                        help='Output format (default: parquet if pyarrow is installed, else sqlite)')
+    parser.add_argument('--partition', default=','.join(export.PARTITION_KEYS),
+                        help='Comma-separated partition keys from metric,month, or "none" (default: metric,month); '
+                             'SQLite is always clustered by metric and month')
+    parser.add_argument('--metric', action='append', help='Only export this metric (repeatable; aliases accepted)')
+    parser.add_argument('--overwrite', action='store_true', help='Replace --out if it exists')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the binary parse cache and baseline state')
+    parser.add_argument('--workers', type=int, help='Parser processes for a directory or glob')
+    args = parser.parse_args(argv)
+    
+    partition = [] if args.partition == 'none' else [key.strip() for key in args.partition.split(',') if key.strip()]
+    names = [METRIC_ALIASES.get(name, name) for name in args.metric] if args.metric else None
+    started = time.perf_counter()
+    analyzer = HealthAnalyzer(args.file, metrics=names, use_cache=not args.no_cache, workers=args.workers)
+    fmt = args.format or export.default_format()
+    written = export.export(analyzer.metrics, analyzer.workouts, args.out, fmt, partition, args.overwrite)
+    print(f"Exported {written['points']} points of {len(analyzer.metrics)} metrics and {written['workouts']} "
+          f"workouts to {args.out} ({fmt}, {written['partitions']} partitions) "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+def batch_main(argv: List[str]):
+    """`batch` subcommand: analyze every subject in a manifest across one worker pool"""
+    parser = argparse.ArgumentParser(prog='analyze.py batch',
+                                     description='Analyze many subjects\' exports in one worker pool')
+    parser.add_argument('manifest', help='CSV with a subject,file header, or JSON list/mapping of subjects to files')
+    parser.add_argument('--executor', default='process', choices=batch.EXECUTORS,
+                        help='process (default; parsing is CPU-bound) or thread')
+    parser.add_argument('--workers', type=int, help='Pool size (default: CPU count)')
+    parser.add_argument('--days', type=int, default=7, help='Window for the key metric averages (default: 7)')
+    parser.add_argument('--format', default='json', choices=['json', 'csv'], help='Combined output format')
+    parser.add_argument('--output', help='Write the combined results here instead of stdout')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the binary parse cache and baseline state')
+    parser.add_argument('--quiet', action='store_true', help='No per-subject progress on stderr')
+    args = parser.parse_args(argv)
+    
+    jobs = batch.read_manifest(args.manifest)
+    work = functools.partial(analyze_subject, use_cache=not args.no_cache, days=args.days)
+    started = time.perf_counter()
+    results = batch.run(jobs, work, args.executor, args.workers, None if args.quiet else sys.stderr)
+    elapsed = time.perf_counter() - started
+    
+    out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        if args.format == 'csv':
+            batch.write_csv(out, results, [name for name, _, _ in KEY_METRICS])
+        else:
+            batch.write_json(out, results, elapsed)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    
+    summary = batch.summarize(results, elapsed)
+    print(f"{summary['subjects']} subjects in {elapsed:.1f}s: {summary['failed']} failed, "
+          f"{summary['flagged']} with red flags", file=sys.stderr)
+    if summary['failed']:
+        sys.exit(1)
+
+
+COMMANDS = {
+    'ingest': ingest_main,
+    'batch': batch_main,
+    'export': export_main,
+    'baselines': baselines_main,
+    'workouts': workouts_main,
+    'query': query_main,
+    'serve': serve_main,
+    'replay': replay_main,
+}
+
+
+def main(argv: Optional[List[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in COMMANDS:
+        try:
+            COMMANDS[argv[0]](argv[1:])
+        except Exception as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+        
     parser = argparse.ArgumentParser(description='Analyze Apple Health data')
-    parser.add_argument('--file', required=True, help='Path to health JSON file')
+    parser.add_argument('--file', required=True,
+                        help='Path to health JSON file, directory or glob of exports, '
+                             'or history store (see `ingest`)')
     parser.add_argument('--report', default='summary', choices=['summary', 'daily', 'detailed'],
                         help='Report type')
     parser.add_argument('--metric', help='Show specific metric data')
     parser.add_argument('--days', type=int, default=7, help='Number of days to analyze')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Parse the JSON directly, bypassing the binary parse cache and baseline state')
+    parser.add_argument('--workers', type=int,
+                        help='Parser processes when --file is a directory or glob (default: CPU count)')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running, re-checking red flags whenever the file changes')
+    parser.add_argument('--sink', default='-',
+                        help='With --watch: JSONL file to append flag changes to (default: stdout)')
+    parser.add_argument('--poll-interval', type=float, default=watch.POLL_INTERVAL,
+                        help='With --watch: seconds between checks when inotify is unavailable')
+    parser.add_argument('--profile', nargs='?', const='text', choices=['text', 'json'],
+                        help='Report per-phase wall/CPU time, points per metric and peak RSS '
+                             'when done, as text (default) or json')
+    parser.add_argument('--profile-output', help='With --profile: write the profile here instead of stderr')
+    parser.add_argument('--profile-cprofile', help='With --profile: also run under cProfile and dump '
+                                                   'pstats data to this file')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='With --profile: also trace allocations with tracemalloc for their peak '
+                             '(slows JSON decoding several times over)')
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.profile and args.watch:
+        parser.error('--profile cannot be combined with --watch')
+    if args.profile:
+        profiling.start(trace_memory=args.profile_memory, cprofile=bool(args.profile_cprofile))
     
     try:
-        analyzer = HealthAnalyzer(args.file)
-        
-        if args.metric:
-            # Show specific metric
-            # Use totals for cumulative metrics, averages for rates
-            cumulative_metrics = ['step_count', 'active_energy', 'apple_exercise_time', 
-                                   'walking_running_distance', 'flights_climbed']
+        if args.watch:
+            analyzer = HealthAnalyzer(args.file, metrics=REPORT_METRICS, use_cache=not args.no_cache,
+                                      workers=args.workers)
+            watch.run(analyzer, args.sink, args.poll_interval)
+        elif args.metric:
+            # Show specific metric; only that metric is decoded from the file
+            metric = METRIC_ALIASES.get(args.metric, args.metric)
+            # One spare day so the oldest calendar day in the window is complete
+            since = int(time.time()) - (args.days + 1) * SECONDS_PER_DAY
+            analyzer = HealthAnalyzer(args.file, metrics=[metric], workouts=False,
+                                      use_cache=not args.no_cache, since=since, workers=args.workers)
             
-            if args.metric in cumulative_metrics:
-                data = analyzer.daily_total(args.metric, days=args.days)
-                print(f"\n{args.metric.upper()} - Daily Totals ({args.days} days)")
+            # Use totals for cumulative metrics, averages for rates
+            if metric in CUMULATIVE_METRICS:
+                data = analyzer.daily_total(metric, days=args.days)
+                print(f"\n{metric.upper()} - Daily Totals ({args.days} days)")
             else:
-                data = analyzer.daily_average(args.metric, days=args.days)
-                print(f"\n{args.metric.upper()} - Daily Averages ({args.days} days)")
+                data = analyzer.daily_average(metric, days=args.days)
+                print(f"\n{metric.upper()} - Daily Averages ({args.days} days)")
             
-            print("=" * 60)
-            for day, value in data.items():
-                print(f"  {day}: {value:.2f}")
+            with profiling.phase('output'):
+                print("=" * 60)
+                for day, value in data.items():
+                    print(f"  {day}: {value:.2f}")
         else:
             # Show general report
-            print(analyzer.generate_report(args.report))
+            analyzer = HealthAnalyzer(args.file, metrics=REPORT_METRICS, use_cache=not args.no_cache,
+                                      workers=args.workers)
+            report = analyzer.generate_report(args.report)
+            with profiling.phase('output'):
+                print(report)
             
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
+    
+    if args.profile:
+        profiler = profiling.stop()
+        if args.profile_cprofile:
+            profiler.cprofile.dump_stats(args.profile_cprofile)
+        text = profiler.format_json() if args.profile == 'json' else profiler.format_text()
+        if args.profile_output:
+            with open(args.profile_output, 'w', encoding='utf-8') as f:
+                f.write(text + '\n')
+        else:
+            print(text, file=sys.stderr)
 
 
 if __name__ == '__main__':
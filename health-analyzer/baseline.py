@@ -0,0 +1,200 @@
+"""
+Streaming per-metric baselines persisted between runs.
+
+Each tracked metric is reduced to one value per local day: the mean for rates
+such as resting HR, the total for counts such as steps. Days are folded into
+a constant-size state:
+
+  mean, var    exponentially weighted mean and variance (half-life HALF_LIFE_DAYS)
+  median, mad  stochastic running estimates of the median and of the median
+               absolute deviation, nudged a fixed fraction of the spread per day
+
+Every completed day is first scored against the baseline as it stood before
+that day (z from mean/var, robust z from median/mad) and then folded in.
+A day is complete once a point from a later day arrives. The state keeps each
+metric's high-water timestamp and the sources of the points at it, so a run
+only reads points it has not seen, a late second source at that instant
+included, and costs the same whether the history spans a week or several
+years. The state is saved as JSON next to the data, written atomically like
+the parse cache; analyzers run without the cache keep it in memory only.
+"""
+
+import json
+import math
+import os
+from array import array
+from pathlib import Path
+from typing import Dict, Optional
+
+from series import COLUMNS, MetricSeries, np
+
+FORMAT_VERSION = 2
+SUFFIX = '.baselines.json'
+HALF_LIFE_DAYS = 28
+# Days folded in before a baseline is trusted for flags
+MIN_DAYS = 14
+# Step of the median/MAD estimates, as a fraction of the current MAD
+MEDIAN_RATE = 0.1
+
+# Tracked metrics and how each day is reduced to one value
+DAILY_VALUE = {
+    'resting_heart_rate': 'mean',
+    'heart_rate_variability': 'mean',
+    'step_count': 'sum',
+    'active_energy': 'sum',
+}
+
+_ALPHA = 1 - 0.5 ** (1 / HALF_LIFE_DAYS)
+# MAD of a normal distribution is this fraction of its standard deviation
+_MAD_TO_STD = 1.4826
+
+
+class Baseline:
+    """Constant-size running baseline of one metric's daily values"""
+
+    __slots__ = ('high_water', 'high_water_sources', 'days', 'mean', 'var', 'median', 'mad',
+                 'pending_day', 'pending_sum', 'pending_count',
+                 'last_day', 'last_value', 'last_z', 'last_robust_z')
+
+    def __init__(self, **state):
+        for name in self.__slots__:
+            setattr(self, name, state.get(name))
+        self.days = self.days or 0
+
+    def as_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @property
+    def ready(self) -> bool:
+        return self.days >= MIN_DAYS
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.var) if self.var else 0.0
+
+    def score(self, value: float):
+        """z and robust z of `value` against the baseline so far (None while empty)"""
+        if not self.days:
+            return None, None
+        z = (value - self.mean) / self.std if self.std > 0 else None
+        robust = (value - self.median) / (self.mad * _MAD_TO_STD) if self.mad else None
+        return z, robust
+
+    def fold(self, day: int, value: float):
+        """Score a completed day against the baseline, then fold it in"""
+        self.last_day, self.last_value = day, value
+        self.last_z, self.last_robust_z = self.score(value)
+        if not self.days:
+            self.mean, self.var, self.median, self.mad = value, 0.0, value, 0.0
+        else:
+            diff = value - self.mean
+            increment = _ALPHA * diff
+            self.mean += increment
+            self.var = (1 - _ALPHA) * (self.var + diff * increment)
+            # Step size tracks the spread, so the estimate settles without a value history
+            step = MEDIAN_RATE * (self.mad or abs(value - self.median) or 1.0)
+            if value > self.median:
+                self.median = min(self.median + step, value)
+            elif value < self.median:
+                self.median = max(self.median - step, value)
+            self.mad += _ALPHA * (abs(value - self.median) - self.mad)
+        self.days += 1
+
+    def _daily_value(self, kind: str) -> float:
+        return self.pending_sum if kind == 'sum' else self.pending_sum / self.pending_count
+
+    def advance(self, series: MetricSeries, kind: str) -> int:
+        """Fold in the series' points after the high-water mark; returns how many were new.
+
+        Points are grouped per local day through a rollup of only the new
+        tail. Points exactly at the mark are re-offered, as in
+        store.merge_series, and kept unless their source was already folded
+        in at that instant. The latest day stays pending until a later day
+        shows up, and points for days already folded in are ignored.
+        """
+        if self.high_water is None:
+            fresh, seen = series, set()
+        else:
+            start = series.index_at(self.high_water)
+            mark_end = series.index_at(self.high_water + 1)
+            seen = set(self.high_water_sources or ())
+            late = [i for i in range(start, mark_end) if series.sources[series.source[i]] not in seen]
+            if len(late) == mark_end - start:
+                fresh = series.tail(start)
+            elif not late:
+                fresh = series.tail(mark_end)
+            else:
+                fresh = _take(series, late + list(range(mark_end, len(series))))
+        if not len(fresh):
+            return 0
+        rollup = fresh.daily_rollup()
+        for day, count, total in zip(rollup.day, rollup.count, rollup.sum):
+            if self.pending_day is not None and day < self.pending_day:
+                continue
+            if self.pending_day is not None and day > self.pending_day:
+                self.fold(self.pending_day, self._daily_value(kind))
+                self.pending_day = None
+            if self.pending_day is None:
+                self.pending_day, self.pending_sum, self.pending_count = day, 0.0, 0
+            self.pending_sum += total
+            self.pending_count += count
+        latest = int(series.ts[len(series) - 1])
+        if latest != self.high_water:
+            self.high_water, seen = latest, set()
+        seen.update(series.sources[series.source[i]] for i in range(series.index_at(latest), len(series)))
+        self.high_water_sources = sorted(seen)
+        return len(fresh)
+
+
+def _take(series: MetricSeries, indices) -> MetricSeries:
+    """Series of the points at `indices`, which must be in timestamp order"""
+    if np is not None:
+        indices = np.asarray(indices, dtype=np.intp)
+        columns = [getattr(series, name)[indices] for name, _ in COLUMNS]
+    else:
+        columns = [array(typecode, (getattr(series, name)[i] for i in indices)) for name, typecode in COLUMNS]
+    return MetricSeries(series.units, *columns, series.sources)
+
+
+def state_path(source: Path) -> Path:
+    return source.with_name(source.name + SUFFIX)
+
+
+def load(path: Optional[Path]) -> Dict[str, Baseline]:
+    """Saved baselines, or empty ones if the file is missing, unreadable or outdated"""
+    if path is None:
+        return {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if saved.get('version') != FORMAT_VERSION or saved.get('half_life_days') != HALF_LIFE_DAYS:
+        return {}
+    return {name: Baseline(**state) for name, state in saved.get('metrics', {}).items()}
+
+
+def save(path: Path, baselines: Dict[str, Baseline]):
+    """Write the state atomically; failures are ignored and the next run catches up"""
+    tmp = path.with_name(path.name + f'.{os.getpid()}.tmp')
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': FORMAT_VERSION, 'half_life_days': HALF_LIFE_DAYS,
+                       'metrics': {name: b.as_dict() for name, b in sorted(baselines.items())}}, f, indent=1)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+
+
+def advance_all(baselines: Dict[str, Baseline], metrics: Dict[str, MetricSeries]) -> int:
+    """Advance every tracked metric present in `metrics`; returns new points folded"""
+    added = 0
+    for name, kind in DAILY_VALUE.items():
+        series = metrics.get(name)
+        if series is None or len(series) == 0:
+            continue
+        added += baselines.setdefault(name, Baseline()).advance(series, kind)
+    return added
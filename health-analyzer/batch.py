@@ -0,0 +1,176 @@
+"""
+Batch analysis of many subjects' exports in one process pool.
+
+A manifest lists (subject, file) pairs, as CSV with a `subject,file` header
+or as JSON (a list of {"subject", "file"} objects, or one object mapping
+subject to file). Relative paths are resolved against the manifest's
+directory. Every job runs in a pool that lives for the whole batch, so
+interpreter startup and imports are paid once per worker, not once per file.
+
+Failures are isolated per job. An exception while analyzing one file is
+recorded in that subject's result and the batch carries on. If a worker
+process dies outright (a crash, or the OOM killer) the process pool breaks and
+every job still pending fails. Those jobs are retried once in a fresh pool,
+and any that break that one too are re-run one at a time, each in its own
+single-worker pool, so only the file that actually kills its worker ends up
+marked as failed.
+"""
+
+import csv
+import json
+import os
+import sys
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, TextIO, Tuple
+
+EXECUTORS = ('process', 'thread')
+
+# (subject, file)
+Job = Tuple[str, str]
+
+
+def read_manifest(path) -> List[Job]:
+    """(subject, file) pairs from a CSV or JSON manifest, in manifest order"""
+    path = Path(path)
+    with open(path, encoding='utf-8') as f:
+        if path.suffix.lower() == '.json':
+            entries = json.load(f)
+            if isinstance(entries, dict):
+                pairs = [(str(subject), str(file)) for subject, file in entries.items()]
+            else:
+                pairs = [(str(entry['subject']), str(entry['file'])) for entry in entries]
+        else:
+            reader = csv.DictReader(f)
+            if reader.fieldnames is None or not {'subject', 'file'} <= set(reader.fieldnames):
+                raise ValueError(f"{path}: CSV manifest needs a 'subject,file' header")
+            pairs = [(row['subject'], row['file']) for row in reader if row['subject'] and row['file']]
+
+    counts = Counter(subject for subject, _ in pairs)
+    duplicates = sorted(subject for subject, count in counts.items() if count > 1)
+    if duplicates:
+        raise ValueError(f"{path}: duplicate subjects: {', '.join(duplicates)}")
+    return [(subject, str(path.parent / file)) for subject, file in pairs]
+
+
+def _failure(subject: str, file: str, error: str) -> Dict:
+    return {'subject': subject, 'file': file, 'status': 'error', 'error': error}
+
+
+def _guarded(work: Callable[[str, str], Dict], subject: str, file: str) -> Dict:
+    """Run one job, turning any exception into an error result (runs in the worker)"""
+    started = time.perf_counter()
+    try:
+        result = work(subject, file)
+    except Exception as e:
+        result = _failure(subject, file, f"{type(e).__name__}: {e}")
+        result['traceback'] = traceback.format_exc()
+    result['elapsed_s'] = time.perf_counter() - started
+    return result
+
+
+def _make_pool(executor: str, workers: int):
+    if executor == 'thread':
+        return ThreadPoolExecutor(max_workers=workers)
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def run(jobs: Sequence[Job], work: Callable[[str, str], Dict], executor: str = 'process',
+        workers: Optional[int] = None, progress: Optional[TextIO] = sys.stderr) -> List[Dict]:
+    """Run `work(subject, file)` for every job across one pool.
+
+    Args:
+        jobs: (subject, file) pairs
+        work: Returns a JSON-serializable result dict for one subject; for a
+            process pool it must be picklable (a module-level function or a
+            functools.partial of one)
+        executor: 'process' (default, uses every core) or 'thread'
+        workers: Pool size (default: CPU count, capped at the number of jobs)
+        progress: Where to print one line per finished job (None for silence)
+
+    Returns:
+        One result per job, in job order. Failed jobs have status 'error'
+        and an 'error' message instead of analysis fields.
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"Unknown executor {executor!r}; choose from {', '.join(EXECUTORS)}")
+    if not jobs:
+        return []
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    results: List[Optional[Dict]] = [None] * len(jobs)
+
+    def report(i: int):
+        if progress is None:
+            return
+        result = results[i]
+        done = sum(r is not None for r in results)
+        status = (f"{len(result.get('flags', {}))} flags" if result['status'] == 'ok'
+                  else f"error: {result['error'].splitlines()[0]}")
+        print(f"[{done}/{len(jobs)}] {result['subject']}: {status} ({result.get('elapsed_s', 0):.2f}s)",
+              file=progress, flush=True)
+
+    def run_pool(indices: List[int], size: int) -> List[int]:
+        """Run the jobs at `indices` in a fresh pool; returns those lost to a broken pool"""
+        crashed = []
+        with _make_pool(executor, size) as pool:
+            futures: Dict[Future, int] = {pool.submit(_guarded, work, *jobs[i]): i for i in indices}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except BrokenProcessPool:
+                    crashed.append(i)
+                    continue
+                except Exception as e:
+                    # Failed outside the guarded call, e.g. the result could not be pickled
+                    results[i] = _failure(*jobs[i], f"{type(e).__name__}: {e}")
+                report(i)
+        return sorted(crashed)
+
+    crashed = run_pool(list(range(len(jobs))), workers)
+    if crashed:
+        crashed = run_pool(crashed, min(workers, len(crashed)))
+    for i in crashed:
+        # Still failing alongside a dying worker: isolate each job to find the culprit
+        if run_pool([i], 1):
+            results[i] = _failure(*jobs[i], 'Worker process died while analyzing this file')
+            report(i)
+    return results
+
+
+def summarize(results: Sequence[Dict], elapsed: float) -> Dict:
+    """Batch-level counts for the combined report"""
+    ok = [r for r in results if r['status'] == 'ok']
+    return {
+        'subjects': len(results),
+        'succeeded': len(ok),
+        'failed': len(results) - len(ok),
+        'flagged': sum(1 for r in ok if r['flags']),
+        'flags': sum(len(r['flags']) for r in ok),
+        'elapsed_s': elapsed,
+    }
+
+
+def write_json(out: TextIO, results: Sequence[Dict], elapsed: float):
+    json.dump({'summary': summarize(results, elapsed), 'subjects': list(results)}, out, indent=2)
+    out.write('\n')
+
+
+def write_csv(out: TextIO, results: Sequence[Dict], metric_keys: Sequence[str]):
+    """One row per subject; `flags` holds the raised rule names separated by ';'"""
+    writer = csv.writer(out)
+    writer.writerow(['subject', 'file', 'status', 'points', 'workouts', *metric_keys,
+                     'flag_count', 'flags', 'elapsed_s', 'error'])
+    for r in results:
+        if r['status'] == 'ok':
+            metrics = r['metrics']
+            writer.writerow([r['subject'], r['file'], r['status'], r['points'], r['workouts'],
+                             *('' if metrics.get(key) is None else f"{metrics[key]:.2f}" for key in metric_keys),
+                             len(r['flags']), ';'.join(r['flags']), f"{r['elapsed_s']:.3f}", ''])
+        else:
+            writer.writerow([r['subject'], r['file'], r['status'], '', '', *([''] * len(metric_keys)),
+                             '', '', f"{r.get('elapsed_s', 0):.3f}", r['error']])
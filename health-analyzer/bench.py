@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Benchmark HealthAnalyzer on synthetic exports of increasing size.
+
+For each scale (days of history), a synthetic export is generated once into
+--data-dir with synth.py. The analyzer's phases are then timed on it: load
+with and without the parse cache, get_metric_data, daily_average,
+daily_total, detect_red_flags and generate_report. Wall times are the best
+of --repeat runs. Peak memory is measured in a separate tracemalloc run,
+so tracing overhead does not skew the timings.
+
+Usage:
+    ./bench.py --scales 1,30,365 --output bench.json
+    ./bench.py --scales 1,30,365 --baseline bench.json --tolerance 0.25
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cache
+import synth
+from analyze import HealthAnalyzer, REPORT_METRICS
+from series import SECONDS_PER_DAY, np
+
+DEFAULT_SCALES = (1, 30, 365, 1825)
+SEED = 1
+# Slowdowns smaller than this are timer noise, whatever the ratio
+NOISE_FLOOR_S = 0.001
+
+# (phase, run(path, analyzer)); analysis phases get a loaded analyzer with its memos cleared
+PHASES: List[Tuple[str, Callable]] = [
+    ('load_data', lambda path, analyzer: HealthAnalyzer(path, use_cache=False)),
+    ('load_data_cached', lambda path, analyzer: HealthAnalyzer(path)),
+    ('load_data_report', lambda path, analyzer: HealthAnalyzer(path, metrics=REPORT_METRICS)),
+    ('get_metric_data', lambda path, analyzer: analyzer.get_metric_data('heart_rate', 7)),
+    ('daily_average', lambda path, analyzer: analyzer.daily_average('heart_rate', 30)),
+    ('daily_total', lambda path, analyzer: analyzer.daily_total('step_count', 30)),
+    ('detect_red_flags', lambda path, analyzer: analyzer.detect_red_flags()),
+    ('generate_report', lambda path, analyzer: analyzer.generate_report('summary')),
+]
+
+
+def dataset(data_dir: Path, days: int) -> Path:
+    """Synthetic export for `days` days ending at today's UTC midnight, generated on first use.
+
+    Ending at a fixed point of the current day keeps the 7-day windows
+    populated while letting runs on the same day share the file.
+    """
+    end = int(time.time()) // SECONDS_PER_DAY * SECONDS_PER_DAY
+    path = data_dir / f'synth-{days}d-seed{SEED}-{end}.json'
+    if not path.exists():
+        data_dir.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + '.tmp')
+        synth.write_export(tmp, days, SEED, end)
+        tmp.replace(path)
+    return path
+
+
+def _reset(analyzer: HealthAnalyzer):
+    """Clear memos and the baseline state, so every run folds the whole history"""
+    analyzer.clear_memos()
+    analyzer.baseline_path.unlink(missing_ok=True)
+
+
+def _time_phase(run: Callable, path: Path, analyzer: HealthAnalyzer, repeat: int) -> List[float]:
+    times = []
+    for _ in range(repeat):
+        _reset(analyzer)
+        started = time.perf_counter()
+        run(path, analyzer)
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def _peak_memory(run: Callable, path: Path, analyzer: HealthAnalyzer) -> int:
+    """Peak bytes allocated while the phase runs, above what was live before it"""
+    _reset(analyzer)
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        run(path, analyzer)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - baseline
+
+
+def run_scale(data_dir: Path, days: int, repeat: int, phases: Optional[List[str]] = None) -> List[Dict]:
+    path = dataset(data_dir, days)
+    cache.invalidate(path)
+    # Warm the cache for load_data_cached, and keep one loaded analyzer for the analysis phases.
+    # Its baselines are saved to a scratch file, reset before every run, rather than next to the data
+    HealthAnalyzer(path)
+    with tempfile.TemporaryDirectory() as scratch:
+        analyzer = HealthAnalyzer(path, use_cache=False, baseline_path=Path(scratch) / 'baselines.json')
+        points = sum(len(series) for series in analyzer.metrics.values())
+
+        results = []
+        for phase, run in PHASES:
+            if phases and phase not in phases:
+                continue
+            times = _time_phase(run, path, analyzer, repeat)
+            results.append({
+                'days': days,
+                'phase': phase,
+                'points': points,
+                'file_bytes': path.stat().st_size,
+                'wall_s': min(times),
+                'wall_median_s': statistics.median(times),
+                'peak_bytes': _peak_memory(run, path, analyzer),
+            })
+    return results
+
+
+def compare(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[Dict]:
+    """Attach `baseline_s` and `ratio` to each result; returns the regressions"""
+    previous = {(r['days'], r['phase']): r for r in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result['days'], result['phase']))
+        if before is None or before['wall_s'] <= 0:
+            continue
+        result['baseline_s'] = before['wall_s']
+        result['ratio'] = result['wall_s'] / before['wall_s']
+        if result['ratio'] > 1 + tolerance and result['wall_s'] - before['wall_s'] > NOISE_FLOOR_S:
+            regressions.append(result)
+    return regressions
+
+
+def _format_table(results: List[Dict]) -> str:
+    lines = [f"{'days':>6} {'phase':18s} {'points':>10} {'wall ms':>10} {'median ms':>10} "
+             f"{'peak MB':>9} {'vs base':>8}"]
+    for r in results:
+        ratio = f"{r['ratio']:7.2f}x" if 'ratio' in r else ''
+        lines.append(f"{r['days']:>6} {r['phase']:18s} {r['points']:>10} {r['wall_s'] * 1000:>10.2f} "
+                     f"{r['wall_median_s'] * 1000:>10.2f} {r['peak_bytes'] / 1e6:>9.2f} {ratio:>8}")
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Benchmark HealthAnalyzer on synthetic exports')
+    parser.add_argument('--scales', default=','.join(map(str, DEFAULT_SCALES)),
+                        help='Comma-separated days of history per run (default: 1,30,365,1825)')
+    parser.add_argument('--phases', help='Comma-separated subset of phases to run')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per phase; the best counts')
+    parser.add_argument('--data-dir', default=str(Path(tempfile.gettempdir()) / 'health-bench'),
+                        help='Where generated exports are kept between runs')
+    parser.add_argument('--output', help='Write machine-readable results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against results saved earlier with --output')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown against the baseline before failing (default: 0.25)')
+    args = parser.parse_args(argv)
+
+    scales = [int(s) for s in args.scales.split(',') if s]
+    phases = args.phases.split(',') if args.phases else None
+    results = []
+    for days in scales:
+        print(f"Running {days}-day scale...", file=sys.stderr)
+        results.extend(run_scale(Path(args.data_dir), days, args.repeat, phases))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f)['results'], args.tolerance)
+
+    print(_format_table(results))
+    if args.output:
+        report = {
+            'meta': {
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': platform.python_version(),
+                'numpy': np.__version__ if np is not None else None,
+                'platform': platform.platform(),
+                'repeat': args.repeat,
+                'seed': SEED,
+            },
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:", file=sys.stderr)
+        for r in regressions:
+            print(f"  {r['days']}d {r['phase']}: {r['wall_s'] * 1000:.2f} ms "
+                  f"vs {r['baseline_s'] * 1000:.2f} ms ({r['ratio']:.2f}x)", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
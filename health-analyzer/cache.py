@@ -0,0 +1,264 @@
+"""
+Binary parse cache for Health Auto Export files.
+
+Parsed metric columns are written next to the source as `<name>.cache`:
+
+    magic (8 bytes) | header length (uint32 LE) | JSON header | padding
+    | column data (8-byte aligned) | workouts JSON
+
+Offsets in the header are relative to the start of the column data.
+
+The header records the source's resolved path, size, mtime and SHA-256, plus
+where each metric's columns live in the file. A warm load checks path, size
+and mtime with a single stat() and memory-maps the columns, so no JSON is
+parsed at all; if only the mtime moved, the content hash decides.
+"""
+
+import hashlib
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import profiling
+from loader import read_export_stream
+from series import COLUMNS, MetricSeries, column_buffer, column_from_buffer
+
+MAGIC = b'HACACHE1'
+FORMAT_VERSION = 3
+SUFFIX = '.cache'
+_ALIGN = 8
+
+
+def cache_path(source: Path) -> Path:
+    return source.with_name(source.name + SUFFIX)
+
+
+def invalidate(source) -> bool:
+    """Delete the cache for `source`, returning whether one existed"""
+    try:
+        cache_path(Path(source)).unlink()
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _HashingReader(io.RawIOBase):
+    """Raw binary reader that hashes everything read through it"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.digest = hashlib.sha256()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        n = self.raw.readinto(buffer)
+        if n:
+            self.digest.update(memoryview(buffer)[:n])
+        return n
+
+    def finish(self) -> str:
+        """Hash whatever the parser left unread and return the hex digest"""
+        for chunk in iter(lambda: self.raw.read(1 << 20), b''):
+            self.digest.update(chunk)
+        return self.digest.hexdigest()
+
+
+def _covers(cached: Optional[List[str]], wanted: Optional[Iterable[str]]) -> bool:
+    if cached is None:
+        return True
+    return wanted is not None and set(wanted) <= set(cached)
+
+
+def _data_start(header_end: int) -> int:
+    """Column data starts at the first aligned offset after the header"""
+    return header_end + -header_end % _ALIGN
+
+
+def _read_header(path: Path) -> Optional[Tuple[dict, int]]:
+    """(header, byte offset of the data section), or None if unreadable"""
+    try:
+        with open(path, 'rb') as f:
+            prefix = f.read(len(MAGIC) + 4)
+            if len(prefix) < len(MAGIC) + 4 or prefix[:len(MAGIC)] != MAGIC:
+                return None
+            (length,) = struct.unpack('<I', prefix[len(MAGIC):])
+            return json.loads(f.read(length)), _data_start(len(MAGIC) + 4 + length)
+    except (OSError, ValueError):
+        return None
+
+
+def _source_matches(header: dict, source: Path, stat: os.stat_result) -> Optional[str]:
+    """'fresh' if the stat key matches, 'touched' if only the content hash does, else None"""
+    key = header.get('source', {})
+    if (header.get('version') != FORMAT_VERSION or header.get('byteorder') != sys.byteorder
+            or key.get('path') != str(source.resolve()) or key.get('size') != stat.st_size):
+        return None
+    if key.get('mtime_ns') == stat.st_mtime_ns:
+        return 'fresh'
+    # Touched but possibly unchanged (e.g. re-synced with identical content)
+    if key.get('sha256') == file_digest(source):
+        return 'touched'
+    return None
+
+
+def load(source, metrics: Optional[Iterable[str]] = None,
+         workouts: bool = True) -> Optional[Tuple[Dict[str, MetricSeries], List[Dict]]]:
+    """Memory-map cached series for `source`, or None if the cache is missing or stale"""
+    source = Path(source)
+    found = _read_header(cache_path(source))
+    if found is None:
+        return None
+    header, data_start = found
+    try:
+        stat = source.stat()
+    except OSError:
+        return None
+    state = _source_matches(header, source, stat)
+    if state is None:
+        return None
+    if not _covers(header['metrics_loaded'], metrics) or (workouts and not header['workouts_loaded']):
+        return None
+    if state == 'fresh':
+        return _load_mapped(source, header, data_start, metrics, workouts)
+
+    # Re-key the cache on the new mtime so later runs skip the hash
+    series, workout_list = _load_mapped(source, header, data_start, None, header['workouts_loaded'])
+    save(source, series, workout_list, header['metrics_loaded'], header['workouts_loaded'],
+         header['source']['sha256'], stat)
+    if metrics is not None:
+        series = {name: s for name, s in series.items() if name in set(metrics)}
+    return series, (workout_list if workouts else [])
+
+
+def _load_mapped(source: Path, header: dict, data_start: int, metrics: Optional[Iterable[str]],
+                 workouts: bool) -> Tuple[Dict[str, MetricSeries], List[Dict]]:
+    """Build series over a memory map of an already validated cache file"""
+    with open(cache_path(source), 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    wanted = set(metrics) if metrics is not None else None
+    series: Dict[str, MetricSeries] = {}
+    for entry in header['metrics']:
+        if wanted is not None and entry['name'] not in wanted:
+            continue
+        columns = {
+            name: column_from_buffer(mm, typecode, entry['count'], data_start + entry['columns'][name])
+            for name, typecode in COLUMNS
+        }
+        series[entry['name']] = MetricSeries(entry['units'], sources=entry['sources'], **columns)
+
+    workout_list: List[Dict] = []
+    if workouts:
+        start, length = header['workouts']
+        workout_list = json.loads(mm[data_start + start:data_start + start + length])
+    return series, workout_list
+
+
+def save(source, series: Dict[str, MetricSeries], workout_list: List[Dict],
+         metrics_loaded: Optional[Iterable[str]], workouts_loaded: bool,
+         digest: str, stat: os.stat_result):
+    """Write the cache atomically; failures are ignored since the cache is optional"""
+    source = Path(source)
+    target = cache_path(source)
+    entries = []
+    blobs = []
+    position = 0
+    for name, metric in series.items():
+        entry = {'name': name, 'units': metric.units, 'sources': metric.sources,
+                 'count': len(metric), 'columns': {}}
+        for column, _ in COLUMNS:
+            buffer = column_buffer(getattr(metric, column))
+            entry['columns'][column] = position
+            blobs.append(buffer)
+            position += len(buffer)
+            padding = -position % _ALIGN
+            if padding:
+                blobs.append(b'\0' * padding)
+                position += padding
+        entries.append(entry)
+    workouts_blob = json.dumps(workout_list).encode('utf-8')
+
+    header = {
+        'version': FORMAT_VERSION,
+        'byteorder': sys.byteorder,
+        'source': {'path': str(source.resolve()), 'size': stat.st_size,
+                   'mtime_ns': stat.st_mtime_ns, 'sha256': digest},
+        'metrics_loaded': sorted(metrics_loaded) if metrics_loaded is not None else None,
+        'workouts_loaded': workouts_loaded,
+        'metrics': entries,
+        'workouts': [position, len(workouts_blob)],
+    }
+    encoded = json.dumps(header).encode('utf-8')
+    header_end = len(MAGIC) + 4 + len(encoded)
+
+    tmp = target.with_name(target.name + f'.{os.getpid()}.tmp')
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<I', len(encoded)))
+            f.write(encoded)
+            f.write(b'\0' * (_data_start(header_end) - header_end))
+            for blob in blobs:
+                f.write(blob)
+            f.write(workouts_blob)
+        os.replace(tmp, target)
+    except OSError:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+
+
+def read_export_cached(source, metrics: Optional[Iterable[str]] = None,
+                       workouts: bool = True) -> Tuple[Dict[str, MetricSeries], List[Dict]]:
+    """read_export with a warm path through the on-disk cache.
+
+    On a miss the export is streamed once (hashing it on the way) and the cache
+    is rewritten covering both this request and whatever it held before, so
+    alternating --metric runs converge on a single cache file.
+    """
+    source = Path(source)
+    with profiling.phase('cache'):
+        hit = load(source, metrics, workouts)
+    if hit is not None:
+        return hit
+
+    previous = _read_header(cache_path(source))
+    load_metrics = set(metrics) if metrics is not None else None
+    load_workouts = workouts
+    if previous is not None and previous[0].get('version') == FORMAT_VERSION:
+        cached = previous[0].get('metrics_loaded')
+        load_metrics = None if cached is None or load_metrics is None else load_metrics | set(cached)
+        load_workouts = workouts or bool(previous[0].get('workouts_loaded'))
+
+    before = source.stat()
+    with open(source, 'rb', buffering=0) as raw:
+        hashing = _HashingReader(raw)
+        text = io.TextIOWrapper(io.BufferedReader(hashing), encoding='utf-8')
+        series, workout_list = read_export_stream(text, load_metrics, load_workouts)
+        digest = hashing.finish()
+    after = source.stat()
+
+    # Skip caching if the file changed underneath us
+    if (before.st_size, before.st_mtime_ns) == (after.st_size, after.st_mtime_ns):
+        with profiling.phase('cache_write'):
+            save(source, series, workout_list, load_metrics, load_workouts, digest, after)
+
+    if metrics is not None:
+        series = {name: s for name, s in series.items() if name in set(metrics)}
+    return series, (workout_list if workouts else [])
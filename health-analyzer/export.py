@@ -0,0 +1,332 @@
+"""
+Columnar export of normalized metrics and workouts.
+
+Other tools can read the parsed series directly instead of re-parsing the
+Health Auto Export JSON. With pyarrow installed, points are written as Parquet
+(or Arrow IPC) files in a Hive-style layout, optionally partitioned by metric
+and by local month:
+
+  OUT/points/metric=heart_rate/month=2026-10/part-0.parquet
+  OUT/workouts/month=2026-10/part-0.parquet
+
+so readers such as pyarrow.dataset or DuckDB only open the partitions a query
+touches. Point files hold ts (UTC, seconds), utc_offset (seconds), qty and
+source, plus a metric column when metric is not a partition key; each metric
+and month is one row group. The units of every metric are in the schema
+metadata under 'units'.
+
+Without pyarrow the export is a single SQLite database. Its points table is
+clustered on (metric, month, ts, source), so reading one metric or month is a
+range scan, and a `partitions` table lists each (metric, month) with its
+point count and time range. The export is built under a temporary name and
+renamed into place when complete.
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+import query
+import workout_stats
+from series import COLUMNS, SECONDS_PER_DAY, MetricSeries, day_string, np, parse_timestamp
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+FORMATS = ('parquet', 'arrow', 'sqlite')
+PARTITION_KEYS = ('metric', 'month')
+EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+SQLITE_SCHEMA = """
+CREATE TABLE metrics (
+    id     INTEGER PRIMARY KEY,
+    name   TEXT NOT NULL UNIQUE,
+    units  TEXT NOT NULL
+);
+CREATE TABLE sources (
+    id    INTEGER PRIMARY KEY,
+    name  TEXT NOT NULL UNIQUE
+);
+CREATE TABLE points (
+    metric_id   INTEGER NOT NULL,
+    month       TEXT NOT NULL,
+    ts          INTEGER NOT NULL,
+    source_id   INTEGER NOT NULL,
+    utc_offset  INTEGER NOT NULL,
+    qty         REAL NOT NULL,
+    PRIMARY KEY (metric_id, month, ts, source_id)
+) WITHOUT ROWID;
+CREATE TABLE partitions (
+    metric_id  INTEGER NOT NULL,
+    month      TEXT NOT NULL,
+    points     INTEGER NOT NULL,
+    first_ts   INTEGER NOT NULL,
+    last_ts    INTEGER NOT NULL,
+    PRIMARY KEY (metric_id, month)
+) WITHOUT ROWID;
+CREATE TABLE workouts (
+    month       TEXT NOT NULL,
+    start_ts    INTEGER NOT NULL,
+    end_ts      INTEGER,
+    utc_offset  INTEGER NOT NULL,
+    name        TEXT NOT NULL,
+    kcal        REAL,
+    body        TEXT NOT NULL,
+    PRIMARY KEY (month, start_ts, name)
+) WITHOUT ROWID;
+CREATE VIEW points_named AS
+    SELECT m.name AS metric, p.month, p.ts, p.utc_offset, p.qty, s.name AS source, m.units
+    FROM points p JOIN metrics m ON m.id = p.metric_id JOIN sources s ON s.id = p.source_id;
+"""
+
+
+def default_format() -> str:
+    return 'parquet' if pa is not None else 'sqlite'
+
+
+def month_ranges(series: MetricSeries) -> Dict[int, List[Tuple[int, int]]]:
+    """Index ranges [lo, hi) of the points in each local month, in time order.
+
+    Points are sorted by UTC time, so a month is one range unless UTC offset
+    changes reorder points around a month boundary.
+    """
+    if len(series) == 0:
+        return {}
+    if np is not None:
+        ids = query.bucket_ids(series.ts + series.offset, 'month')
+        bounds = (np.flatnonzero(ids[1:] != ids[:-1]) + 1).tolist()
+        ids = ids.tolist()
+    else:
+        ids = query.bucket_ids([t + o for t, o in zip(series.ts, series.offset)], 'month')
+        bounds = [i for i in range(1, len(ids)) if ids[i] != ids[i - 1]]
+    ranges: Dict[int, List[Tuple[int, int]]] = {}
+    for lo, hi in zip([0] + bounds, bounds + [len(ids)]):
+        ranges.setdefault(ids[lo], []).append((lo, hi))
+    return ranges
+
+
+def _take(series: MetricSeries, ranges: List[Tuple[int, int]]) -> MetricSeries:
+    """The points in `ranges` as one series, without copying a single range"""
+    if len(ranges) == 1:
+        lo, hi = ranges[0]
+        return MetricSeries(series.units, series.ts[lo:hi], series.offset[lo:hi], series.qty[lo:hi],
+                            series.source[lo:hi], series.sources)
+    columns = []
+    for name, typecode in COLUMNS:
+        column = getattr(series, name)
+        if np is not None:
+            columns.append(np.concatenate([column[lo:hi] for lo, hi in ranges]))
+        else:
+            part = array(typecode)
+            for lo, hi in ranges:
+                part.extend(column[lo:hi])
+            columns.append(part)
+    return MetricSeries(series.units, *columns, series.sources)
+
+
+def _chunks(series: MetricSeries, by_month: bool):
+    """(month label or None, points) per partition of one metric"""
+    if not by_month:
+        yield None, series
+        return
+    for month, ranges in sorted(month_ranges(series).items()):
+        yield query.bucket_label('month', month), _take(series, ranges)
+
+
+def _workout_rows(workouts: Sequence[Dict]) -> List[Tuple]:
+    """(month, start, end, utc_offset, name, kcal, body) per workout with a readable start"""
+    rows = []
+    for workout in workouts:
+        try:
+            start, offset = parse_timestamp(workout['start'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        interval = workout_stats.workout_interval(workout)
+        rows.append((day_string((start + offset) // SECONDS_PER_DAY)[:7], start,
+                     interval[1] if interval is not None else None, offset, workout.get('name', ''),
+                     workout_stats.workout_energy(workout), json.dumps(workout)))
+    rows.sort(key=lambda row: row[1])
+    return rows
+
+
+def _column(values):
+    """A series column in a form pyarrow converts without a Python-level loop where possible"""
+    return values if np is not None else list(values)
+
+
+class _ArrowSink:
+    """Parquet or Arrow IPC files under a Hive-style directory tree, one writer per file"""
+
+    def __init__(self, root: Path, fmt: str):
+        self.root = root
+        self.fmt = fmt
+        self.writers: Dict[Path, object] = {}
+        self.files = 0
+
+    def path(self, table: str, keys: Sequence[Tuple[str, str]]) -> Path:
+        if not keys:
+            return self.root / (table + EXTENSIONS[self.fmt])
+        directory = self.root / table
+        for key, value in keys:
+            directory /= f'{key}={quote(value, safe="")}'
+        return directory / ('part-0' + EXTENSIONS[self.fmt])
+
+    def write(self, table: str, keys: Sequence[Tuple[str, str]], data):
+        path = self.path(table, keys)
+        writer = self.writers.get(path)
+        if writer is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if self.fmt == 'parquet':
+                writer = pq.ParquetWriter(str(path), data.schema, compression='zstd')
+            else:
+                writer = pa.ipc.new_file(str(path), data.schema)
+            self.writers[path] = writer
+            self.files += 1
+        writer.write_table(data)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+
+def _export_arrow(root: Path, fmt: str, metrics: Dict[str, MetricSeries], workout_rows: List[Tuple],
+                  partition: Sequence[str]) -> int:
+    by_metric, by_month = 'metric' in partition, 'month' in partition
+    fields = [] if by_metric else [('metric', pa.string())]
+    fields += [('ts', pa.timestamp('s', tz='UTC')), ('utc_offset', pa.int32()),
+               ('qty', pa.float64()), ('source', pa.string())]
+    units = {name: series.units for name, series in metrics.items()}
+    schema = pa.schema(fields, metadata={'units': json.dumps(units)})
+
+    root.mkdir(parents=True)
+    sink = _ArrowSink(root, fmt)
+    try:
+        for name, series in sorted(metrics.items()):
+            for month, chunk in _chunks(series, by_month):
+                sources = pa.array(chunk.sources, pa.string())
+                columns = [] if by_metric else [pa.repeat(pa.scalar(name, pa.string()), len(chunk))]
+                columns += [pa.array(_column(chunk.ts), pa.int64()).cast(pa.timestamp('s', tz='UTC')),
+                            pa.array(_column(chunk.offset), pa.int32()),
+                            pa.array(_column(chunk.qty), pa.float64()),
+                            pa.DictionaryArray.from_arrays(pa.array(_column(chunk.source), pa.int32()),
+                                                           sources).dictionary_decode()]
+                keys = ([('metric', name)] if by_metric else []) + ([('month', month)] if by_month else [])
+                sink.write('points', keys, pa.Table.from_arrays(columns, schema=schema))
+            if by_metric:
+                # Every file of this metric is complete; keep open handles to one metric's months
+                sink.close()
+
+        if workout_rows:
+            workout_schema = pa.schema([('start', pa.timestamp('s', tz='UTC')), ('end', pa.timestamp('s', tz='UTC')),
+                                        ('utc_offset', pa.int32()), ('name', pa.string()),
+                                        ('kcal', pa.float64()), ('body', pa.string())])
+            groups: Dict[Optional[str], List[Tuple]] = {}
+            for row in workout_rows:
+                groups.setdefault(row[0] if by_month else None, []).append(row)
+            for month, group in sorted(groups.items(), key=lambda item: item[0] or ''):
+                data = pa.Table.from_arrays([pa.array([row[i] for row in group], field.type)
+                                             for i, field in enumerate(workout_schema, 1)], schema=workout_schema)
+                sink.write('workouts', [('month', month)] if by_month else [], data)
+    finally:
+        sink.close()
+    return sink.files
+
+
+def _export_sqlite(path: Path, metrics: Dict[str, MetricSeries], workout_rows: List[Tuple]) -> int:
+    conn = sqlite3.connect(str(path))
+    try:
+        # A fresh file renamed into place once complete: no journal needed
+        conn.execute('PRAGMA journal_mode=OFF')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.executescript(SQLITE_SCHEMA)
+        source_ids: Dict[str, int] = {}
+        partitions = 0
+        with conn:
+            for name, series in sorted(metrics.items()):
+                metric_id = conn.execute('INSERT INTO metrics (name, units) VALUES (?, ?)',
+                                         (name, series.units)).lastrowid
+                for source in series.sources:
+                    if source not in source_ids:
+                        source_ids[source] = conn.execute('INSERT INTO sources (name) VALUES (?)',
+                                                          (source,)).lastrowid
+                ids = [source_ids[source] for source in series.sources]
+                for month, chunk in _chunks(series, by_month=True):
+                    ts, offset, qty, source = chunk.ts, chunk.offset, chunk.qty, chunk.source
+                    if np is not None:
+                        ts, offset, qty, source = ts.tolist(), offset.tolist(), qty.tolist(), source.tolist()
+                    conn.executemany(
+                        'INSERT OR IGNORE INTO points (metric_id, month, ts, source_id, utc_offset, qty) '
+                        'VALUES (?, ?, ?, ?, ?, ?)',
+                        ((metric_id, month, t, ids[s], o, q) for t, o, q, s in zip(ts, offset, qty, source)))
+                    conn.execute('INSERT INTO partitions SELECT metric_id, month, COUNT(*), MIN(ts), MAX(ts) '
+                                 'FROM points WHERE metric_id = ? AND month = ?', (metric_id, month))
+                    partitions += 1
+            conn.executemany('INSERT OR IGNORE INTO workouts VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             workout_rows)
+        conn.execute('ANALYZE')
+        return partitions
+    finally:
+        conn.close()
+
+
+def _remove(path: Path):
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path)
+    elif path.exists() or path.is_symlink():
+        path.unlink()
+
+
+def export(metrics: Dict[str, MetricSeries], workouts: Sequence[Dict], out, fmt: Optional[str] = None,
+           partition: Sequence[str] = PARTITION_KEYS, overwrite: bool = False) -> Dict[str, int]:
+    """Write metrics and workouts to `out`.
+
+    Args:
+        metrics: Series to export, by metric name
+        workouts: Workout dicts as loaded from the export
+        out: Output directory (parquet, arrow) or database file (sqlite)
+        fmt: One of FORMATS (default: parquet with pyarrow, else sqlite)
+        partition: Any of PARTITION_KEYS for parquet and arrow; SQLite is
+            always clustered by metric and month
+        overwrite: Replace `out` if it exists
+
+    Returns:
+        {'points': ..., 'workouts': ..., 'partitions': ...}; partitions counts
+        files for parquet/arrow and (metric, month) ranges for sqlite
+    """
+    fmt = fmt or default_format()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; choose from {', '.join(FORMATS)}")
+    if fmt != 'sqlite' and pa is None:
+        raise RuntimeError(f"{fmt} export needs pyarrow (pip install pyarrow); use --format sqlite")
+    unknown = [key for key in partition if key not in PARTITION_KEYS]
+    if unknown:
+        raise ValueError(f"Unknown partition key {unknown[0]!r}; choose from {', '.join(PARTITION_KEYS)}")
+    out = Path(out)
+    if (out.exists() or out.is_symlink()) and not overwrite:
+        raise FileExistsError(f"{out} already exists (use --overwrite to replace it)")
+
+    metrics = {name: series for name, series in metrics.items() if len(series)}
+    workout_rows = _workout_rows(workouts)
+    tmp = out.with_name(out.name + f'.{os.getpid()}.tmp')
+    _remove(tmp)
+    try:
+        if fmt == 'sqlite':
+            partitions = _export_sqlite(tmp, metrics, workout_rows)
+        else:
+            partitions = _export_arrow(tmp, fmt, metrics, workout_rows, partition)
+        _remove(out)
+        os.replace(tmp, out)
+    except BaseException:
+        _remove(tmp)
+        raise
+    return {'points': sum(len(series) for series in metrics.values()),
+            'workouts': len(workout_rows), 'partitions': partitions}
@@ -0,0 +1,320 @@
+"""
+Streaming reader for Health Auto Export JSON files.
+
+The export is walked incrementally in fixed-size chunks: metric points are
+decoded one at a time straight into column builders, and metrics nobody asked
+for are stepped over element by element without ever being kept. Workouts are
+read one at a time as well, their route and heart-rate arrays element by
+element. Peak memory is the chunk buffer plus the columns of the requested
+metrics and the decoded workouts, independent of the file size.
+"""
+
+import json
+import re
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import profiling
+from series import MetricSeries, SeriesBuilder, parse_timestamp
+
+CHUNK_SIZE = 1 << 16
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# Characters that can continue a number cut off at a chunk boundary
+_NUMBER_TAIL = frozenset('0123456789.eE+-')
+_decoder = json.JSONDecoder()
+
+
+class JSONStream:
+    """Pull-style tokenizer over a text file object, reading it chunk by chunk"""
+
+    def __init__(self, fp, chunk_size: int = CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        """Append the next chunk, discarding the consumed prefix. False at EOF."""
+        if self.eof:
+            return False
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character, or '' at end of input"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Malformed JSON: expected {char!r}, found {found or 'end of file'!r}")
+        self.pos += 1
+
+    def read_value(self) -> Any:
+        """Decode the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number cut off at the buffer edge may continue in the next chunk
+            if (end == len(self.buf) or self.buf[end] in _NUMBER_TAIL) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def iter_values(self) -> Iterable[Any]:
+        """Decode the elements of an array one at a time.
+
+        Elements that fit in the current buffer are decoded in a tight loop;
+        anything straddling a chunk boundary goes through read_value/peek.
+        """
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        decode = _decoder.raw_decode
+        skip_ws = _WHITESPACE.match
+        while True:
+            buf = self.buf
+            try:
+                value, end = decode(buf, self.pos)
+            except json.JSONDecodeError:
+                value, end = None, len(buf)
+            if end >= len(buf) or buf[end] in _NUMBER_TAIL:
+                # The element may straddle the chunk boundary
+                value = self.read_value()
+                separator = self.peek()
+            else:
+                self.pos = skip_ws(buf, end).end()
+                separator = buf[self.pos] if self.pos < len(buf) else self.peek()
+            yield value
+            if separator == ',':
+                self.pos += 1
+                self.peek()
+                continue
+            self.expect(']')
+            return
+
+    def skip_value(self):
+        """Advance past the next JSON value, holding at most one array element at a time"""
+        char = self.peek()
+        if char == '[':
+            for _ in self.iter_values():
+                pass
+        elif char == '{':
+            for _ in self.iter_object():
+                self.skip_value()
+        else:
+            self.read_value()
+
+    def iter_object(self) -> Iterable[str]:
+        """Yield the keys of an object; the caller must consume each value"""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            return
+
+    def iter_array(self) -> Iterable[None]:
+        """Yield once per array element; the caller must consume each element"""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield None
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect(']')
+            return
+
+
+SLEEP_METRIC = 'sleep_analysis'
+
+# Stage values that count as asleep in per-segment sleep exports
+ASLEEP_STAGES = {'asleep', 'core', 'deep', 'rem',
+                 'asleepcore', 'asleepdeep', 'asleeprem', 'asleepunspecified'}
+
+
+def _normalize_sleep(point: Dict[str, Any]) -> Tuple[int, int, float, str]:
+    """Sleep records are stored at the time they end, with qty = hours asleep.
+
+    Per-segment exports carry startDate/endDate/value (stage); aggregated
+    exports carry one record per night with sleepStart/sleepEnd and totals.
+    """
+    if 'startDate' in point and 'endDate' in point:
+        stage = str(point.get('value', '')).replace(' ', '').lower()
+        if stage not in ASLEEP_STAGES:
+            raise ValueError(f"Not an asleep segment: {stage}")
+        start, _ = parse_timestamp(point['startDate'])
+        end, offset = parse_timestamp(point['endDate'])
+        hours = (end - start) / 3600
+    else:
+        end, offset = parse_timestamp(point.get('sleepEnd') or point['date'])
+        hours = (point.get('totalSleep') or point.get('asleep')
+                 or sum(point.get(stage, 0) for stage in ('core', 'deep', 'rem')))
+    return end, offset, float(hours), point.get('source', 'Unknown')
+
+
+def normalize_point(point: Dict[str, Any], metric: str = '') -> Tuple[int, int, float, str]:
+    """Convert a raw export point into (ts, offset, qty, source); raises on bad points"""
+    if metric == SLEEP_METRIC:
+        return _normalize_sleep(point)
+    ts, offset = parse_timestamp(point['date'])
+    # Heart rate is exported as Min/Avg/Max rather than qty
+    qty = point['qty'] if 'qty' in point else point['Avg']
+    return ts, offset, float(qty), point.get('source', 'Unknown')
+
+
+def _read_points(stream: JSONStream, builder: SeriesBuilder, metric: Optional[str],
+                 floor: Optional[int] = None):
+    if profiling.ACTIVE is not None:
+        _read_points_profiled(stream, builder, metric, floor, profiling.ACTIVE)
+        return
+    for point in stream.iter_values():
+        try:
+            ts, offset, qty, source = normalize_point(point, metric)
+        except (ValueError, KeyError, TypeError):
+            continue
+        if floor is None or ts >= floor:
+            builder.append(ts, offset, qty, source)
+
+
+def _read_points_profiled(stream: JSONStream, builder: SeriesBuilder, metric: Optional[str],
+                          floor: Optional[int], profiler: 'profiling.Profiler'):
+    """_read_points in batches, so normalizing and appending are timed apart from decoding"""
+    values = stream.iter_values()
+    while True:
+        batch = list(islice(values, profiling.BATCH))
+        profiler.enter('normalize')
+        points = []
+        for point in batch:
+            try:
+                points.append(normalize_point(point, metric))
+            except (ValueError, KeyError, TypeError):
+                continue
+        profiler.exit()
+        profiler.enter('columns')
+        for ts, offset, qty, source in points:
+            if floor is None or ts >= floor:
+                builder.append(ts, offset, qty, source)
+        profiler.exit()
+        if len(batch) < profiling.BATCH:
+            return
+
+
+def _read_metric(stream: JSONStream, wanted: Optional[Set[str]],
+                 since: Dict[str, int]) -> Tuple[Optional[str], Optional[MetricSeries]]:
+    name = None
+    units = ''
+    builder = None
+    for key in stream.iter_object():
+        if key == 'name':
+            name = stream.read_value()
+        elif key == 'units':
+            units = stream.read_value()
+        elif key == 'data':
+            if name is not None and wanted is not None and name not in wanted:
+                stream.skip_value()
+            else:
+                builder = SeriesBuilder(units)
+                _read_points(stream, builder, name, since.get(name))
+        else:
+            stream.skip_value()
+
+    if name is None or builder is None or (wanted is not None and name not in wanted):
+        return name, None
+    builder.units = units
+    with profiling.phase('columns'):
+        return name, builder.build()
+
+
+def _read_workout(stream: JSONStream) -> Any:
+    """One workout, with its array fields (route, heart-rate samples) decoded element by element"""
+    if stream.peek() != '{':
+        return stream.read_value()
+    workout = {}
+    for key in stream.iter_object():
+        workout[key] = list(stream.iter_values()) if stream.peek() == '[' else stream.read_value()
+    return workout
+
+
+def _read_workouts(stream: JSONStream) -> Any:
+    """The workouts array, decoded one workout at a time rather than as one value"""
+    if stream.peek() != '[':
+        return stream.read_value()
+    workout_list = []
+    for _ in stream.iter_array():
+        workout_list.append(_read_workout(stream))
+    return workout_list
+
+
+def read_export_stream(fp, metrics: Optional[Iterable[str]] = None, workouts: bool = True,
+                       since: Optional[Dict[str, int]] = None) -> Tuple[Dict[str, MetricSeries], List[Dict]]:
+    """Stream an export from a text file object into columnar series.
+
+    Args:
+        fp: Text file object positioned at the start of the export
+        metrics: Metric names to materialize (None for all)
+        workouts: Whether to decode the workouts list
+        since: Per-metric epoch second; earlier points of that metric are dropped
+
+    Returns:
+        (series by metric name, workouts)
+    """
+    wanted = set(metrics) if metrics is not None else None
+    since = since or {}
+    series: Dict[str, MetricSeries] = {}
+    workout_list: List[Dict] = []
+    profiler = profiling.ACTIVE
+    stream = JSONStream(fp if profiler is None else profiling.TimedReader(fp, profiler))
+
+    with profiling.phase('decode'):
+        for key in stream.iter_object():
+            if key != 'data':
+                stream.skip_value()
+                continue
+            for section in stream.iter_object():
+                if section == 'metrics':
+                    for _ in stream.iter_array():
+                        name, metric = _read_metric(stream, wanted, since)
+                        if metric is not None:
+                            series[name] = metric
+                elif section == 'workouts' and workouts:
+                    workout_list = _read_workouts(stream)
+                else:
+                    stream.skip_value()
+
+    return series, workout_list
+
+
+def read_export(path, metrics: Optional[Iterable[str]] = None, workouts: bool = True,
+                since: Optional[Dict[str, int]] = None) -> Tuple[Dict[str, MetricSeries], List[Dict]]:
+    """Stream an export file from disk; see read_export_stream"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return read_export_stream(f, metrics, workouts, since)
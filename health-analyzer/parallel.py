@@ -0,0 +1,95 @@
+"""
+Parallel loading of archived Health Auto Export files.
+
+Each file is parsed in a worker process. Workers ship back each metric as raw
+column bytes rather than lists of dicts, so pickling stays cheap. The parent
+merges the results in sorted file order, so the output does not depend on
+which worker finishes first.
+"""
+
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from loader import read_export
+from series import COLUMNS, MetricSeries, column_buffer, column_from_buffer, combine_series
+
+# One metric as shipped between processes: (units, sources, count, column bytes...)
+PackedSeries = Tuple[str, List[str], int, bytes, bytes, bytes, bytes]
+
+
+def is_multi(spec: str) -> bool:
+    """Whether `spec` names a directory or glob of exports rather than one file"""
+    return os.path.isdir(spec) or glob.has_magic(spec)
+
+
+def expand_paths(spec: str) -> List[Path]:
+    """Resolve a file, directory or glob to a sorted list of export files"""
+    if os.path.isdir(spec):
+        paths = Path(spec).glob('*.json')
+    elif glob.has_magic(spec):
+        paths = (Path(p) for p in glob.glob(spec))
+    else:
+        paths = [Path(spec)]
+    return sorted(p for p in paths if p.is_file())
+
+
+def pack(series: MetricSeries) -> PackedSeries:
+    return (series.units, series.sources, len(series),
+            *(bytes(column_buffer(getattr(series, name))) for name, _ in COLUMNS))
+
+
+def unpack(packed: PackedSeries) -> MetricSeries:
+    units, sources, count, *buffers = packed
+    columns = {name: column_from_buffer(buffer, typecode, count)
+               for (name, typecode), buffer in zip(COLUMNS, buffers)}
+    return MetricSeries(units, sources=sources, **columns)
+
+
+def _parse_packed(path: Path, metrics: Optional[List[str]],
+                  workouts: bool) -> Tuple[Dict[str, PackedSeries], List[Dict]]:
+    """Worker entry point: parse one export into packed columns"""
+    series, workout_list = read_export(path, metrics, workouts)
+    return {name: pack(s) for name, s in series.items()}, workout_list
+
+
+def iter_parsed(paths: List[Path], metrics: Optional[Iterable[str]] = None, workouts: bool = True,
+                workers: Optional[int] = None) -> Iterator[Tuple[Path, Dict[str, MetricSeries], List[Dict]]]:
+    """Parse exports across a process pool, yielding (path, series, workouts) in input order"""
+    metrics = list(metrics) if metrics is not None else None
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers <= 1:
+        for path in paths:
+            yield (path, *read_export(path, metrics, workouts))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(_parse_packed, paths, [metrics] * len(paths), [workouts] * len(paths))
+        for path, (packed, workout_list) in zip(paths, results):
+            yield path, {name: unpack(p) for name, p in packed.items()}, workout_list
+
+
+def read_exports(spec: str, metrics: Optional[Iterable[str]] = None, workouts: bool = True,
+                 workers: Optional[int] = None) -> Tuple[Dict[str, MetricSeries], List[Dict]]:
+    """Load and merge every export matched by a directory or glob.
+
+    Overlapping points are deduplicated on (timestamp, source), with later
+    files (in sorted path order) winning; workouts are deduplicated on
+    (start, name).
+    """
+    paths = expand_paths(spec)
+    if not paths:
+        raise FileNotFoundError(f"No health data files match: {spec}")
+
+    parts: Dict[str, List[MetricSeries]] = {}
+    merged_workouts: Dict[Tuple[str, str], Dict] = {}
+    for _, series, workout_list in iter_parsed(paths, metrics, workouts, workers):
+        for name, s in series.items():
+            parts.setdefault(name, []).append(s)
+        for workout in workout_list:
+            merged_workouts[(workout.get('start', ''), workout.get('name', ''))] = workout
+
+    series = {name: combine_series(p) for name, p in parts.items()}
+    return series, [merged_workouts[key] for key in sorted(merged_workouts)]
@@ -0,0 +1,205 @@
+"""
+Opt-in phase profiling for the analyzer (`analyze.py --profile`).
+
+Code marks phases with `with profiling.phase('rules'):`. Until start()
+installs a Profiler, phase() hands back one shared no-op context manager, and
+the loader's per-point loop is untouched: it checks once per metric whether a
+profiler is active, and only then takes an instrumented path that times JSON
+decoding, point normalization (timestamp parsing) and column building per
+batch of BATCH points.
+
+Phases nest, and are reported by path ('load/decode/normalize'). Each reports
+its self time, wall and CPU, excluding nested phases, so the self times add
+up to the profiled total. The process's peak RSS is always reported. On
+request the run is also traced with tracemalloc for the peak of Python
+allocations, which slows allocation-heavy phases such as JSON decoding
+several times over, and with cProfile, whose stats can be dumped for pstats.
+"""
+
+import cProfile
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import nullcontext
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Points decoded, normalized and appended per timed step of the loader
+BATCH = 1024
+
+ACTIVE: Optional['Profiler'] = None
+
+_DISABLED = nullcontext()
+
+
+class _Frame:
+    __slots__ = ('path', 'wall', 'cpu', 'child_wall', 'child_cpu')
+
+    def __init__(self, path: str):
+        self.path = path
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        self.child_wall = 0.0
+        self.child_cpu = 0.0
+
+
+class _Phase:
+    """Context manager timing one entry into a phase"""
+
+    __slots__ = ('profiler', 'name')
+
+    def __init__(self, profiler: 'Profiler', name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.enter(self.name)
+
+    def __exit__(self, *exc):
+        self.profiler.exit()
+
+
+class Profiler:
+    """Per-phase self times, point counts and optional memory/cProfile tracing"""
+
+    def __init__(self, trace_memory: bool = False, cprofile: bool = False):
+        self.trace_memory = trace_memory
+        self.cprofile = cProfile.Profile() if cprofile else None
+        # path -> [calls, self wall, self cpu], in first-entered order
+        self.phases: Dict[str, List] = {}
+        self.points: Dict[str, int] = {}
+        self.stack: List[_Frame] = []
+        self.wall = self.cpu = 0.0
+        self.peak_bytes: Optional[int] = None
+        self.max_rss_bytes: Optional[int] = None
+        self._started = None
+
+    def enter(self, name: str):
+        parent = self.stack[-1].path + '/' if self.stack else ''
+        frame = _Frame(parent + name)
+        # Registered on entry so phases are listed parent first
+        self.phases.setdefault(frame.path, [0, 0.0, 0.0])
+        self.stack.append(frame)
+
+    def exit(self):
+        frame = self.stack.pop()
+        wall = time.perf_counter() - frame.wall
+        cpu = time.process_time() - frame.cpu
+        entry = self.phases[frame.path]
+        entry[0] += 1
+        entry[1] += wall - frame.child_wall
+        entry[2] += cpu - frame.child_cpu
+        if self.stack:
+            self.stack[-1].child_wall += wall
+            self.stack[-1].child_cpu += cpu
+
+    def count_points(self, metrics: Dict):
+        """Record the loaded points per metric (a later load replaces earlier counts)"""
+        self.points = {name: len(series) for name, series in sorted(metrics.items())}
+
+    def start(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        self._started = _Frame('')
+        if self.cprofile is not None:
+            self.cprofile.enable()
+
+    def stop(self):
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        while self.stack:
+            self.exit()
+        self.wall = time.perf_counter() - self._started.wall
+        self.cpu = time.process_time() - self._started.cpu
+        if self.trace_memory:
+            self.peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if resource is not None:
+            # ru_maxrss is in kilobytes on Linux, bytes on macOS
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.max_rss_bytes = rss if sys.platform == 'darwin' else rss * 1024
+
+    def as_dict(self) -> Dict:
+        phases = [{'phase': path, 'calls': calls, 'wall_s': wall, 'cpu_s': cpu}
+                  for path, (calls, wall, cpu) in self.phases.items()]
+        other_wall = self.wall - sum(p['wall_s'] for p in phases)
+        other_cpu = self.cpu - sum(p['cpu_s'] for p in phases)
+        phases.append({'phase': 'other', 'calls': 1, 'wall_s': other_wall, 'cpu_s': other_cpu})
+        return {
+            'wall_s': self.wall,
+            'cpu_s': self.cpu,
+            'peak_bytes': self.peak_bytes,
+            'max_rss_bytes': self.max_rss_bytes,
+            'phases': phases,
+            'points': self.points,
+        }
+
+    def format_text(self) -> str:
+        report = self.as_dict()
+        lines = ["PROFILE", "=" * 60,
+                 f"  total {report['wall_s'] * 1000:.1f} ms wall, {report['cpu_s'] * 1000:.1f} ms CPU"
+                 + (f", max RSS {report['max_rss_bytes'] / 1e6:.1f} MB"
+                    if report['max_rss_bytes'] is not None else '')
+                 + (f", tracemalloc peak {report['peak_bytes'] / 1e6:.1f} MB"
+                    if report['peak_bytes'] is not None else ''),
+                 f"  {'phase (self time)':30s} {'calls':>6s} {'wall ms':>10s} {'cpu ms':>10s} {'share':>6s}"]
+        for p in report['phases']:
+            depth = p['phase'].count('/')
+            label = '  ' * depth + p['phase'].rsplit('/', 1)[-1]
+            share = p['wall_s'] / report['wall_s'] if report['wall_s'] else 0.0
+            lines.append(f"  {label:30s} {p['calls']:6d} {p['wall_s'] * 1000:10.2f} "
+                         f"{p['cpu_s'] * 1000:10.2f} {share:6.1%}")
+        if report['points']:
+            lines.append(f"  points: {sum(report['points'].values())}")
+            for name, count in report['points'].items():
+                lines.append(f"    {name:28s} {count:>10d}")
+        return '\n'.join(lines)
+
+    def format_json(self) -> str:
+        return json.dumps(self.as_dict(), indent=2)
+
+
+def phase(name: str):
+    """Context manager timing `name` under the active profiler; a shared no-op otherwise"""
+    if ACTIVE is None:
+        return _DISABLED
+    return _Phase(ACTIVE, name)
+
+
+def start(trace_memory: bool = False, cprofile: bool = False) -> Profiler:
+    """Install and start a profiler for the rest of the run"""
+    global ACTIVE
+    ACTIVE = Profiler(trace_memory, cprofile)
+    ACTIVE.start()
+    return ACTIVE
+
+
+def stop() -> Optional[Profiler]:
+    """Stop and uninstall the active profiler, returning it"""
+    global ACTIVE
+    profiler, ACTIVE = ACTIVE, None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+
+class TimedReader:
+    """File object wrapper that times each read() as an 'io' phase"""
+
+    __slots__ = ('fp', 'profiler')
+
+    def __init__(self, fp, profiler: Profiler):
+        self.fp = fp
+        self.profiler = profiler
+
+    def read(self, size: int = -1):
+        self.profiler.enter('io')
+        try:
+            return self.fp.read(size)
+        finally:
+            self.profiler.exit()
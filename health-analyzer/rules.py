@@ -0,0 +1,183 @@
+"""
+Declarative red-flag rules.
+
+Rules declare the inputs they need as (kind, metric, days) tuples and receive
+them already computed. The engine resolves every distinct input once, from
+the analyzer's shared daily rollups, and then evaluates all rules against
+them. Adding a rule therefore adds no extra scan of the data.
+
+    @rule('low_steps', ('daily_total', 'step_count', 7))
+    def low_steps(steps):
+        ...
+        return "⚠️  ..." or None
+"""
+
+import time
+from datetime import date
+from typing import Callable, Dict, List, Optional, Tuple
+
+# (kind, metric, days)
+Need = Tuple[str, str, int]
+
+# Sleep below this many hours counts as a short night
+SHORT_SLEEP_HOURS = 6.0
+# Standard deviations from the long-term baseline that count as a deviation
+BASELINE_Z = 2.5
+
+
+class Rule:
+    """A named check over pre-resolved inputs, returning a flag message or None"""
+
+    __slots__ = ('name', 'needs', 'check')
+
+    def __init__(self, name: str, needs: Tuple[Need, ...], check: Callable[..., Optional[str]]):
+        self.name = name
+        self.needs = needs
+        self.check = check
+
+
+RULES: List[Rule] = []
+
+# How each kind of input is computed from a HealthAnalyzer
+RESOLVERS: Dict[str, Callable] = {
+    'daily_average': lambda analyzer, metric, days: analyzer.daily_average(metric, days),
+    'daily_total': lambda analyzer, metric, days: analyzer.daily_total(metric, days),
+    'sleep_nights': lambda analyzer, metric, days: analyzer.sleep_nights(days),
+    'workouts': lambda analyzer, metric, days: analyzer.recent_workouts(days),
+    'baseline': lambda analyzer, metric, days: analyzer.baseline(metric, days),
+}
+
+
+def rule(name: str, *needs: Need):
+    """Register a rule function taking one argument per declared need"""
+    def register(check: Callable[..., Optional[str]]):
+        RULES.append(Rule(name, needs, check))
+        return check
+    return register
+
+
+def required_metrics(rules: Optional[List[Rule]] = None) -> List[str]:
+    """Metrics the given rules read, for loading only what they need"""
+    return sorted({metric for r in (rules or RULES) for _, metric, _ in r.needs if metric})
+
+
+def evaluate(analyzer, rules: Optional[List[Rule]] = None) -> Tuple[List[str], Dict[str, float]]:
+    """Evaluate rules against one analyzer.
+
+    Returns:
+        (flag messages in rule order, seconds spent per rule). Shared input
+        resolution is reported under '(inputs)'.
+    """
+    raised, timings = evaluate_by_rule(analyzer, rules)
+    return list(raised.values()), timings
+
+
+def evaluate_by_rule(analyzer, rules: Optional[List[Rule]] = None) -> Tuple[Dict[str, str], Dict[str, float]]:
+    """Like evaluate, but returns the raised flags keyed by rule name"""
+    rules = RULES if rules is None else rules
+    timings: Dict[str, float] = {}
+
+    started = time.perf_counter()
+    inputs: Dict[Need, object] = {}
+    for r in rules:
+        for need in r.needs:
+            if need not in inputs:
+                kind, metric, days = need
+                inputs[need] = RESOLVERS[kind](analyzer, metric, days)
+    timings['(inputs)'] = time.perf_counter() - started
+
+    raised: Dict[str, str] = {}
+    for r in rules:
+        started = time.perf_counter()
+        flag = r.check(*(inputs[need] for need in r.needs))
+        timings[r.name] = time.perf_counter() - started
+        if flag:
+            raised[r.name] = flag
+    return raised, timings
+
+
+@rule('resting_hr_elevated', ('daily_average', 'resting_heart_rate', 7))
+def resting_hr_elevated(rhr_data: Dict[str, float]) -> Optional[str]:
+    """Resting HR elevated >10 bpm for 3+ days"""
+    if len(rhr_data) < 3:
+        return None
+    values = list(rhr_data.values())
+    recent_avg = sum(values[-3:]) / 3
+    baseline = sum(values) / len(values)
+    if recent_avg > baseline + 10:
+        return f"⚠️  Resting HR elevated: {recent_avg:.1f} bpm (baseline {baseline:.1f})"
+    return None
+
+
+@rule('hrv_declining', ('daily_average', 'heart_rate_variability', 7))
+def hrv_declining(hrv_data: Dict[str, float]) -> Optional[str]:
+    """HRV declining trend over 5+ days"""
+    if len(hrv_data) < 5:
+        return None
+    values = list(hrv_data.values())
+    early_avg = sum(values[:3]) / 3
+    recent_avg = sum(values[-3:]) / 3
+    if recent_avg < early_avg * 0.85:  # 15% decline
+        return f"⚠️  HRV declining: {recent_avg:.1f} ms (was {early_avg:.1f})"
+    return None
+
+
+@rule('no_workouts', ('workouts', '', 7))
+def no_workouts(workouts: List[Dict]) -> Optional[str]:
+    """Zero workouts in last 7 days"""
+    if not workouts:
+        return "⚠️  No workouts recorded in last 7 days"
+    return None
+
+
+@rule('low_steps', ('daily_total', 'step_count', 7))
+def low_steps(steps_data: Dict[str, float]) -> Optional[str]:
+    """Step count <2000 for 3+ days"""
+    if len(steps_data) < 3:
+        return None
+    low_days = sum(1 for v in list(steps_data.values())[-7:] if v < 2000)
+    if low_days >= 3:
+        return f"⚠️  Low activity: {low_days} days with <2000 steps"
+    return None
+
+
+@rule('poor_sleep', ('sleep_nights', 'sleep_analysis', 7))
+def poor_sleep(nights: Dict[str, float]) -> Optional[str]:
+    """Poor sleep (<6h) for 3+ consecutive nights"""
+    streak = longest = 0
+    previous = None
+    for night, hours in nights.items():
+        day = date.fromisoformat(night).toordinal()
+        consecutive = previous is not None and day - previous == 1
+        previous = day
+        if hours < SHORT_SLEEP_HOURS:
+            streak = streak + 1 if consecutive else 1
+        else:
+            streak = 0
+        longest = max(longest, streak)
+    if longest >= 3:
+        return f"⚠️  Poor sleep: {longest} consecutive nights under {SHORT_SLEEP_HOURS:.0f}h"
+    return None
+
+
+def _baseline_rule(name: str, metric: str, direction: int, label: str, unit: str):
+    """Flag the latest complete day when it sits BASELINE_Z deviations past the
+    long-term baseline in `direction`, by both the EWMA and the median/MAD scores"""
+    @rule(name, ('baseline', metric, 2))
+    def check(current) -> Optional[str]:
+        if current is None or current.last_z is None:
+            return None
+        if direction * current.last_z < BASELINE_Z:
+            return None
+        if current.last_robust_z is not None and direction * current.last_robust_z < BASELINE_Z:
+            return None
+        return (f"⚠️  {label} {'above' if direction > 0 else 'below'} baseline: "
+                f"{current.last_value:.1f}{unit} vs {current.mean:.1f}{unit} typical "
+                f"({current.last_z:+.1f}σ over {current.days} days)")
+    check.__doc__ = f"{label} {BASELINE_Z}σ {'above' if direction > 0 else 'below'} its long-term baseline"
+    return check
+
+
+_baseline_rule('resting_hr_above_baseline', 'resting_heart_rate', +1, 'Resting HR', ' bpm')
+_baseline_rule('hrv_below_baseline', 'heart_rate_variability', -1, 'HRV', ' ms')
+_baseline_rule('steps_below_baseline', 'step_count', -1, 'Steps', '')
@@ -0,0 +1,355 @@
+"""
+Columnar metric storage shared by the health analyzer tools.
+
+Each metric is held as a MetricSeries of parallel, timestamp-sorted columns
+instead of a list of per-point dicts.
+"""
+
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+SECONDS_PER_DAY = 86400
+# Largest UTC offset in use (UTC+14), bounding how far a local day reaches back
+MAX_UTC_OFFSET = 14 * 3600
+
+# MetricSeries columns and their array typecodes
+COLUMNS = (('ts', 'q'), ('offset', 'i'), ('qty', 'd'), ('source', 'i'))
+
+
+class MetricSeries:
+    """Columnar storage for a single metric.
+
+    Points are kept as parallel columns sorted by timestamp:
+      ts      int64 epoch seconds (UTC)
+      offset  int32 UTC offset of the original timestamp, in seconds
+      qty     float64 measured value
+      source  int32 index into `sources` (interned source names)
+
+    Columns are NumPy arrays when NumPy is installed, `array.array` otherwise.
+    """
+
+    __slots__ = ('units', 'ts', 'offset', 'qty', 'source', 'sources')
+
+    def __init__(self, units: str, ts, offset, qty, source, sources: List[str]):
+        self.units = units
+        self.ts = ts
+        self.offset = offset
+        self.qty = qty
+        self.source = source
+        self.sources = sources
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def tail(self, start: int) -> 'MetricSeries':
+        """Series of points[start:], sharing the underlying buffers"""
+        return MetricSeries(self.units, self.ts[start:], self.offset[start:], self.qty[start:],
+                            self.source[start:], self.sources)
+
+    def local_days(self, start: int = 0):
+        """Day number (days since 1970-01-01) of each point in its own timezone"""
+        if np is not None:
+            return (self.ts[start:] + self.offset[start:]) // SECONDS_PER_DAY
+        return [(t + o) // SECONDS_PER_DAY for t, o in zip(self.ts[start:], self.offset[start:])]
+
+    def index_at(self, ts: int) -> int:
+        """Index of the first point at or after epoch second `ts` (binary search)"""
+        if np is not None:
+            return int(np.searchsorted(self.ts, ts, side='left'))
+        return bisect_left(self.ts, ts)
+
+    def daily_rollup(self, from_day: Optional[int] = None) -> 'DailyRollup':
+        """Per-day count/sum/min/max/last in one pass, over the whole series or
+        only the local days from `from_day` on (see DailyRollup.splice)"""
+        if from_day is not None:
+            start = self.index_at(from_day * SECONDS_PER_DAY - MAX_UTC_OFFSET)
+            rollup = self.tail(start).daily_rollup()
+            return rollup.rows_from(rollup.index_of(from_day))
+        if np is not None:
+            if len(self.ts) == 0:
+                return DailyRollup([], [], [], [], [], [])
+            days = self.local_days()
+            # Stable sort keeps points within a day in time order
+            order = np.argsort(days, kind='stable')
+            days, qty = days[order], self.qty[order]
+            starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+            ends = np.r_[starts[1:], len(days)]
+            return DailyRollup(days[starts].tolist(), (ends - starts).tolist(),
+                               np.add.reduceat(qty, starts).tolist(),
+                               np.minimum.reduceat(qty, starts).tolist(),
+                               np.maximum.reduceat(qty, starts).tolist(),
+                               qty[ends - 1].tolist())
+
+        by_day: Dict[int, List[float]] = {}
+        for day, value in zip(self.local_days(), self.qty):
+            acc = by_day.get(day)
+            if acc is None:
+                by_day[day] = [1, value, value, value, value]
+            else:
+                acc[0] += 1
+                acc[1] += value
+                if value < acc[2]:
+                    acc[2] = value
+                if value > acc[3]:
+                    acc[3] = value
+                acc[4] = value
+        days = sorted(by_day)
+        rows = [by_day[d] for d in days]
+        return DailyRollup(days, *(list(column) for column in zip(*rows))) if rows else \
+            DailyRollup([], [], [], [], [], [])
+
+
+class DailyRollup:
+    """Per-day aggregates of one metric, as parallel lists sorted by day.
+
+    `day` holds day numbers (days since 1970-01-01) in each point's own
+    timezone; `last` is the latest value recorded that day.
+    """
+
+    __slots__ = ('day', 'count', 'sum', 'min', 'max', 'last')
+
+    def __init__(self, day: List[int], count: List[int], sum: List[float],
+                 min: List[float], max: List[float], last: List[float]):
+        self.day = day
+        self.count = count
+        self.sum = sum
+        self.min = min
+        self.max = max
+        self.last = last
+
+    def __len__(self) -> int:
+        return len(self.day)
+
+    @property
+    def mean(self) -> List[float]:
+        return [s / c for s, c in zip(self.sum, self.count)]
+
+    def index_of(self, day: int) -> int:
+        """Index of the first row on or after `day`"""
+        return bisect_left(self.day, day)
+
+    def rows_from(self, start: int) -> 'DailyRollup':
+        return DailyRollup(*(getattr(self, name)[start:] for name in self.__slots__))
+
+    def splice(self, newer: 'DailyRollup') -> 'DailyRollup':
+        """This rollup with every day from the first day of `newer` on replaced by `newer`"""
+        if len(newer) == 0:
+            return self
+        end = self.index_of(newer.day[0])
+        return DailyRollup(*(getattr(self, name)[:end] + getattr(newer, name) for name in self.__slots__))
+
+
+def stitch_sessions(series: MetricSeries, max_gap: int) -> List[Tuple[int, int, int, float]]:
+    """Stitch interval points into sessions, e.g. sleep segments into nights.
+
+    Each point is an interval ending at `ts` and lasting `qty` hours. Intervals
+    separated by at most `max_gap` seconds join one session; overlapping
+    intervals (say, watch and phone both reporting) are counted once.
+
+    Returns:
+        (start ts, end ts, UTC offset at end, hours covered) per session
+    """
+    ts, offset, qty = series.ts, series.offset, series.qty
+    if np is not None:
+        ts, offset, qty = ts.tolist(), offset.tolist(), qty.tolist()
+    intervals = sorted((t - int(q * 3600), t, o) for t, o, q in zip(ts, offset, qty) if q > 0)
+    sessions: List[Tuple[int, int, int, float]] = []
+    for start, end, offset in intervals:
+        if sessions and start - sessions[-1][1] <= max_gap:
+            first, last, last_offset, hours = sessions[-1]
+            covered = max(0, end - max(start, last)) / 3600
+            if end > last:
+                last, last_offset = end, offset
+            sessions[-1] = (first, last, last_offset, hours + covered)
+        else:
+            sessions.append((start, end, offset, (end - start) / 3600))
+    return sessions
+
+
+def extend_series(series: MetricSeries, newer: MetricSeries) -> MetricSeries:
+    """Append `newer`, whose points all fall at or after the last point of `series`.
+
+    Points sharing the final timestamp are deduplicated as in combine_series,
+    so only that overlap is re-sorted rather than the whole history.
+    """
+    if len(series) == 0:
+        return newer
+    if len(newer) == 0:
+        return series
+    split = series.index_at(int(series.ts[len(series) - 1]))
+    # The tail shares `series.sources`, so existing source ids keep their numbering
+    overlap = combine_series([series.tail(split), newer])
+    columns = []
+    for name, typecode in COLUMNS:
+        head, rest = getattr(series, name)[:split], getattr(overlap, name)
+        if np is not None:
+            columns.append(np.concatenate([head, rest]))
+        else:
+            column = array(typecode, head)
+            column.extend(rest)
+            columns.append(column)
+    return MetricSeries(newer.units or series.units, *columns, overlap.sources)
+
+
+def column_buffer(column) -> memoryview:
+    """Raw bytes of a column, without copying where possible"""
+    if np is not None:
+        return memoryview(np.ascontiguousarray(column)).cast('B')
+    return memoryview(column).cast('B')
+
+
+def column_from_buffer(buffer, typecode: str, count: int, offset: int = 0):
+    """View `count` items of `typecode` in `buffer` starting at byte `offset`"""
+    if np is not None:
+        return np.frombuffer(buffer, dtype=np.dtype(typecode), count=count, offset=offset)
+    nbytes = count * array(typecode).itemsize
+    return memoryview(buffer)[offset:offset + nbytes].cast(typecode)
+
+
+class SeriesBuilder:
+    """Accumulates raw points for one metric and freezes them into a MetricSeries"""
+
+    def __init__(self, units: str):
+        self.units = units
+        self.ts = array('q')
+        self.offset = array('i')
+        self.qty = array('d')
+        self.source = array('i')
+        self.sources: List[str] = []
+        self._source_ids: Dict[str, int] = {}
+
+    def append(self, ts: int, offset: int, qty: float, source: str):
+        source_id = self._source_ids.get(source)
+        if source_id is None:
+            source_id = self._source_ids[source] = len(self.sources)
+            self.sources.append(source)
+        self.ts.append(ts)
+        self.offset.append(offset)
+        self.qty.append(qty)
+        self.source.append(source_id)
+
+    def build(self) -> MetricSeries:
+        ts, offset, qty, source = self.ts, self.offset, self.qty, self.source
+        if np is not None:
+            ts = np.frombuffer(ts, dtype=np.int64)
+            offset = np.frombuffer(offset, dtype=np.int32)
+            qty = np.frombuffer(qty, dtype=np.float64)
+            source = np.frombuffer(source, dtype=np.int32)
+            if len(ts) > 1 and not (ts[1:] >= ts[:-1]).all():
+                order = np.argsort(ts, kind='stable')
+                ts, offset, qty, source = ts[order], offset[order], qty[order], source[order]
+        elif any(ts[i] > ts[i + 1] for i in range(len(ts) - 1)):
+            order = sorted(range(len(ts)), key=ts.__getitem__)
+            ts = array('q', (ts[i] for i in order))
+            offset = array('i', (offset[i] for i in order))
+            qty = array('d', (qty[i] for i in order))
+            source = array('i', (source[i] for i in order))
+        return MetricSeries(self.units, ts, offset, qty, source, self.sources)
+
+
+def combine_series(parts: List[MetricSeries]) -> MetricSeries:
+    """Merge several series of one metric into a single sorted series.
+
+    Points sharing (timestamp, source) are deduplicated, keeping the one from
+    the latest part, so merging overlapping snapshots in order is deterministic.
+    """
+    units = parts[-1].units if parts else ''
+    parts = [part for part in parts if len(part)]
+    if not parts:
+        return MetricSeries(units, array('q'), array('i'), array('d'), array('i'), [])
+    sources: List[str] = []
+    source_ids: Dict[str, int] = {}
+    remaps = []
+    for part in parts:
+        remap = []
+        for name in part.sources:
+            if name not in source_ids:
+                source_ids[name] = len(sources)
+                sources.append(name)
+            remap.append(source_ids[name])
+        remaps.append(remap)
+
+    if np is not None:
+        ts = np.concatenate([part.ts for part in parts])
+        offset = np.concatenate([part.offset for part in parts])
+        qty = np.concatenate([part.qty for part in parts])
+        source = np.concatenate([np.asarray(remap, dtype=np.int32)[part.source]
+                                 for part, remap in zip(parts, remaps)])
+        sequence = np.arange(len(ts))
+        order = np.lexsort((sequence, source, ts))
+        ts, offset, qty, source = ts[order], offset[order], qty[order], source[order]
+        # Keep the last row of every (ts, source) run, i.e. the latest part's point
+        keep = np.ones(len(ts), dtype=bool)
+        keep[:-1] = (ts[1:] != ts[:-1]) | (source[1:] != source[:-1])
+        return MetricSeries(units, ts[keep], offset[keep], qty[keep], source[keep], sources)
+
+    latest: Dict[Tuple[int, int], Tuple[int, float]] = {}
+    for part, remap in zip(parts, remaps):
+        for t, o, q, s in zip(part.ts, part.offset, part.qty, part.source):
+            latest[(t, remap[s])] = (o, q)
+    keys = sorted(latest)
+    return MetricSeries(units,
+                        array('q', (t for t, _ in keys)),
+                        array('i', (latest[k][0] for k in keys)),
+                        array('d', (latest[k][1] for k in keys)),
+                        array('i', (s for _, s in keys)),
+                        sources)
+
+
+_day_bases: Dict[str, Tuple[int, int]] = {}
+
+
+def _day_base(key: str):
+    """(epoch of local midnight, offset) for a 'YYYY-MM-DD +HHMM' key, or None"""
+    if not (key[4] == '-' and key[7] == '-' and key[10] == ' ' and key[11] in '+-'):
+        return None
+    day = date(int(key[:4]), int(key[5:7]), int(key[8:10])).toordinal() - EPOCH_ORDINAL
+    offset = int(key[12:14]) * 3600 + int(key[14:16]) * 60
+    if key[11] == '-':
+        offset = -offset
+    base = _day_bases[key] = (day * SECONDS_PER_DAY - offset, offset)
+    return base
+
+
+def parse_timestamp(value: str) -> Tuple[int, int]:
+    """Parse a Health Auto Export timestamp into (epoch seconds, UTC offset seconds)
+
+    Timestamps look like '2026-02-16 10:30:00 +0530'. The fixed layout is
+    sliced directly, with the epoch of each distinct (date, offset) pair
+    computed once; anything else falls back to strptime.
+    """
+    if len(value) == 25 and value[10] == ' ' and value[13] == ':' and value[16] == ':':
+        key = value[:10] + value[19:]
+        base = _day_bases.get(key) or _day_base(key)
+        if base is not None:
+            return base[0] + int(value[11:13]) * 3600 + int(value[14:16]) * 60 + int(value[17:19]), base[1]
+
+    parsed = datetime.strptime(value, '%Y-%m-%d %H:%M:%S %z')
+    offset = int(parsed.utcoffset().total_seconds())
+    return int(parsed.timestamp()), offset
+
+
+_timezones: Dict[int, timezone] = {}
+
+
+def tz_for_offset(offset: int) -> timezone:
+    """Shared timezone object for a UTC offset in seconds"""
+    tz = _timezones.get(offset)
+    if tz is None:
+        tz = _timezones[offset] = timezone(timedelta(seconds=offset))
+    return tz
+
+
+def day_string(day: int) -> str:
+    """Format a day number (days since 1970-01-01) as YYYY-MM-DD"""
+    return str(date.fromordinal(EPOCH_ORDINAL + day))
@@ -0,0 +1,322 @@
+"""
+Asyncio HTTP ingest endpoint for Health Auto Export.
+
+Replaces the port-3400 file drop: the app POSTs its JSON payload straight
+here, and the body is decoded as it arrives and merged into the history
+store. No latest.json is written and then re-read.
+
+The event loop reads the socket in chunks and hands them to a parser thread
+through a small bounded queue (BodyPipe). When the parser falls behind, the
+loop stops reading, so TCP flow control pushes back on the sender. Bodies
+over the size limit are refused with 413, up front when Content-Length says
+so, or as soon as the running count passes it. At most `max_concurrent`
+bodies are parsed at once, and store merges run one at a time.
+
+`replay` is the matching test client: it streams recorded payloads at a
+running server.
+"""
+
+import asyncio
+import io
+import json
+import queue
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import store
+from loader import read_export_stream
+
+DEFAULT_PORT = 3400
+MAX_BODY = 256 << 20
+CHUNK_SIZE = 1 << 16
+# Chunks buffered between the socket and the parser before reading pauses
+PIPE_DEPTH = 8
+MAX_HEADER = 1 << 16
+# How long a rejected request's remaining body is drained before closing
+LINGER_SECONDS = 2.0
+# Chunk-size token of a chunked body: hex digits only, no 0x prefix or underscores
+_HEX = re.compile(rb'[0-9A-Fa-f]+')
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               411: 'Length Required', 413: 'Payload Too Large', 431: 'Request Header Fields Too Large',
+               500: 'Internal Server Error'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class BodyPipe(io.RawIOBase):
+    """Raw reader fed chunk by chunk from the event loop through a bounded queue"""
+
+    def __init__(self, depth: int = PIPE_DEPTH):
+        self.chunks: queue.Queue = queue.Queue(maxsize=depth)
+        self.pending = b''
+        self.eof = False
+        self.finished = threading.Event()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self.pending:
+            if self.eof:
+                return 0
+            chunk = self.chunks.get()
+            if chunk is None:
+                self.eof = True
+                return 0
+            if isinstance(chunk, BaseException):
+                raise chunk
+            self.pending = chunk
+        n = min(len(buffer), len(self.pending))
+        buffer[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+    def feed(self, chunk) -> bool:
+        """Queue a chunk (None for end of body, or an exception to raise in the
+        parser), blocking while the queue is full. False once the parser has
+        stopped reading."""
+        while not self.finished.is_set():
+            try:
+                self.chunks.put(chunk, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def parse(self):
+        """Parser thread entry point: decode the export as it streams in"""
+        try:
+            return read_export_stream(io.TextIOWrapper(io.BufferedReader(self, CHUNK_SIZE), encoding='utf-8'))
+        finally:
+            self.finished.set()
+
+
+async def _read_head(reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str]]:
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.LimitOverrunError:
+        raise HTTPError(431, 'Request headers too large')
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, _ = lines[0].split(' ', 2)
+    except ValueError:
+        raise HTTPError(400, 'Malformed request line')
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    return method, target, headers
+
+
+async def _body_chunks(reader: asyncio.StreamReader, headers: Dict[str, str], max_body: int):
+    """Yield the request body in chunks, enforcing the size limit as it goes"""
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        received = 0
+        while True:
+            try:
+                line = await reader.readuntil(b'\r\n')
+            except asyncio.LimitOverrunError:
+                raise HTTPError(400, 'Malformed chunk size')
+            token = line.split(b';')[0].strip()
+            if not _HEX.fullmatch(token):
+                raise HTTPError(400, 'Malformed chunk size')
+            size = int(token, 16)
+            if size == 0:
+                try:
+                    await reader.readuntil(b'\r\n')
+                except asyncio.LimitOverrunError:
+                    raise HTTPError(400, 'Malformed chunked trailer')
+                return
+            received += size
+            if received > max_body:
+                raise HTTPError(413, f'Body exceeds {max_body} bytes')
+            while size:
+                chunk = await reader.read(min(size, CHUNK_SIZE))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b'', size)
+                size -= len(chunk)
+                yield chunk
+            await reader.readexactly(2)
+
+    if 'content-length' not in headers:
+        raise HTTPError(411, 'Content-Length or chunked encoding required')
+    try:
+        remaining = int(headers['content-length'])
+    except ValueError:
+        remaining = -1
+    if remaining < 0:
+        raise HTTPError(400, 'Malformed Content-Length')
+    if remaining > max_body:
+        raise HTTPError(413, f'Body exceeds {max_body} bytes')
+    while remaining:
+        chunk = await reader.read(min(remaining, CHUNK_SIZE))
+        if not chunk:
+            raise asyncio.IncompleteReadError(b'', remaining)
+        remaining -= len(chunk)
+        yield chunk
+
+
+async def _discard(reader: asyncio.StreamReader):
+    while await reader.read(CHUNK_SIZE):
+        pass
+
+
+class IngestServer:
+    """Accepts Health Auto Export POSTs and merges them into a history store"""
+
+    def __init__(self, store_path, max_body: int = MAX_BODY, max_concurrent: int = 2, path: str = '/'):
+        self.store_path = Path(store_path)
+        self.max_body = max_body
+        self.path = path
+        self.parsing = asyncio.Semaphore(max_concurrent)
+        self.merging = asyncio.Lock()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        started = time.perf_counter()
+        peer = writer.get_extra_info('peername')
+        try:
+            status, result = await self._process(reader)
+        except HTTPError as e:
+            status, result = e.status, {'error': str(e)}
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        except Exception as e:
+            status, result = 500, {'error': str(e)}
+
+        body = json.dumps(result).encode('utf-8')
+        writer.write(f'HTTP/1.1 {status} {STATUS_TEXT.get(status, "")}\r\n'
+                     f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+                     f'Connection: close\r\n\r\n'.encode('latin-1') + body)
+        try:
+            await writer.drain()
+            if status != 200:
+                # Closing with unread body bytes would reset the connection and
+                # could discard the response, so drain briefly first
+                writer.write_eof()
+                await asyncio.wait_for(_discard(reader), LINGER_SECONDS)
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        writer.close()
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"{peer[0] if peer else '-'} {status} {result.get('points', 0)} points "
+              f"{result.get('workouts', 0)} workouts {elapsed:.0f} ms", file=sys.stderr)
+
+    async def _process(self, reader: asyncio.StreamReader) -> Tuple[int, Dict]:
+        method, target, headers = await _read_head(reader)
+        if method != 'POST':
+            raise HTTPError(405, 'Only POST is supported')
+        if urllib.parse.urlsplit(target).path != self.path:
+            raise HTTPError(404, f'Unknown path: {target}')
+
+        async with self.parsing:
+            pipe = BodyPipe()
+            parsing = asyncio.create_task(asyncio.to_thread(pipe.parse))
+            try:
+                async for chunk in _body_chunks(reader, headers, self.max_body):
+                    # Blocks (off the loop) while the parser is PIPE_DEPTH chunks behind
+                    if not await asyncio.to_thread(pipe.feed, chunk):
+                        break
+                await asyncio.to_thread(pipe.feed, None)
+            except BaseException as e:
+                await asyncio.to_thread(pipe.feed, ConnectionAbortedError('Request body aborted'))
+                await asyncio.gather(parsing, return_exceptions=True)
+                raise e
+            try:
+                series, workout_list = await parsing
+            except ValueError as e:
+                raise HTTPError(400, f'Malformed export: {e}')
+
+        async with self.merging:
+            added = await asyncio.to_thread(store.merge, self.store_path, series, workout_list)
+        workouts = added.pop('workouts')
+        return 200, {'points': sum(added.values()), 'workouts': workouts, 'added': added}
+
+
+async def serve(store_path, host: str = '127.0.0.1', port: int = DEFAULT_PORT, max_body: int = MAX_BODY,
+                max_concurrent: int = 2, path: str = '/'):
+    """Run the ingest endpoint until cancelled"""
+    handler = IngestServer(store_path, max_body, max_concurrent, path)
+    server = await asyncio.start_server(handler.handle, host, port, limit=MAX_HEADER)
+    addresses = ', '.join(f'{s.getsockname()[0]}:{s.getsockname()[1]}' for s in server.sockets)
+    print(f"Ingesting into {store_path}, listening on {addresses}", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+async def post_file(url: str, path, chunk_size: int = CHUNK_SIZE) -> Tuple[int, Dict, float]:
+    """Stream one recorded payload to the server.
+
+    Returns:
+        (HTTP status, decoded JSON response, seconds until the response arrived)
+    """
+    parts = urllib.parse.urlsplit(url)
+    size = Path(path).stat().st_size
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    try:
+        writer.write(f'POST {parts.path or "/"} HTTP/1.1\r\nHost: {parts.netloc}\r\n'
+                     f'Content-Type: application/json\r\nContent-Length: {size}\r\n'
+                     f'Connection: close\r\n\r\n'.encode('latin-1'))
+        try:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    writer.write(chunk)
+                    await writer.drain()
+        except ConnectionError:
+            # The server may answer (e.g. 413) before reading the whole body
+            pass
+        response = await reader.read()
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - started
+    head, _, body = response.partition(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1]) if head else 0
+    try:
+        result = json.loads(body) if body else {}
+    except ValueError:
+        result = {'error': body.decode('utf-8', 'replace')}
+    return status, result, elapsed
+
+
+async def replay(url: str, paths: List[Path], concurrency: int = 1,
+                 chunk_size: int = CHUNK_SIZE) -> List[Tuple[Path, int, Dict, float]]:
+    """POST recorded payloads to a running server, `concurrency` at a time, in order"""
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(path: Path):
+        async with limit:
+            try:
+                return (path, *await post_file(url, path, chunk_size))
+            except OSError as e:
+                return path, 0, {'error': str(e)}, 0.0
+
+    return await asyncio.gather(*(one(path) for path in paths))
+
+
+def parse_size(value: str) -> int:
+    """'64M', '512k' or a plain byte count"""
+    units = {'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30}
+    suffix = value[-1:].lower()
+    if suffix in units:
+        return int(float(value[:-1]) * units[suffix])
+    return int(value)
+
+
+def run(store_path, host: str, port: int, max_body: int, max_concurrent: int, path: str):
+    """Blocking entry point for the CLI; returns on Ctrl-C"""
+    try:
+        asyncio.run(serve(store_path, host, port, max_body, max_concurrent, path))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,190 @@
+"""
+Append-only SQLite history store for Health Auto Export snapshots.
+
+Health Auto Export keeps overwriting latest.json with overlapping windows.
+`ingest` merges each snapshot into a local database, inserting only points at
+or after each metric's high-water mark and deduplicating on
+(metric, timestamp, source), so the write cost scales with the new data rather
+than the whole history. `read_store` loads the same columnar series as the
+JSON loader, so HealthAnalyzer can run against the store directly.
+"""
+
+import json
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from loader import read_export
+from series import MetricSeries, SeriesBuilder, np, parse_timestamp
+
+SQLITE_MAGIC = b'SQLite format 3\0'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics (
+    id          INTEGER PRIMARY KEY,
+    name        TEXT NOT NULL UNIQUE,
+    units       TEXT NOT NULL,
+    high_water  INTEGER
+);
+CREATE TABLE IF NOT EXISTS sources (
+    id    INTEGER PRIMARY KEY,
+    name  TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS points (
+    metric_id   INTEGER NOT NULL,
+    ts          INTEGER NOT NULL,
+    source_id   INTEGER NOT NULL,
+    utc_offset  INTEGER NOT NULL,
+    qty         REAL NOT NULL,
+    PRIMARY KEY (metric_id, ts, source_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS workouts (
+    start_ts  INTEGER NOT NULL,
+    name      TEXT NOT NULL,
+    body      TEXT NOT NULL,
+    PRIMARY KEY (start_ts, name)
+);
+"""
+
+
+def is_store(path) -> bool:
+    """Whether `path` is a SQLite database rather than a JSON export"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+    except OSError:
+        return False
+
+
+def connect(path) -> sqlite3.Connection:
+    """Open the store for merging, creating the schema and switching to WAL if needed"""
+    conn = sqlite3.connect(str(path))
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def connect_readonly(path) -> sqlite3.Connection:
+    """Open an existing store for reading only: no schema script, no pragmas, no writes"""
+    return sqlite3.connect(f'{Path(path).resolve().as_uri()}?mode=ro', uri=True)
+
+
+def _metric_row(conn: sqlite3.Connection, name: str, units: str) -> Tuple[int, Optional[int]]:
+    row = conn.execute('SELECT id, high_water FROM metrics WHERE name = ?', (name,)).fetchone()
+    if row is None:
+        cursor = conn.execute('INSERT INTO metrics (name, units) VALUES (?, ?)', (name, units))
+        return cursor.lastrowid, None
+    return row
+
+
+def _source_ids(conn: sqlite3.Connection, names: List[str]) -> List[int]:
+    ids = []
+    for name in names:
+        conn.execute('INSERT OR IGNORE INTO sources (name) VALUES (?)', (name,))
+        ids.append(conn.execute('SELECT id FROM sources WHERE name = ?', (name,)).fetchone()[0])
+    return ids
+
+
+def merge_series(conn: sqlite3.Connection, name: str, series: MetricSeries) -> int:
+    """Insert the points of `series` at or after the metric's high-water mark.
+
+    Points exactly at the mark are re-offered so a second source reporting the
+    same instant is kept; the primary key drops true duplicates.
+
+    Returns:
+        Number of points added
+    """
+    metric_id, high_water = _metric_row(conn, name, series.units)
+    if len(series) == 0:
+        return 0
+    start = series.index_at(high_water) if high_water is not None else 0
+    if start >= len(series):
+        return 0
+
+    source_ids = _source_ids(conn, series.sources)
+    ts, offset, qty, source = series.ts[start:], series.offset[start:], series.qty[start:], series.source[start:]
+    if np is not None:
+        ts, offset, qty, source = ts.tolist(), offset.tolist(), qty.tolist(), source.tolist()
+    before = conn.total_changes
+    conn.executemany(
+        'INSERT OR IGNORE INTO points (metric_id, ts, source_id, utc_offset, qty) VALUES (?, ?, ?, ?, ?)',
+        ((metric_id, t, source_ids[s], o, q) for t, o, q, s in zip(ts, offset, qty, source)))
+    added = conn.total_changes - before
+    latest = int(series.ts[len(series) - 1])
+    conn.execute('UPDATE metrics SET high_water = MAX(COALESCE(high_water, ?), ?), units = ? WHERE id = ?',
+                 (latest, latest, series.units, metric_id))
+    return added
+
+
+def merge_workouts(conn: sqlite3.Connection, workouts: List[Dict]) -> int:
+    """Insert workouts not already stored, keyed on (start, name)"""
+    before = conn.total_changes
+    for workout in workouts:
+        try:
+            start_ts, _ = parse_timestamp(workout['start'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        conn.execute('INSERT OR IGNORE INTO workouts (start_ts, name, body) VALUES (?, ?, ?)',
+                     (start_ts, workout.get('name', ''), json.dumps(workout)))
+    return conn.total_changes - before
+
+
+def merge(store_path, series: Dict[str, MetricSeries], workouts: List[Dict]) -> Dict[str, int]:
+    """Merge already-parsed series and workouts into the store in one transaction"""
+    conn = connect(store_path)
+    try:
+        with conn:
+            added = {name: merge_series(conn, name, metric) for name, metric in series.items()}
+            added['workouts'] = merge_workouts(conn, workouts)
+        return added
+    finally:
+        conn.close()
+
+
+def ingest(store_path, export_path) -> Dict[str, int]:
+    """Merge one Health Auto Export snapshot into the store.
+
+    Returns:
+        Points added per metric, plus workouts added under 'workouts'
+    """
+    series, workouts = read_export(export_path)
+    return merge(store_path, series, workouts)
+
+
+def read_store(store_path, metrics: Optional[Iterable[str]] = None, workouts: bool = True,
+               since: Optional[int] = None) -> Tuple[Dict[str, MetricSeries], List[Dict]]:
+    """Load columnar series (and workouts) from the store.
+
+    Args:
+        store_path: SQLite store written by ingest
+        metrics: Metric names to load (None for all)
+        workouts: Whether to load workouts
+        since: Only load points at or after this epoch second
+    """
+    if not Path(store_path).exists():
+        raise FileNotFoundError(f"Health store not found: {store_path}")
+    conn = connect_readonly(store_path)
+    try:
+        source_names = dict(conn.execute('SELECT id, name FROM sources'))
+        wanted = set(metrics) if metrics is not None else None
+        lower = since if since is not None else -(1 << 62)
+        series: Dict[str, MetricSeries] = {}
+        for metric_id, name, units in conn.execute('SELECT id, name, units FROM metrics ORDER BY name').fetchall():
+            if wanted is not None and name not in wanted:
+                continue
+            builder = SeriesBuilder(units)
+            rows = conn.execute(
+                'SELECT ts, utc_offset, qty, source_id FROM points WHERE metric_id = ? AND ts >= ? ORDER BY ts',
+                (metric_id, lower))
+            for ts, offset, qty, source_id in rows:
+                builder.append(ts, offset, qty, source_names[source_id])
+            series[name] = builder.build()
+
+        workout_list: List[Dict] = []
+        if workouts:
+            workout_list = [json.loads(body) for (body,) in
+                            conn.execute('SELECT body FROM workouts ORDER BY start_ts')]
+        return series, workout_list
+    finally:
+        conn.close()
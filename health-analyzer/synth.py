@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Synthetic Health Auto Export generator for benchmarks and tests.
+
+Writes an export in the app's JSON layout: heart rate every minute (as
+Min/Avg/Max), resting HR, HRV, steps, active energy, exercise minutes,
+per-stage sleep segments and workouts. Workouts raise the heart rate, sleep
+lowers it, and every few weeks there is a run of short nights and sedentary
+days, so the red-flag rules have something to find. The output is streamed to
+disk, so five years of per-minute heart rate (~2.6M points) never sits in
+memory. The same seed and end time always produce the same file.
+
+Usage:
+    ./synth.py --days 365 --out /tmp/synth-365d.json
+    ./synth.py --days 1825 --out /tmp/synth-5y.json --seed 7
+"""
+
+import argparse
+import random
+import time
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional, TextIO, Tuple
+
+from series import EPOCH_ORDINAL, SECONDS_PER_DAY
+
+WATCH = 'Apple Watch'
+PHONE = 'iPhone'
+SLEEP_STAGES = ('Core', 'Deep', 'Core', 'REM')
+
+
+class _Clock:
+    """Formats epoch seconds as export timestamps in one fixed UTC offset"""
+
+    def __init__(self, offset: int):
+        self.offset = offset
+        sign = '-' if offset < 0 else '+'
+        self.suffix = f' {sign}{abs(offset) // 3600:02d}{abs(offset) % 3600 // 60:02d}'
+        self.days: Dict[int, str] = {}
+
+    def local_day(self, ts: int) -> int:
+        return (ts + self.offset) // SECONDS_PER_DAY
+
+    def midnight(self, day: int) -> int:
+        return day * SECONDS_PER_DAY - self.offset
+
+    def format(self, ts: int) -> str:
+        local = ts + self.offset
+        day, seconds = divmod(local, SECONDS_PER_DAY)
+        prefix = self.days.get(day)
+        if prefix is None:
+            prefix = self.days[day] = str(date.fromordinal(EPOCH_ORDINAL + day))
+        return f'{prefix} {seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}{self.suffix}'
+
+
+def _plan(rng: random.Random, clock: _Clock, first_day: int, last_day: int):
+    """Per-day schedule: sleep intervals, workouts, and which days are 'bad'"""
+    sleeps: List[Tuple[int, int]] = []
+    workouts: List[Tuple[int, int, str]] = []
+    bad_days = set()
+    day = first_day
+    while day <= last_day:
+        # Every few weeks, a run of short nights and sedentary days
+        if rng.random() < 0.03:
+            bad_days.update(range(day, day + rng.randint(3, 5)))
+        midnight = clock.midnight(day)
+        bad = day in bad_days
+        bedtime = midnight - rng.randint(30, 120) * 60
+        hours = rng.uniform(4.0, 5.5) if bad else rng.uniform(6.3, 8.5)
+        sleeps.append((bedtime, bedtime + int(hours * 3600)))
+        if not bad and rng.random() < 0.55:
+            start = midnight + rng.randint(6 * 60, 19 * 60) * 60
+            name = rng.choice(('Outdoor Run', 'Indoor Cycling', 'Traditional Strength Training', 'Walking'))
+            workouts.append((start, start + rng.randint(25, 75) * 60, name))
+        day += 1
+    return sleeps, workouts, bad_days
+
+
+class _MetricWriter:
+    """Writes one metric object, point by point"""
+
+    def __init__(self, out: TextIO, name: str, units: str, first: bool):
+        self.out = out
+        self.first_point = True
+        out.write(('' if first else ',\n') + f'{{"name": "{name}", "units": "{units}", "data": [')
+
+    def point(self, body: str):
+        self.out.write(('\n' if self.first_point else ',\n') + '{' + body + '}')
+        self.first_point = False
+
+    def close(self):
+        self.out.write(']}')
+
+
+def generate(out: TextIO, days: int, seed: int = 0, end: Optional[int] = None, offset: int = 19800) -> int:
+    """Write a synthetic export covering `days` days up to `end`.
+
+    Args:
+        out: Text file to write to
+        days: Days of history
+        seed: Random seed; the same seed and end give the same file
+        end: Epoch second of the last sample (default: now, to the minute)
+        offset: UTC offset of every timestamp, in seconds (default +05:30)
+
+    Returns:
+        Number of metric points written
+    """
+    rng = random.Random(seed)
+    clock = _Clock(offset)
+    end = (int(time.time()) if end is None else end) // 60 * 60
+    start = end - days * SECONDS_PER_DAY
+    first_day, last_day = clock.local_day(start), clock.local_day(end)
+    sleeps, workouts, bad_days = _plan(rng, clock, first_day, last_day + 1)
+    fmt = clock.format
+    written = 0
+
+    out.write('{"data": {"metrics": [\n')
+
+    # Heart rate every minute; elevated during workouts, low while asleep
+    metric = _MetricWriter(out, 'heart_rate', 'count/min', first=True)
+    sleep_i = workout_i = 0
+    for ts in range(start, end + 1, 60):
+        while sleep_i < len(sleeps) and sleeps[sleep_i][1] <= ts:
+            sleep_i += 1
+        while workout_i < len(workouts) and workouts[workout_i][1] <= ts:
+            workout_i += 1
+        if workout_i < len(workouts) and workouts[workout_i][0] <= ts:
+            avg = rng.gauss(142, 12)
+        elif sleep_i < len(sleeps) and sleeps[sleep_i][0] <= ts:
+            avg = rng.gauss(56, 3)
+        else:
+            avg = rng.gauss(74, 8)
+        low, high = avg - rng.uniform(0, 6), avg + rng.uniform(0, 8)
+        metric.point(f'"date": "{fmt(ts)}", "Min": {low:.0f}, "Avg": {avg:.1f}, "Max": {high:.0f}, '
+                     f'"source": "{WATCH}"')
+        written += 1
+    metric.close()
+
+    daily = [(day, clock.midnight(day)) for day in range(first_day, last_day + 1)]
+
+    metric = _MetricWriter(out, 'resting_heart_rate', 'count/min', first=False)
+    for day, midnight in daily:
+        ts = midnight + 8 * 3600
+        if start <= ts <= end:
+            value = rng.gauss(66 if day in bad_days else 57, 2)
+            metric.point(f'"date": "{fmt(ts)}", "qty": {value:.0f}, "source": "{WATCH}"')
+            written += 1
+    metric.close()
+
+    metric = _MetricWriter(out, 'heart_rate_variability', 'ms', first=False)
+    for day, midnight in daily:
+        for hour in sorted(rng.sample(range(24), 5)):
+            ts = midnight + hour * 3600 + rng.randint(0, 3599)
+            if start <= ts <= end:
+                value = max(8.0, rng.gauss(32 if day in bad_days else 48, 9))
+                metric.point(f'"date": "{fmt(ts)}", "qty": {value:.2f}, "source": "{WATCH}"')
+                written += 1
+    metric.close()
+
+    # Hourly activity while awake, from the phone (steps) and the watch (energy)
+    for name, units, source, scale in (('step_count', 'count', PHONE, 600),
+                                       ('active_energy', 'kcal', WATCH, 28)):
+        metric = _MetricWriter(out, name, units, first=False)
+        for day, midnight in daily:
+            factor = 0.12 if day in bad_days else 1.0
+            for hour in range(7, 23):
+                ts = midnight + hour * 3600
+                if start <= ts <= end:
+                    value = max(0.0, rng.gauss(scale, scale / 2)) * factor
+                    metric.point(f'"date": "{fmt(ts)}", "qty": {value:.1f}, "source": "{source}"')
+                    written += 1
+        metric.close()
+
+    metric = _MetricWriter(out, 'apple_exercise_time', 'min', first=False)
+    for workout_start, workout_end, _ in workouts:
+        if start <= workout_end <= end:
+            metric.point(f'"date": "{fmt(workout_end)}", "qty": {(workout_end - workout_start) // 60}, '
+                         f'"source": "{WATCH}"')
+            written += 1
+    metric.close()
+
+    # One segment per sleep stage, cycling through the night with brief wake-ups
+    metric = _MetricWriter(out, 'sleep_analysis', 'hr', first=False)
+    for bedtime, wake in sleeps:
+        segment_start, stage = bedtime, 0
+        while segment_start < wake:
+            segment_end = min(wake, segment_start + rng.randint(15, 45) * 60)
+            value = 'Awake' if rng.random() < 0.08 else SLEEP_STAGES[stage % len(SLEEP_STAGES)]
+            if start <= segment_end <= end:
+                metric.point(f'"startDate": "{fmt(segment_start)}", "endDate": "{fmt(segment_end)}", '
+                             f'"value": "{value}", "qty": {(segment_end - segment_start) / 3600:.4f}, '
+                             f'"source": "{WATCH}"')
+                written += 1
+            segment_start, stage = segment_end, stage + 1
+    metric.close()
+
+    out.write('\n], "workouts": [')
+    first = True
+    for workout_start, workout_end, name in workouts:
+        if not start <= workout_end <= end:
+            continue
+        minutes = (workout_end - workout_start) / 60
+        out.write(('\n' if first else ',\n')
+                  + f'{{"name": "{name}", "start": "{fmt(workout_start)}", "end": "{fmt(workout_end)}", '
+                    f'"duration": {minutes * 60:.0f}, '
+                    f'"activeEnergyBurned": {{"qty": {minutes * rng.uniform(6, 11):.1f}, "units": "kcal"}}}}')
+        first = False
+    out.write('\n]}}\n')
+    return written
+
+
+def write_export(path, days: int, seed: int = 0, end: Optional[int] = None) -> int:
+    """generate() into a file, returning the number of points written"""
+    with open(path, 'w', encoding='utf-8') as f:
+        return generate(f, days, seed, end)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic Health Auto Export file')
+    parser.add_argument('--days', type=int, default=30, help='Days of history (default: 30)')
+    parser.add_argument('--out', required=True, help='Output JSON path')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--end', type=int, help='Epoch second of the last sample (default: now)')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    points = write_export(args.out, args.days, args.seed, args.end)
+    size = Path(args.out).stat().st_size
+    print(f"Wrote {points} points ({size / 1e6:.1f} MB) to {args.out} "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
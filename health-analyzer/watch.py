@@ -0,0 +1,209 @@
+"""
+Watch mode: keep an analyzer loaded and re-check red flags as the export changes.
+
+Changes are picked up through inotify on Linux (the process sleeps in select()
+until the kernel reports a write) and by polling stat() elsewhere. Each change
+is debounced until the writer goes quiet, then merged with
+HealthAnalyzer.refresh, which only keeps points newer than what is already
+loaded and re-rolls only the days they touch. Only flag state changes are
+emitted, one JSON object per line:
+
+    {"time": "...", "event": "raised", "rule": "low_steps", "message": "..."}
+    {"time": "...", "event": "cleared", "rule": "low_steps", "message": "..."}
+"""
+
+import ctypes
+import ctypes.util
+import fnmatch
+import glob
+import json
+import os
+import select
+import struct
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+
+import rules
+
+# Seconds between stat() checks when inotify is unavailable
+POLL_INTERVAL = 2.0
+# A change is handled once the file has been quiet this long
+SETTLE_SECONDS = 0.5
+# ...but never deferred longer than this while writes keep arriving
+SETTLE_LIMIT = 10.0
+# Re-evaluate flags this often even without changes, as day windows roll over
+RECHECK_INTERVAL = 300.0
+
+_IN_MODIFY = 0x002
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct('iIII')
+
+
+def watch_target(spec: str) -> Tuple[Path, Callable[[str], bool]]:
+    """Directory to watch for `spec`, and which entry names in it are relevant.
+
+    A single file is watched through its directory, so exports replaced by an
+    atomic rename are still seen; a store also matches its SQLite WAL file.
+    """
+    if os.path.isdir(spec):
+        return Path(spec), lambda name: name.endswith('.json')
+    if glob.has_magic(spec):
+        directory, pattern = os.path.split(spec)
+        return Path(directory or '.'), lambda name: fnmatch.fnmatch(name, pattern)
+    path = Path(spec)
+    names = {path.name, path.name + '-wal'}
+    return path.parent, names.__contains__
+
+
+class PollingWatcher:
+    """Detects changes by comparing (name, inode, size, mtime) of matching entries"""
+
+    def __init__(self, directory: Path, match: Callable[[str], bool], interval: float = POLL_INTERVAL):
+        self.directory = directory
+        self.match = match
+        self.interval = interval
+        self.state = self._snapshot()
+
+    def _snapshot(self):
+        try:
+            with os.scandir(self.directory) as entries:
+                return sorted((e.name, e.inode(), e.stat().st_size, e.stat().st_mtime_ns)
+                              for e in entries if self.match(e.name))
+        except OSError:
+            return None
+
+    def wait(self, timeout: float) -> bool:
+        """Block until a change settles or `timeout` passes; True if something changed"""
+        deadline = time.monotonic() + timeout
+        while True:
+            time.sleep(max(0.0, min(self.interval, deadline - time.monotonic())))
+            state = self._snapshot()
+            if state != self.state:
+                break
+            if time.monotonic() >= deadline:
+                return False
+        # Wait for the writer to finish before reporting the change
+        while True:
+            time.sleep(SETTLE_SECONDS)
+            settled = self._snapshot()
+            if settled == state:
+                self.state = state
+                return True
+            state = settled
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Linux inotify on the watched directory, read through libc with ctypes"""
+
+    MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+
+    def __init__(self, directory: Path, match: Callable[[str], bool]):
+        self.match = match
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f'inotify_add_watch failed for {directory}')
+
+    def _relevant(self, timeout: float) -> bool:
+        """Wait up to `timeout` for events; True if any names a matching entry"""
+        if not select.select([self.fd], [], [], max(0.0, timeout))[0]:
+            return False
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return False
+        position = 0
+        relevant = False
+        while position < len(data):
+            _, _, _, length = _EVENT.unpack_from(data, position)
+            start = position + _EVENT.size
+            name = data[start:start + length].rstrip(b'\0').decode('utf-8', 'replace')
+            relevant = relevant or self.match(name)
+            position = start + length
+        return relevant
+
+    def wait(self, timeout: float) -> bool:
+        """Block until a change settles or `timeout` passes; True if something changed"""
+        deadline = time.monotonic() + timeout
+        while not self._relevant(deadline - time.monotonic()):
+            if time.monotonic() >= deadline:
+                return False
+        limit = time.monotonic() + SETTLE_LIMIT
+        while time.monotonic() < limit and self._relevant(SETTLE_SECONDS):
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+def open_watcher(spec: str, poll_interval: float = POLL_INTERVAL):
+    """inotify where the platform has it, polling otherwise"""
+    directory, match = watch_target(spec)
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(directory, match)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}); polling every {poll_interval:g}s", file=sys.stderr)
+    return PollingWatcher(directory, match, poll_interval)
+
+
+def flag_changes(previous: Dict[str, str], current: Dict[str, str]):
+    """Yield (event, rule, message) for flags raised or cleared between two evaluations"""
+    for name, message in current.items():
+        if name not in previous:
+            yield 'raised', name, message
+    for name, message in previous.items():
+        if name not in current:
+            yield 'cleared', name, message
+
+
+def run(analyzer, sink: str = '-', poll_interval: float = POLL_INTERVAL, watcher=None):
+    """Re-check `analyzer`'s red flags on every change to its file until interrupted.
+
+    Args:
+        analyzer: A loaded HealthAnalyzer
+        sink: JSONL file to append events to, or '-' for stdout
+        poll_interval: Seconds between checks when polling
+        watcher: Change source (default: open_watcher for the analyzer's file)
+    """
+    watcher = watcher or open_watcher(str(analyzer.filepath), poll_interval)
+    out = sys.stdout if sink == '-' else open(sink, 'a', encoding='utf-8')
+    try:
+        active: Dict[str, str] = {}
+        changed = False
+        while True:
+            if changed:
+                try:
+                    analyzer.refresh()
+                except (OSError, ValueError) as e:
+                    # Typically a half-written export; the next write retries
+                    print(f"Skipping unreadable update: {e}", file=sys.stderr)
+            flags, _ = rules.evaluate_by_rule(analyzer)
+            stamp = datetime.now().astimezone().isoformat(timespec='seconds')
+            for event, name, message in flag_changes(active, flags):
+                out.write(json.dumps({'time': stamp, 'event': event, 'rule': name, 'message': message},
+                                     ensure_ascii=False) + '\n')
+            out.flush()
+            active = flags
+            changed = watcher.wait(RECHECK_INTERVAL)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        if out is not sys.stdout:
+            out.close()
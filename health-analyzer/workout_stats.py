@@ -0,0 +1,156 @@
+"""
+Per-workout heart-rate and energy analytics.
+
+Workouts are indexed as sorted [start, end) intervals. The index is
+merge-joined against a timestamp-sorted series: the workouts are walked in
+start order and each bound is found by binary search from the previous
+position, or by one vectorized searchsorted with NumPy. That yields the slice
+of samples inside each workout, so a series with millions of points is only
+touched inside workouts, never scanned once per workout.
+
+Heart-rate zones are fractions of maximum heart rate. Each sample counts
+for the time until the next sample, clipped to the workout and capped at
+MAX_SAMPLE_GAP, so gaps in the recording are not credited to any zone.
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from series import MetricSeries, np, parse_timestamp
+
+# Default maximum heart rate when neither --max-hr nor --age is given
+MAX_HR = 190
+# (zone, lower bound as a fraction of max HR); the first zone takes everything below
+ZONES: Tuple[Tuple[str, float], ...] = (('Z1', 0.0), ('Z2', 0.6), ('Z3', 0.7), ('Z4', 0.8), ('Z5', 0.9))
+# A sample covers at most this many seconds of a workout
+MAX_SAMPLE_GAP = 300
+
+
+def max_hr_for_age(age: int) -> int:
+    return 220 - age
+
+
+def workout_interval(workout: Dict) -> Optional[Tuple[int, int]]:
+    """(start, end) epoch seconds of a workout, from end or start + duration (seconds)"""
+    try:
+        start, _ = parse_timestamp(workout['start'])
+        if workout.get('end'):
+            end, _ = parse_timestamp(workout['end'])
+        else:
+            end = start + int(float(workout['duration']))
+    except (KeyError, TypeError, ValueError):
+        return None
+    return (start, end) if end > start else None
+
+
+class WorkoutIndex:
+    """Workouts as [start, end) intervals sorted by start"""
+
+    __slots__ = ('workouts', 'starts', 'ends')
+
+    def __init__(self, workouts: Sequence[Dict]):
+        intervals = []
+        for workout in workouts:
+            interval = workout_interval(workout)
+            if interval is not None:
+                intervals.append((interval[0], interval[1], workout))
+        intervals.sort(key=lambda item: item[0])
+        self.workouts = [workout for _, _, workout in intervals]
+        self.starts = [start for start, _, _ in intervals]
+        self.ends = [end for _, end, _ in intervals]
+
+    def __len__(self) -> int:
+        return len(self.workouts)
+
+    def since(self, ts: int) -> 'WorkoutIndex':
+        """Workouts starting at or after epoch second `ts`"""
+        index = WorkoutIndex.__new__(WorkoutIndex)
+        first = bisect_left(self.starts, ts)
+        index.workouts, index.starts, index.ends = self.workouts[first:], self.starts[first:], self.ends[first:]
+        return index
+
+    def ranges(self, series: MetricSeries) -> List[Tuple[int, int]]:
+        """Index range [lo, hi) of the series points inside each workout, in index order"""
+        if np is not None:
+            lo = np.searchsorted(series.ts, self.starts, side='left').tolist()
+            hi = np.searchsorted(series.ts, self.ends, side='left').tolist()
+            return list(zip(lo, hi))
+        ranges = []
+        position = 0
+        for start, end in zip(self.starts, self.ends):
+            # Starts are sorted, so each search resumes where the last one began
+            position = bisect_left(series.ts, start, position)
+            ranges.append((position, bisect_left(series.ts, end, position)))
+        return ranges
+
+
+def _zone_seconds(ts, hr, end: int, max_hr: float) -> List[float]:
+    """Seconds spent in each zone by the samples of one workout"""
+    bounds = [fraction * max_hr for _, fraction in ZONES[1:]]
+    if np is not None:
+        ts = ts.astype(np.int64)
+        durations = np.minimum(np.diff(np.r_[ts, end]), MAX_SAMPLE_GAP)
+        zones = np.searchsorted(bounds, hr, side='right')
+        return np.bincount(zones, weights=durations, minlength=len(ZONES)).tolist()
+    seconds = [0.0] * len(ZONES)
+    following = list(ts[1:]) + [end]
+    for t, value, after in zip(ts, hr, following):
+        seconds[bisect_right(bounds, value)] += min(after - t, MAX_SAMPLE_GAP)
+    return seconds
+
+
+def workout_energy(workout: Dict) -> Optional[float]:
+    """Calories from the workout's own activeEnergyBurned, if present"""
+    burned = workout.get('activeEnergyBurned')
+    if isinstance(burned, dict):
+        burned = burned.get('qty')
+    try:
+        return float(burned) if burned is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def analyze_workouts(index: WorkoutIndex, heart_rate: Optional[MetricSeries] = None,
+                     active_energy: Optional[MetricSeries] = None, max_hr: float = MAX_HR) -> List[Dict]:
+    """Per-workout duration, average/max heart rate, calories and minutes per zone.
+
+    Calories come from the workout's own activeEnergyBurned, or else the sum
+    of active_energy samples inside it. Heart-rate fields are None when no
+    samples fall inside the workout.
+    """
+    hr_ranges = index.ranges(heart_rate) if heart_rate is not None and len(heart_rate) else None
+    energy_ranges = index.ranges(active_energy) if active_energy is not None and len(active_energy) else None
+
+    results = []
+    for i, workout in enumerate(index.workouts):
+        start, end = index.starts[i], index.ends[i]
+        result = {
+            'name': workout.get('name', 'Workout'),
+            'start': workout.get('start', ''),
+            'minutes': (end - start) / 60,
+            'avg_hr': None,
+            'max_hr': None,
+            'kcal': workout_energy(workout),
+            'zones': {zone: 0.0 for zone, _ in ZONES},
+        }
+        if hr_ranges is not None:
+            lo, hi = hr_ranges[i]
+            if hi > lo:
+                ts, hr = heart_rate.ts[lo:hi], heart_rate.qty[lo:hi]
+                if np is not None:
+                    result['avg_hr'], result['max_hr'] = float(hr.mean()), float(hr.max())
+                else:
+                    result['avg_hr'], result['max_hr'] = sum(hr) / len(hr), max(hr)
+                seconds = _zone_seconds(ts, hr, end, max_hr)
+                result['zones'] = {zone: s / 60 for (zone, _), s in zip(ZONES, seconds)}
+        if result['kcal'] is None and energy_ranges is not None:
+            lo, hi = energy_ranges[i]
+            result['kcal'] = float(sum(active_energy.qty[lo:hi]))
+        results.append(result)
+    return results
+
+
+def zone_thresholds(max_hr: float) -> List[Tuple[str, float, Optional[float]]]:
+    """(zone, lower bpm, upper bpm or None) for each zone"""
+    bounds = [fraction * max_hr for _, fraction in ZONES] + [None]
+    return [(zone, bounds[i], bounds[i + 1]) for i, (zone, _) in enumerate(ZONES)]
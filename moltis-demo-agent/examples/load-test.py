@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Load generator for MoltisClient
+
+Drives --requests chat streams, --concurrency at a time, through one
+MoltisClient (so all of them share its WebSocket). It reports:
+  - time to first token (the first text event)
+  - completion latency (until the done event), as p50/p95/p99
+  - aggregate tokens per second
+  - client CPU time, as a share of one core
+
+Without --url a stub gateway (stub-gateway.py) is started in a subprocess,
+so the run is offline, and the stub's CPU is not counted as the client's.
+
+--breakdown also runs the client with a moltis_metrics.MetricsAggregator and
+prints where the time went (connect, first event, chunk gaps, tools);
+--metrics-output writes the aggregator's JSON. The instrumentation's own cost
+is then included in the client CPU figures.
+
+Usage:
+    ./load-test.py --concurrency 50 --requests 500 --token-rate 500
+    ./load-test.py --url http://127.0.0.1:13131 --concurrency 8 --json
+    ./load-test.py --message "please run ls" --breakdown --metrics-output metrics.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from moltis_client import ErrorEvent, MoltisClient, TextEvent
+from moltis_metrics import MetricsAggregator
+
+STUB = Path(__file__).with_name("stub-gateway.py")
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of `values` (q in 0-100), or None if empty"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def start_stub(args: argparse.Namespace) -> Tuple[subprocess.Popen, str]:
+    """Start the stub gateway on a free port; returns (process, base URL)"""
+    process = subprocess.Popen(
+        [sys.executable, str(STUB), "--port", "0", "--tokens", str(args.tokens),
+         "--token-rate", str(args.token_rate), "--latency", str(args.latency),
+         "--drop-after", str(args.drop_after)],
+        stdout=subprocess.PIPE, text=True)
+    url = process.stdout.readline().strip()
+    if not url:
+        process.kill()
+        raise RuntimeError("Stub gateway failed to start")
+    return process, url
+
+
+async def one_request(client: MoltisClient, message: str) -> Dict:
+    """Timings of one chat stream, in seconds from when it was sent"""
+    started = time.perf_counter()
+    first_token = None
+    tokens = 0
+    error = None
+    try:
+        async for event in client.stream_events(message):
+            if event.__class__ is TextEvent:
+                tokens += 1
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+            elif event.__class__ is ErrorEvent:
+                error = event.message
+    except (ConnectionError, OSError) as e:
+        error = str(e)
+    return {"ttft": first_token, "latency": time.perf_counter() - started, "tokens": tokens, "error": error}
+
+
+async def run_load(url: str, concurrency: int, requests: int, message: str,
+                   observer: Optional[MetricsAggregator] = None) -> Dict:
+    client = MoltisClient(url, observer=observer)
+    await client.connect()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited() -> Dict:
+        async with semaphore:
+            return await one_request(client, message)
+
+    try:
+        # Open the socket first, so connection setup is not billed to the first requests
+        await client.open_websocket()
+        cpu_started, wall_started = time.process_time(), time.perf_counter()
+        results = await asyncio.gather(*(limited() for _ in range(requests)))
+        wall = time.perf_counter() - wall_started
+        cpu = time.process_time() - cpu_started
+    finally:
+        await client.close()
+
+    ok = [r for r in results if r["error"] is None]
+    ttfts = [r["ttft"] for r in ok if r["ttft"] is not None]
+    latencies = [r["latency"] for r in ok]
+    tokens = sum(r["tokens"] for r in results)
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": len(results) - len(ok),
+        "wall_s": wall,
+        "tokens": tokens,
+        "tokens_per_s": tokens / wall if wall else 0.0,
+        "ttft_s": {f"p{q}": percentile(ttfts, q) for q in (50, 95, 99)},
+        "latency_s": {f"p{q}": percentile(latencies, q) for q in (50, 95, 99)},
+        "client_cpu_s": cpu,
+        "client_cpu_share": cpu / wall if wall else 0.0,
+        "client_cpu_us_per_token": cpu / tokens * 1e6 if tokens else None,
+    }
+
+
+def format_report(report: Dict) -> str:
+    def ms(value: Optional[float]) -> str:
+        return f"{value * 1000:8.1f}" if value is not None else "       -"
+
+    lines = [
+        f"{report['requests']} requests, {report['concurrency']} concurrent, "
+        f"{report['errors']} errors, {report['wall_s']:.2f}s",
+        f"  {'':12s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s}",
+        f"  {'TTFT':12s} " + " ".join(ms(report["ttft_s"][p]) for p in ("p50", "p95", "p99")),
+        f"  {'completion':12s} " + " ".join(ms(report["latency_s"][p]) for p in ("p50", "p95", "p99")),
+        f"  tokens: {report['tokens']} ({report['tokens_per_s']:.0f}/s)",
+        f"  client CPU: {report['client_cpu_s']:.2f}s ({report['client_cpu_share']:.0%} of one core"
+        + (f", {report['client_cpu_us_per_token']:.1f} us/token)" if report["client_cpu_us_per_token"] else ")"),
+    ]
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test MoltisClient against a gateway or the stub")
+    parser.add_argument("--url", help="Gateway base URL (default: start stub-gateway.py)")
+    parser.add_argument("--concurrency", type=int, default=10, help="Streams in flight (default: 10)")
+    parser.add_argument("--requests", type=int, default=100, help="Total streams (default: 100)")
+    parser.add_argument("--message", default="Say something", help="Message sent on every stream")
+    parser.add_argument("--tokens", type=int, default=50, help="Stub: text chunks per reply (default: 50)")
+    parser.add_argument("--token-rate", type=float, default=100.0,
+                        help="Stub: text chunks per second per reply (default: 100)")
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="Stub: seconds before the first event (default: 0.2)")
+    parser.add_argument("--drop-after", type=int, default=0,
+                        help="Stub: abort each connection after this many events (default: never)")
+    parser.add_argument("--breakdown", action="store_true",
+                        help="Instrument the client and print per-phase latency histograms")
+    parser.add_argument("--metrics-output", metavar="FILE",
+                        help="Instrument the client and write its metrics as JSON to FILE")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    observer = MetricsAggregator() if args.breakdown or args.metrics_output else None
+    stub = None
+    url = args.url
+    if url is None:
+        stub, url = start_stub(args)
+    try:
+        report = asyncio.run(run_load(url, args.concurrency, args.requests, args.message, observer))
+    finally:
+        if stub is not None:
+            stub.terminate()
+            stub.wait()
+
+    report["url"] = url if args.url else "stub"
+    if args.json:
+        if observer is not None:
+            report["metrics"] = observer.as_dict()
+        print(json.dumps(report, indent=2))
+    else:
+        print(format_report(report))
+        if args.breakdown:
+            print(observer.format_text())
+    if args.metrics_output:
+        with open(args.metrics_output, "w") as f:
+            observer.write_json(f)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\nInterrupted")
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
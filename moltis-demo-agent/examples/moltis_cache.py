@@ -0,0 +1,194 @@
+"""
+Opt-in reply cache for repeatable chat prompts.
+
+MoltisClient(reply_cache=ReplyCache(...)) records the event stream of each
+completed reply and replays it, without a gateway round trip, the next time
+the same prompt is sent. Entries are keyed by gateway URL, agent, model and
+the message with whitespace normalized (stripped, and runs of whitespace
+collapsed to one space).
+
+There are two tiers. An in-memory LRU holds up to `max_entries` replies. With
+a `directory`, replies are also written to disk, one JSON file each, so they
+survive restarts and can be shared between processes. The disk tier is
+evicted least recently used first once it grows past `max_disk_bytes`. Both
+tiers expire entries `ttl` seconds after they were recorded.
+
+Only replies that are safe to replay are stored: ones that ended with "done",
+lost no events to a drop_oldest buffer, and ran no tools. A tool's output can
+change from one run to the next and running it may have side effects, so
+requests that run tools always go to the gateway. Whether a prompt runs tools
+is only known from its reply, so the first run of such a prompt is never
+cached and later runs are never served from the cache.
+
+The client only calls key(), get(), put() and cacheable(), so any object with
+those methods can stand in for ReplyCache, e.g. one backed by a shared store.
+"""
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Event types that make a reply unsafe to replay
+TOOL_EVENTS = frozenset(("tool_start", "tool_end"))
+
+
+def normalize_message(message: str) -> str:
+    """The message as used in cache keys: stripped, whitespace runs collapsed"""
+    return " ".join(message.split())
+
+
+class ReplyCache:
+    """In-memory LRU of recorded replies, optionally backed by a directory"""
+    
+    def __init__(self, directory: Optional[str] = None, ttl: float = 3600.0, max_entries: int = 256,
+                 max_disk_bytes: int = 64 * 1024 * 1024):
+        self.directory = Path(directory) if directory is not None else None
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        # key -> (time.time() when recorded, events)
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        # File name -> size, least recently used first; built on first disk access
+        self._disk_index: Optional["OrderedDict[str, int]"] = None
+        self._disk_bytes = 0
+        
+    @staticmethod
+    def key(gateway: str, agent: Optional[str], model: Optional[str], message: str) -> str:
+        material = json.dumps([gateway, agent, model, normalize_message(message)])
+        return hashlib.sha256(material.encode()).hexdigest()
+        
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """The recorded events for `key`, or None on a miss or an expired entry"""
+        entry = self._memory.get(key)
+        if entry is not None:
+            if time.time() - entry[0] < self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._memory[key]
+            
+        events = self._read(key) if self.directory is not None else None
+        if events is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return events
+        
+    def put(self, key: str, events: List[Dict[str, Any]]):
+        stored_at = time.time()
+        self._remember(key, stored_at, events)
+        if self.directory is not None:
+            self._write(key, stored_at, events)
+        self.stores += 1
+        
+    def invalidate(self, key: Optional[str] = None):
+        """Drop one entry, or everything, from both tiers"""
+        keys = [key] if key is not None else list(self._memory) + [name[:-5] for name in self._index()]
+        for k in keys:
+            self._memory.pop(k, None)
+            if self.directory is not None:
+                self._remove(f"{k}.json")
+                
+    @staticmethod
+    def cacheable(events: List[Dict[str, Any]]) -> bool:
+        """Whether a recorded reply may be stored: it finished, and ran no tools"""
+        if not events:
+            return False
+        last = events[-1].get("result")
+        if "error" in events[-1] or not isinstance(last, dict) or last.get("type") != "done":
+            return False
+        for event in events:
+            result = event.get("result")
+            if isinstance(result, dict) and result.get("type") in TOOL_EVENTS:
+                return False
+        return True
+        
+    def _remember(self, key: str, stored_at: float, events: List[Dict[str, Any]]):
+        self._memory[key] = (stored_at, events)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            
+    def _index(self) -> "OrderedDict[str, int]":
+        """Sizes of the cache files, least recently used first"""
+        if self._disk_index is None:
+            self._disk_index = OrderedDict()
+            if self.directory is not None:
+                try:
+                    files = [entry for entry in os.scandir(self.directory)
+                             if entry.name.endswith(".json") and entry.is_file()]
+                    for entry in sorted(files, key=lambda entry: entry.stat().st_mtime):
+                        self._disk_index[entry.name] = entry.stat().st_size
+                except OSError:
+                    # Not created yet, or unreadable: start from an empty index
+                    pass
+            self._disk_bytes = sum(self._disk_index.values())
+        return self._disk_index
+        
+    def _read(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        name = f"{key}.json"
+        path = self.directory / name
+        try:
+            with open(path, encoding="utf-8") as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            # Unreadable or half-written by a crashed process: treat as a miss
+            self._remove(name)
+            return None
+        if time.time() - record["stored_at"] >= self.ttl:
+            self._remove(name)
+            return None
+        # Mark as recently used, for eviction here and in other processes
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        index = self._index()
+        if name in index:
+            index.move_to_end(name)
+        events = record["events"]
+        self._remember(key, record["stored_at"], events)
+        return events
+        
+    def _write(self, key: str, stored_at: float, events: List[Dict[str, Any]]):
+        name = f"{key}.json"
+        path = self.directory / name
+        tmp = path.with_suffix(f".tmp{os.getpid()}")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"stored_at": stored_at, "events": events}, f, separators=(",", ":"))
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError):
+            # Unwritable directory, full disk or unserializable events: keep
+            # the reply in memory only, like an unreadable file is a miss
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+            
+        index = self._index()
+        self._disk_bytes -= index.pop(name, 0)
+        index[name] = path.stat().st_size
+        self._disk_bytes += index[name]
+        while self._disk_bytes > self.max_disk_bytes and len(index) > 1:
+            self._remove(next(iter(index)))
+            
+    def _remove(self, name: str):
+        index = self._index()
+        self._disk_bytes -= index.pop(name, 0)
+        try:
+            os.remove(self.directory / name)
+        except OSError:
+            # Already gone, or the directory is unusable: nothing to evict
+            pass
@@ -0,0 +1,912 @@
+"""
+Moltis gateway client: chat streaming over a shared WebSocket and a pooled,
+cached REST layer for sessions. See python-client.py for usage examples.
+
+Chat events come either as raw JSON-RPC dicts (MoltisClient.send_message) or
+as typed events (MoltisClient.stream_events): TextEvent, ThinkingEvent,
+ToolStartEvent, ToolEndEvent and DoneEvent, plus ErrorEvent for JSON-RPC
+errors and UnknownEvent for result types this module does not know yet.
+Incoming messages are decoded with orjson when it is installed.
+"""
+
+import asyncio
+import itertools
+import json
+import random
+import sys
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Callable, Dict, Any, Iterable, List, Optional, Tuple, Type, Union
+import websockets
+import aiohttp
+
+from moltis_metrics import RequestMetrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON-RPC error code for an unsupported method
+METHOD_NOT_FOUND = -32601
+
+# What a full per-request event buffer does with the next event
+OVERFLOW_POLICIES = ("block", "drop_oldest", "coalesce")
+
+# Default decoder for incoming WebSocket messages (str or bytes)
+default_json_loads: Callable[[Union[str, bytes]], Any] = orjson.loads if orjson is not None else json.loads
+
+
+def is_final_event(event: Dict[str, Any]) -> bool:
+    """Whether an event ends its request's stream (a JSON-RPC error or a "done" result)"""
+    result = event.get("result")
+    return "error" in event or (isinstance(result, dict) and result.get("type") == "done")
+
+
+class ChatEvent:
+    """A typed chat event; `raw` is the JSON-RPC result (or error) it was built from"""
+    
+    __slots__ = ("raw",)
+    
+    type: Optional[str] = None
+    # Whether the event ends its request's stream
+    final = False
+    
+    def __init__(self, raw: Any):
+        self.raw = raw
+        
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class TextEvent(ChatEvent):
+    """A chunk of the reply text"""
+    
+    __slots__ = ("text",)
+    
+    type = "text"
+    
+    def __init__(self, raw: Dict[str, Any]):
+        self.raw = raw
+        self.text = raw.get("text", "")
+
+
+class ThinkingEvent(ChatEvent):
+    """A thinking indicator"""
+    
+    __slots__ = ("text",)
+    
+    type = "thinking"
+    
+    def __init__(self, raw: Dict[str, Any]):
+        self.raw = raw
+        self.text = raw.get("text", "")
+
+
+class ToolStartEvent(ChatEvent):
+    """A tool call starting"""
+    
+    __slots__ = ("name", "input")
+    
+    type = "tool_start"
+    
+    def __init__(self, raw: Dict[str, Any]):
+        self.raw = raw
+        tool = raw.get("tool") or {}
+        self.name = tool.get("name", "unknown")
+        self.input = tool.get("input", {})
+
+
+class ToolEndEvent(ChatEvent):
+    """A tool call finished; `output` holds status, stdout and the like"""
+    
+    __slots__ = ("status", "output")
+    
+    type = "tool_end"
+    
+    def __init__(self, raw: Dict[str, Any]):
+        self.raw = raw
+        self.output = raw.get("output") or {}
+        self.status = self.output.get("status", "unknown")
+
+
+class DoneEvent(ChatEvent):
+    """The reply is complete"""
+    
+    __slots__ = ()
+    
+    type = "done"
+    final = True
+
+
+class ErrorEvent(ChatEvent):
+    """A JSON-RPC error answering the request"""
+    
+    __slots__ = ("code", "message")
+    
+    type = "error"
+    final = True
+    
+    def __init__(self, raw: Any):
+        self.raw = raw
+        if isinstance(raw, dict):
+            self.code = raw.get("code")
+            self.message = raw.get("message", "JSON-RPC error")
+        else:
+            self.code = None
+            self.message = str(raw)
+
+
+class UnknownEvent(ChatEvent):
+    """A result of a type without its own class; see `raw`"""
+    
+    __slots__ = ()
+    
+    @property
+    def type(self) -> Optional[str]:
+        return self.raw.get("type") if isinstance(self.raw, dict) else None
+
+
+# Result "type" -> event class
+EVENT_TYPES: Dict[str, Type[ChatEvent]] = {
+    cls.type: cls for cls in (TextEvent, ThinkingEvent, ToolStartEvent, ToolEndEvent, DoneEvent)
+}
+
+
+def parse_event(event: Dict[str, Any]) -> ChatEvent:
+    """The typed event for a decoded JSON-RPC message"""
+    result = event.get("result")
+    if result.__class__ is dict:
+        return EVENT_TYPES.get(result.get("type"), UnknownEvent)(result)
+    if "error" in event:
+        return ErrorEvent(event["error"])
+    return UnknownEvent(result)
+
+
+async def collect_reply(events: AsyncIterator[ChatEvent]) -> str:
+    """
+    The full reply text of a typed event stream
+    
+    Chunks are joined once at the end rather than concatenated as they arrive.
+    
+    Raises:
+        RuntimeError: If the stream ends with a JSON-RPC error
+    """
+    parts = []
+    append = parts.append
+    async for event in events:
+        if event.__class__ is TextEvent:
+            append(event.text)
+        elif event.__class__ is ErrorEvent:
+            raise RuntimeError(f"Chat request failed: {event.message}")
+    return "".join(parts)
+
+
+class _CachedResponse:
+    """A cached GET response body with its ETag"""
+    
+    __slots__ = ("body", "etag", "stored_at")
+    
+    def __init__(self, body: Any, etag: Optional[str]):
+        self.body = body
+        self.etag = etag
+        self.stored_at = time.monotonic()
+
+
+class ResponseCache:
+    """LRU cache of GET responses by URL
+    
+    Entries are served without a request for `ttl` seconds. After that they
+    are kept for revalidation: if the entry has an ETag, the next request
+    sends If-None-Match and a 304 reply renews the entry without a body.
+    The least recently used entries are evicted beyond `max_entries`.
+    """
+    
+    def __init__(self, ttl: float = 30.0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _CachedResponse]" = OrderedDict()
+        
+    def get(self, url: str) -> Optional[_CachedResponse]:
+        entry = self._entries.get(url)
+        if entry is not None:
+            self._entries.move_to_end(url)
+        return entry
+        
+    def is_fresh(self, entry: _CachedResponse) -> bool:
+        return time.monotonic() - entry.stored_at < self.ttl
+        
+    def put(self, url: str, body: Any, etag: Optional[str]):
+        self._entries[url] = _CachedResponse(body, etag)
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            
+    def invalidate(self, url: Optional[str] = None):
+        """Drop one URL, or everything"""
+        if url is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(url, None)
+
+
+class EventBuffer:
+    """Bounded queue of one request's incoming events
+    
+    Holds at most `maxsize` events. When full, the next event is handled by
+    `policy`:
+      - "block": the WebSocket reader waits for the consumer. This holds up
+        every request on the connection, and the socket then stops reading,
+        so the gateway is slowed down by TCP flow control.
+      - "drop_oldest": the oldest buffered event is discarded (see `dropped`).
+      - "coalesce": a text chunk is appended to the text of the newest buffered
+        event when that is a text chunk too (see `coalesced`), so no text is
+        lost; other events block as above.
+    Errors and final events are always accepted, so a stream can always end.
+    """
+    
+    def __init__(self, maxsize: int = 1024, policy: str = "block"):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {policy!r}; choose from {', '.join(OVERFLOW_POLICIES)}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self.coalesced = 0
+        self.closed = False
+        self._events: deque = deque()
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        
+    def __len__(self) -> int:
+        return len(self._events)
+        
+    def offer(self, event: Any) -> bool:
+        """Buffer an event without waiting; False if the caller has to await put()"""
+        events = self._events
+        if len(events) >= self.maxsize and not self.closed and not _ends_stream(event):
+            if self.policy == "coalesce" and self._coalesce(event):
+                return True
+            if self.policy != "drop_oldest":
+                return False
+            events.popleft()
+            self.dropped += 1
+        if not self.closed:
+            events.append(event)
+            self._readable.set()
+        return True
+        
+    async def put(self, event: Any):
+        """Buffer an event, waiting for room if the policy blocks"""
+        while not self.offer(event):
+            self._writable.clear()
+            await self._writable.wait()
+            
+    async def get(self) -> Any:
+        while not self._events:
+            self._readable.clear()
+            await self._readable.wait()
+        event = self._events.popleft()
+        self._writable.set()
+        return event
+        
+    def close(self):
+        """Discard buffered and future events, releasing a blocked put()"""
+        self.closed = True
+        self._events.clear()
+        self._writable.set()
+        
+    def _coalesce(self, event: Any) -> bool:
+        tail = self._events[-1] if self._events else None
+        text = _text_chunk(event)
+        tail_text = _text_chunk(tail)
+        if text is None or tail_text is None:
+            return False
+        # Later fields (seq, for resuming) come from the newer chunk
+        self._events[-1] = {**event, "result": {**event["result"], "text": tail_text + text}}
+        self.coalesced += 1
+        return True
+
+
+def _ends_stream(event: Any) -> bool:
+    return isinstance(event, Exception) or is_final_event(event)
+
+
+def _text_chunk(event: Any) -> Optional[str]:
+    """The text of a raw text event, None for anything else"""
+    if not isinstance(event, dict):
+        return None
+    result = event.get("result")
+    if isinstance(result, dict) and result.get("type") == "text":
+        return result.get("text", "")
+    return None
+
+
+class _ChatStream:
+    """An in-flight chat request: its buffer and how far its reply has got"""
+    
+    __slots__ = ("buffer", "request", "ws", "run_id", "seq", "resuming", "resumes", "metrics")
+    
+    def __init__(self, buffer: EventBuffer, request: Dict[str, Any]):
+        self.buffer = buffer
+        # The chat.send request, kept in case it has to be sent again
+        self.request = request
+        # The socket the request was sent (or resumed) on
+        self.ws = None
+        self.run_id = request["params"]["run_id"]
+        # Sequence number of the last event received, once the gateway tags them
+        self.seq = None
+        self.resuming = False
+        # Resumes in a row on sockets that delivered nothing
+        self.resumes = 0
+        # Set when the client has an observer
+        self.metrics: Optional[RequestMetrics] = None
+
+
+class MoltisClient:
+    """Simple Moltis API client
+    
+    Chat requests share one long-lived WebSocket per client, opened on first
+    use. Every request gets its own JSON-RPC id, and a background reader routes
+    incoming events to the stream of the request they belong to, so several
+    chat.send calls can run over the same connection at once.
+    
+    Each request's events wait in a bounded EventBuffer of
+    `max_buffered_events`, with the `overflow` policy deciding what happens
+    when a consumer falls behind.
+    
+    If the socket drops while requests are in flight, the client reconnects,
+    retrying up to `reconnect_attempts` times with exponential backoff
+    (`reconnect_backoff` seconds doubling up to `reconnect_backoff_max`, with
+    jitter), and resumes them where the gateway allows it. Every chat.send
+    carries a client-chosen "run_id". After a reconnect, a chat.resume call
+    asks for that run's events after the last "seq" received, and the stream
+    carries on; replayed events already seen are skipped. If the gateway
+    supports chat.resume but has no record of the run, the chat.send never
+    reached it, so it is sent again. Requests the gateway cannot resume fail
+    with ConnectionError.
+    
+    With an `observer` (see moltis_metrics), every chat request is timed:
+    connection setup, first event, first text, gaps between text chunks, tool
+    durations, bytes received and total latency. Without one no metrics are
+    kept.
+    
+    With a `reply_cache` (see moltis_cache.ReplyCache), replies that finished
+    without running tools are recorded, and sending the same message to the
+    same agent and model again replays the recorded events instead of making
+    a request. Pass cache=False to a call to always ask the gateway. Replayed
+    events are shared with the cache, so treat them as read-only, and are not
+    reported to the observer.
+    
+    Incoming messages are decoded with `default_json_loads` (orjson when
+    installed, otherwise the json module), or with the `json_loads` given: any
+    callable taking str or bytes and raising ValueError on bad input.
+    
+    REST calls go through one pooled HTTP session with keep-alive, and GET
+    responses are cached (see ResponseCache). Cached bodies are shared between
+    callers, so treat them as read-only.
+    """
+    
+    def __init__(self, base_url: str = "https://localhost:13131", max_connections: int = 32,
+                 cache_ttl: float = 30.0, cache_size: int = 1024,
+                 json_loads: Optional[Callable[[Union[str, bytes]], Any]] = None,
+                 max_buffered_events: int = 1024, overflow: str = "block",
+                 reconnect_attempts: int = 5, reconnect_backoff: float = 0.5,
+                 reconnect_backoff_max: float = 10.0, observer=None, reply_cache=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}; choose from {', '.join(OVERFLOW_POLICIES)}")
+        self.base_url = base_url
+        self.ws_url = base_url.replace("https://", "wss://").replace("http://", "ws://")
+        self.session = None
+        self.max_connections = max_connections
+        self.cache = ResponseCache(cache_ttl, cache_size)
+        self.json_loads = json_loads or default_json_loads
+        self.max_buffered_events = max_buffered_events
+        self.overflow = overflow
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_backoff = reconnect_backoff
+        self.reconnect_backoff_max = reconnect_backoff_max
+        self.observer = observer
+        self.reply_cache = reply_cache
+        self._ws = None
+        self._reader: Optional[asyncio.Task] = None
+        # Reconnects and resends in progress
+        self._tasks = set()
+        self._closing = False
+        self._ws_lock = asyncio.Lock()
+        self._ids = itertools.count(1)
+        self._run_prefix = uuid.uuid4().hex[:12]
+        self._streams: Dict[int, _ChatStream] = {}
+        
+    async def connect(self):
+        """Initialize the pooled HTTP session"""
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_connections,
+            ttl_dns_cache=300,
+            keepalive_timeout=60,
+        )
+        self.session = aiohttp.ClientSession(connector=connector)
+        
+    async def open_websocket(self):
+        """Open the shared WebSocket now, instead of on the first chat request
+        
+        Useful when connection setup should not count against the first
+        request, e.g. when timing requests.
+        """
+        await self._websocket()
+        
+    async def close(self):
+        """Close the WebSocket and HTTP session"""
+        self._closing = True
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._ws is not None:
+            await self._ws.close()
+        if self._reader is not None:
+            await self._reader
+            self._reader = None
+        if self.session:
+            await self.session.close()
+            
+    async def _websocket(self, retries: int = 0):
+        """The shared WebSocket, connecting on first use or after it dropped
+        
+        Failed connection attempts are retried up to `retries` times with
+        exponential backoff.
+        """
+        async with self._ws_lock:
+            delay = self.reconnect_backoff
+            while self._ws is None:
+                started = time.perf_counter()
+                try:
+                    self._ws = await websockets.connect(
+                        f"{self.ws_url}/ws",
+                        ssl=None  # Skip SSL verification for local dev
+                    )
+                except (OSError, asyncio.TimeoutError, websockets.InvalidHandshake):
+                    if retries <= 0:
+                        raise
+                    retries -= 1
+                    await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+                    delay = min(delay * 2, self.reconnect_backoff_max)
+                    continue
+                if self.observer is not None:
+                    self.observer.connected(time.perf_counter() - started)
+                self._reader = asyncio.create_task(self._read_events(self._ws))
+            return self._ws
+            
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        
+    def _route(self, event: Dict[str, Any]) -> Optional[_ChatStream]:
+        """The stream of the request an event answers, None to drop the event
+        
+        Also tracks the sequence number the gateway tags events with, for
+        resuming, filters out events replayed after a resume, and handles
+        refused resumes.
+        """
+        request_id = event.get("id")
+        if request_id is None and len(self._streams) == 1:
+            # Untagged notifications can only belong to the one request in flight
+            request_id = next(iter(self._streams))
+        stream = self._streams.get(request_id)
+        if stream is None:
+            return None
+        result = event.get("result")
+        if result.__class__ is dict:
+            seq = result.get("seq")
+            if seq is not None:
+                if stream.seq is not None and seq <= stream.seq:
+                    return None
+                stream.seq = seq
+            stream.resuming = False
+        elif stream.resuming and "error" in event:
+            stream.resuming = False
+            error = event["error"]
+            code = error.get("code") if isinstance(error, dict) else None
+            if stream.seq is None and code is not None and code != METHOD_NOT_FOUND:
+                # The gateway resumes runs but does not know this one
+                self._spawn(self._resend(request_id, stream))
+            else:
+                message = error.get("message", error) if isinstance(error, dict) else error
+                stream.buffer.offer(ConnectionError(
+                    f"WebSocket closed before the reply finished (resume failed: {message})"))
+            return None
+        return stream
+        
+    async def _read_events(self, ws):
+        """Read the socket until it closes, then resume or fail the requests still waiting on it"""
+        loads = self.json_loads
+        route = self._route
+        delivered = False
+        try:
+            async for raw_message in ws:
+                try:
+                    event = loads(raw_message)
+                except ValueError:
+                    print(f"Failed to parse message: {raw_message}", file=sys.stderr)
+                    continue
+                if isinstance(event, dict):
+                    stream = route(event)
+                    if stream is None:
+                        continue
+                    delivered = True
+                    if stream.metrics is not None:
+                        size = len(raw_message) if isinstance(raw_message, bytes) else len(raw_message.encode())
+                        stream.metrics.observe(event, size)
+                    if not stream.buffer.offer(event):
+                        # Full, with the "block" policy: stop reading until there is room
+                        await stream.buffer.put(event)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            if self._ws is ws:
+                self._ws = None
+            streams = [(request_id, stream) for request_id, stream in self._streams.items() if stream.ws is ws]
+            if delivered:
+                # The gateway was making progress, if not on every stream
+                for _, stream in streams:
+                    stream.resumes = 0
+            if streams and not self._closing:
+                self._spawn(self._resume_streams(streams))
+            else:
+                self._fail_streams([stream for _, stream in streams])
+                
+    def _fail_streams(self, streams, reason: str = ""):
+        for stream in streams:
+            error = ConnectionError(f"WebSocket closed before the reply finished{reason}")
+            if stream.metrics is not None and stream.metrics.error is None:
+                stream.metrics.error = str(error)
+            stream.buffer.offer(error)
+            
+    async def _resume_streams(self, streams):
+        """Reconnect after the socket dropped and ask for the rest of each reply"""
+        # Streams resumed `reconnect_attempts` times in a row on sockets that
+        # then delivered nothing have used up their retries
+        self._fail_streams([stream for _, stream in streams if stream.resumes >= self.reconnect_attempts],
+                           " (resume attempts exhausted)")
+        streams = [(request_id, stream) for request_id, stream in streams
+                   if stream.resumes < self.reconnect_attempts]
+        if not streams:
+            return
+        try:
+            ws = await self._websocket(self.reconnect_attempts)
+        except Exception as e:
+            # Nothing else will wake these streams up, so fail them whatever went wrong
+            self._fail_streams([stream for _, stream in streams], f" (reconnect failed: {e})")
+            return
+        # Moved to the new socket before any await, so if it drops too its
+        # reader resumes them again
+        for _, stream in streams:
+            stream.ws = ws
+            stream.resuming = True
+            stream.resumes += 1
+            if stream.metrics is not None:
+                stream.metrics.reconnects += 1
+        try:
+            for request_id, stream in streams:
+                await ws.send(json.dumps({
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "method": "chat.resume",
+                    "params": {
+                        "run_id": stream.run_id,
+                        "after": stream.seq,
+                    }
+                }))
+        except websockets.ConnectionClosed:
+            pass
+            
+    async def _resend(self, request_id: int, stream: _ChatStream):
+        try:
+            await self._send_request(stream)
+        except Exception as e:
+            if self._streams.get(request_id) is stream:
+                self._fail_streams([stream], f" (resend failed: {e})")
+                
+    async def _send_request(self, stream: _ChatStream):
+        """Send a stream's chat.send, on a new socket if the current one closes under us"""
+        ws = await self._websocket()
+        for attempt in range(self.reconnect_attempts + 1):
+            stream.ws = ws
+            try:
+                await ws.send(json.dumps(stream.request))
+                return
+            except websockets.ConnectionClosed:
+                # The request was never sent: send it again on a new socket
+                if attempt == self.reconnect_attempts:
+                    break
+                if self._ws is ws:
+                    self._ws = None
+                ws = await self._websocket(self.reconnect_attempts)
+        raise ConnectionError("WebSocket closed before the request was sent")
+        
+    async def _start_chat(self, message: str, model: Optional[str],
+                          agent: Optional[str] = None) -> Tuple[int, EventBuffer]:
+        """Send chat.send; returns the request id and the buffer its events are routed to"""
+        request_id = next(self._ids)
+        
+        # Send message via JSON-RPC
+        request = {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "method": "chat.send",
+            "params": {
+                "message": message,
+                "run_id": f"{self._run_prefix}-{request_id}",
+            }
+        }
+        
+        if model:
+            request["params"]["model"] = model
+        if agent:
+            request["params"]["agent"] = agent
+            
+        buffer = EventBuffer(self.max_buffered_events, self.overflow)
+        stream = self._streams[request_id] = _ChatStream(buffer, request)
+        if self.observer is not None:
+            stream.metrics = RequestMetrics(request_id)
+        try:
+            await self._send_request(stream)
+        except BaseException:
+            self._end_stream(request_id)
+            raise
+        return request_id, buffer
+        
+    def _end_stream(self, request_id: int):
+        stream = self._streams.pop(request_id, None)
+        if stream is not None:
+            # Releases the reader if it is blocked on this stream's buffer
+            stream.buffer.close()
+            if stream.metrics is not None:
+                stream.metrics.finish()
+                self.observer.request_finished(stream.metrics)
+        
+    def _reply_key(self, message: str, model: Optional[str], agent: Optional[str],
+                   cache: bool) -> Optional[str]:
+        """The reply cache key for a request, or None if it bypasses the cache"""
+        if not cache or self.reply_cache is None:
+            return None
+        return self.reply_cache.key(self.base_url, agent, model, message)
+        
+    def _replay(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """A recorded reply, renumbered as a new request"""
+        request_id = next(self._ids)
+        return [dict(event, id=request_id) for event in events]
+        
+    def _store_reply(self, key: str, events: List[Dict[str, Any]], buffer: EventBuffer):
+        # A reply that lost events to drop_oldest would replay with gaps
+        if buffer.dropped == 0 and self.reply_cache.cacheable(events):
+            self.reply_cache.put(key, events)
+            
+    async def send_message(self, message: str, model: str = None, agent: str = None,
+                           cache: bool = True) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Send a message and stream responses
+        
+        Args:
+            message: The message to send
+            model: Optional model override
+            agent: Optional agent to answer, by its name in moltis.toml
+            cache: Whether the client's reply cache, if any, may be used
+            
+        Yields:
+            Event dictionaries from the agent, ending with the "done" result
+            (or a JSON-RPC error)
+            
+        Raises:
+            ConnectionError: If the WebSocket closes before the reply finishes
+                and the request cannot be resumed
+        """
+        key = self._reply_key(message, model, agent, cache)
+        if key is not None:
+            recorded = self.reply_cache.get(key)
+            if recorded is not None:
+                for event in self._replay(recorded):
+                    yield event
+                return
+        request_id, stream = await self._start_chat(message, model, agent)
+        record = [] if key is not None else None
+        try:
+            # Stream responses routed to this request
+            while True:
+                event = await stream.get()
+                if isinstance(event, Exception):
+                    raise event
+                if record is not None:
+                    record.append(event)
+                yield event
+                if is_final_event(event):
+                    break
+        finally:
+            self._end_stream(request_id)
+            if record is not None:
+                self._store_reply(key, record, stream)
+                
+    async def stream_events(self, message: str, model: str = None, agent: str = None,
+                            cache: bool = True) -> AsyncIterator[ChatEvent]:
+        """
+        Send a message and stream typed events
+        
+        Args:
+            message: The message to send
+            model: Optional model override
+            agent: Optional agent to answer, by its name in moltis.toml
+            cache: Whether the client's reply cache, if any, may be used
+            
+        Yields:
+            ChatEvent instances, ending with a DoneEvent (or an ErrorEvent)
+            
+        Raises:
+            ConnectionError: If the WebSocket closes before the reply finishes
+                and the request cannot be resumed
+        """
+        parse = parse_event
+        key = self._reply_key(message, model, agent, cache)
+        if key is not None:
+            recorded = self.reply_cache.get(key)
+            if recorded is not None:
+                for event in self._replay(recorded):
+                    yield parse(event)
+                return
+        request_id, stream = await self._start_chat(message, model, agent)
+        record = [] if key is not None else None
+        try:
+            while True:
+                event = await stream.get()
+                if isinstance(event, Exception):
+                    raise event
+                if record is not None:
+                    record.append(event)
+                event = parse(event)
+                yield event
+                if event.final:
+                    break
+        finally:
+            self._end_stream(request_id)
+            if record is not None:
+                self._store_reply(key, record, stream)
+                
+    async def ask(self, message: str, model: str = None, agent: str = None, cache: bool = True) -> str:
+        """
+        Send a message and return the full reply text
+        
+        Raises:
+            ConnectionError: If the WebSocket closes before the reply finishes
+            RuntimeError: If the gateway answers with a JSON-RPC error
+        """
+        return await collect_reply(self.stream_events(message, model, agent, cache))
+                    
+    async def _get_json(self, path: str, store: bool = True) -> Any:
+        """
+        GET a JSON resource through the response cache
+        
+        Args:
+            path: Path (and query string) under the base URL
+            store: Whether to cache the response; bulk scans pass False so
+                they do not evict everything else, but still use fresh entries
+        """
+        url = f"{self.base_url}{path}"
+        entry = self.cache.get(url)
+        if entry is not None and self.cache.is_fresh(entry):
+            return entry.body
+            
+        headers = {"If-None-Match": entry.etag} if entry is not None and entry.etag else None
+        async with self.session.get(url, headers=headers) as response:
+            if response.status == 304 and entry is not None:
+                self.cache.put(url, entry.body, response.headers.get("ETag", entry.etag))
+                return entry.body
+            response.raise_for_status()
+            body = await response.json()
+        if store:
+            self.cache.put(url, body, response.headers.get("ETag"))
+        return body
+        
+    async def list_sessions(self) -> list:
+        """List all sessions"""
+        return await self._get_json("/api/sessions")
+            
+    async def get_session(self, session_id: str) -> dict:
+        """Get session details"""
+        return await self._get_json(f"/api/sessions/{session_id}")
+        
+    async def get_sessions(self, session_ids: Iterable[str], concurrency: int = 16) -> Dict[str, dict]:
+        """
+        Get details for many sessions, at most `concurrency` requests at a time
+        
+        Args:
+            session_ids: Session ids; duplicates are fetched once
+            concurrency: Maximum requests in flight
+            
+        Returns:
+            Session details by id, in the order the ids were given
+        """
+        ids = list(dict.fromkeys(session_ids))
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def fetch(session_id: str) -> dict:
+            async with semaphore:
+                return await self.get_session(session_id)
+                
+        tasks = [asyncio.ensure_future(fetch(session_id)) for session_id in ids]
+        try:
+            details = await asyncio.gather(*tasks)
+        finally:
+            # One failed fetch fails the batch; stop the rest
+            for task in tasks:
+                task.cancel()
+        return dict(zip(ids, details))
+        
+    async def iter_sessions(self, page_size: int = 100, with_details: bool = False,
+                            concurrency: int = 16) -> AsyncIterator[dict]:
+        """
+        Iterate over all sessions a page at a time
+        
+        Pages are requested with `limit` and `offset` query parameters, and
+        the next page is fetched while the caller works through the current
+        one. If the gateway ignores the parameters and sends the whole list
+        every time, that list is iterated once. Neither pages nor details are added to
+        the response cache.
+        
+        Args:
+            page_size: Sessions per page
+            with_details: Yield each session's details (as get_session does)
+                instead of its summary, fetching up to `concurrency` ahead
+            concurrency: Maximum detail requests in flight
+            
+        Yields:
+            Session summaries, or details with `with_details`, in listing order
+        """
+        if not with_details:
+            async for summary in self._iter_session_pages(page_size):
+                yield summary
+            return
+            
+        pending: deque = deque()
+        try:
+            async for summary in self._iter_session_pages(page_size):
+                pending.append(asyncio.ensure_future(
+                    self._get_json(f"/api/sessions/{summary['id']}", store=False)))
+                if len(pending) >= concurrency:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            # Stop the lookahead if the caller stops early or a fetch failed
+            for task in pending:
+                task.cancel()
+                
+    async def _iter_session_pages(self, page_size: int) -> AsyncIterator[dict]:
+        def fetch(offset: int) -> asyncio.Future:
+            return asyncio.ensure_future(
+                self._get_json(f"/api/sessions?limit={page_size}&offset={offset}", store=False))
+            
+        offset = 0
+        first = None
+        next_page = fetch(offset)
+        try:
+            while next_page is not None:
+                page = await next_page
+                next_page = None
+                if not page:
+                    break
+                if offset == 0:
+                    first = page[0]
+                elif page[0] == first:
+                    # The gateway ignores `offset` and starts over every time
+                    break
+                offset += len(page)
+                # A short page is the last. So is a longer one: the gateway
+                # ignored the limit and sent the whole list
+                if len(page) == page_size:
+                    next_page = fetch(offset)
+                for summary in page:
+                    yield summary
+        finally:
+            if next_page is not None:
+                next_page.cancel()
@@ -0,0 +1,237 @@
+"""
+Client-side latency and throughput metrics for MoltisClient.
+
+Pass an observer as MoltisClient(observer=...) to have every chat request
+timed. The observer is any object with two methods:
+    connected(seconds)          - a WebSocket was opened, taking `seconds`
+    request_finished(metrics)   - a chat request ended; see RequestMetrics
+MetricsAggregator is one, keeping histograms of everything in process and
+exporting them as JSON. Without an observer the client keeps no metrics at
+all, and its per-event cost is a single attribute check.
+
+Times are taken when events arrive off the socket, before they are buffered,
+so a slow consumer does not inflate them.
+"""
+
+import json
+import math
+import time
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+
+
+class RequestMetrics:
+    """Timings of one chat request, in seconds from when it was sent"""
+    
+    __slots__ = ("request_id", "started", "first_event_s", "first_text_s", "total_s",
+                 "chunk_gaps", "tools", "events", "text_chunks", "bytes_received",
+                 "reconnects", "completed", "error", "_last_text", "_tool")
+    
+    def __init__(self, request_id: int):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.first_event_s: Optional[float] = None
+        self.first_text_s: Optional[float] = None
+        self.total_s: Optional[float] = None
+        # Seconds between consecutive text chunks
+        self.chunk_gaps: List[float] = []
+        # (tool name, seconds from tool_start to tool_end)
+        self.tools: List[Tuple[str, float]] = []
+        self.events = 0
+        self.text_chunks = 0
+        # Encoded size of the messages received for this request
+        self.bytes_received = 0
+        self.reconnects = 0
+        # Whether the reply ended with "done"
+        self.completed = False
+        self.error: Optional[str] = None
+        self._last_text = 0.0
+        self._tool: Optional[Tuple[str, float]] = None
+        
+    def observe(self, event: Dict[str, Any], size: int):
+        """Record one message routed to this request"""
+        now = time.perf_counter()
+        self.events += 1
+        self.bytes_received += size
+        if self.first_event_s is None:
+            self.first_event_s = now - self.started
+        result = event.get("result")
+        kind = result.get("type") if isinstance(result, dict) else None
+        if kind == "text":
+            self.text_chunks += 1
+            if self.first_text_s is None:
+                self.first_text_s = now - self.started
+            else:
+                self.chunk_gaps.append(now - self._last_text)
+            self._last_text = now
+        elif kind == "tool_start":
+            tool = result.get("tool") or {}
+            self._tool = (tool.get("name", "unknown"), now)
+        elif kind == "tool_end":
+            if self._tool is not None:
+                name, started = self._tool
+                self.tools.append((name, now - started))
+                self._tool = None
+        elif kind == "done":
+            self.total_s = now - self.started
+            self.completed = True
+        elif "error" in event:
+            self.total_s = now - self.started
+            error = event["error"]
+            self.error = error.get("message", "JSON-RPC error") if isinstance(error, dict) else str(error)
+            
+    def finish(self):
+        """Close the record when the stream ends, however it ended"""
+        if self.total_s is None:
+            self.total_s = time.perf_counter() - self.started
+            if self.error is None:
+                self.error = "Stream ended before the reply finished"
+                
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "first_event_s": self.first_event_s,
+            "first_text_s": self.first_text_s,
+            "total_s": self.total_s,
+            "chunk_gaps_s": self.chunk_gaps,
+            "tools": [{"name": name, "seconds": seconds} for name, seconds in self.tools],
+            "events": self.events,
+            "text_chunks": self.text_chunks,
+            "bytes_received": self.bytes_received,
+            "reconnects": self.reconnects,
+            "completed": self.completed,
+            "error": self.error,
+        }
+
+
+class Histogram:
+    """Log-bucketed histogram of positive values
+    
+    Each power of two is split into SUBBUCKETS buckets, so a percentile is
+    off by at most about 1/SUBBUCKETS of the value, in constant memory for
+    any number of samples. Zero and negative values share one bucket.
+    """
+    
+    SUBBUCKETS = 16
+    
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        
+    def _bucket(self, value: float) -> Optional[int]:
+        if value <= 0:
+            return None
+        mantissa, exponent = math.frexp(value)
+        return exponent * self.SUBBUCKETS + int((mantissa - 0.5) * 2 * self.SUBBUCKETS)
+        
+    def _midpoint(self, bucket: Optional[int]) -> float:
+        if bucket is None:
+            return 0.0
+        exponent, sub = divmod(bucket, self.SUBBUCKETS)
+        return math.ldexp(0.5 + (sub + 0.5) / (2 * self.SUBBUCKETS), exponent)
+        
+    def record(self, value: float):
+        bucket = self._bucket(value)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+            
+    def percentile(self, q: float) -> Optional[float]:
+        """Approximate q-th percentile (q in 0-100), None if empty"""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(q / 100 * self.count))
+        seen = 0
+        for bucket in sorted(self.counts, key=lambda b: -math.inf if b is None else b):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(max(self._midpoint(bucket), self.min), self.max)
+        return self.max
+        
+    def as_dict(self) -> Dict[str, Any]:
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": self.total / self.count,
+            "min": self.min,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class MetricsAggregator:
+    """Observer folding every request into per-metric histograms"""
+    
+    # Histograms kept for every client, in report order
+    METRICS = ("connect_s", "first_event_s", "first_text_s", "chunk_gap_s", "total_s", "bytes_received")
+    
+    def __init__(self):
+        self.histograms: Dict[str, Histogram] = {name: Histogram() for name in self.METRICS}
+        # Tool name -> durations
+        self.tools: Dict[str, Histogram] = {}
+        self.requests = 0
+        self.completed = 0
+        self.errors = 0
+        self.reconnects = 0
+        self.bytes_received = 0
+        
+    def connected(self, seconds: float):
+        self.histograms["connect_s"].record(seconds)
+        
+    def request_finished(self, metrics: RequestMetrics):
+        histograms = self.histograms
+        self.requests += 1
+        self.completed += metrics.completed
+        self.errors += metrics.error is not None
+        self.reconnects += metrics.reconnects
+        self.bytes_received += metrics.bytes_received
+        if metrics.first_event_s is not None:
+            histograms["first_event_s"].record(metrics.first_event_s)
+        if metrics.first_text_s is not None:
+            histograms["first_text_s"].record(metrics.first_text_s)
+        gaps = histograms["chunk_gap_s"]
+        for gap in metrics.chunk_gaps:
+            gaps.record(gap)
+        for name, seconds in metrics.tools:
+            self.tools.setdefault(name, Histogram()).record(seconds)
+        if metrics.completed:
+            histograms["total_s"].record(metrics.total_s)
+        histograms["bytes_received"].record(metrics.bytes_received)
+        
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "completed": self.completed,
+            "errors": self.errors,
+            "reconnects": self.reconnects,
+            "bytes_received": self.bytes_received,
+            "histograms": {name: histogram.as_dict() for name, histogram in self.histograms.items()},
+            "tools": {name: histogram.as_dict() for name, histogram in sorted(self.tools.items())},
+        }
+        
+    def write_json(self, out: TextIO):
+        json.dump(self.as_dict(), out, indent=2)
+        out.write("\n")
+        
+    def format_text(self) -> str:
+        report = self.as_dict()
+        lines = [f"{report['requests']} requests, {report['completed']} completed, {report['errors']} errors, "
+                 f"{report['reconnects']} reconnects, {report['bytes_received']} bytes received",
+                 f"  {'':18s} {'count':>7s} {'p50':>9s} {'p90':>9s} {'p99':>9s} {'max':>9s}"]
+        rows = [(name, h) for name, h in report["histograms"].items() if name != "bytes_received"]
+        rows += [(f"tool {name}", h) for name, h in report["tools"].items()]
+        for name, h in rows:
+            if not h["count"]:
+                continue
+            lines.append(f"  {name:18s} {h['count']:7d} " + " ".join(
+                f"{h[key] * 1000:7.1f}ms" for key in ("p50", "p90", "p99", "max")))
+        return "\n".join(lines)
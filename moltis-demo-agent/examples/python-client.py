@@ -7,76 +7,20 @@ Demonstrates how to interact with Moltis gateway via WebSocket and REST API
 import asyncio
 import json
 import sys
-from typing import AsyncIterator, Dict, Any
-import websockets
-import aiohttp
+from pathlib import Path
 
+from moltis_client import (
+    DoneEvent,
+    MoltisClient,
+    TextEvent,
+    ThinkingEvent,
+    ToolEndEvent,
+    ToolStartEvent,
+)
+from moltis_cache import ReplyCache
 
-class MoltisClient:
-    """Simple Moltis API client"""
-    
-    def __init__(self, base_url: str = "https://localhost:13131"):
-        self.base_url = base_url
-        self.ws_url = base_url.replace("https://", "wss://").replace("http://", "ws://")
-        self.session = None
-        
-    async def connect(self):
-        """Initialize HTTP session"""
-        self.session = aiohttp.ClientSession()
-        
-    async def close(self):
-        """Close HTTP session"""
-        if self.session:
-            await self.session.close()
-            
-    async def send_message(self, message: str, model: str = None) -> AsyncIterator[Dict[str, Any]]:
-        """
-        Send a message and stream responses
-        
-        Args:
-            message: The message to send
-            model: Optional model override
-            
-        Yields:
-            Event dictionaries from the agent
-        """
-        # Connect to WebSocket
-        async with websockets.connect(
-            f"{self.ws_url}/ws",
-            ssl=None  # Skip SSL verification for local dev
-        ) as ws:
-            # Send message via JSON-RPC
-            request = {
-                "jsonrpc": "2.0",
-                "id": 1,
-                "method": "chat.send",
-                "params": {
-                    "message": message,
-                }
-            }
-            
-            if model:
-                request["params"]["model"] = model
-                
-            await ws.send(json.dumps(request))
-            
-            # Stream responses
-            async for raw_message in ws:
-                try:
-                    event = json.loads(raw_message)
-                    yield event
-                except json.JSONDecodeError:
-                    print(f"Failed to parse message: {raw_message}", file=sys.stderr)
-                    
-    async def list_sessions(self) -> list:
-        """List all sessions"""
-        async with self.session.get(f"{self.base_url}/api/sessions") as response:
-            return await response.json()
-            
-    async def get_session(self, session_id: str) -> dict:
-        """Get session details"""
-        async with self.session.get(f"{self.base_url}/api/sessions/{session_id}") as response:
-            return await response.json()
+# Recorded replies, kept between runs of the memory search example
+REPLY_CACHE_DIR = Path.home() / ".cache" / "moltis-demo" / "replies"
 
 
 async def example_chat():
@@ -92,32 +36,20 @@ async def example_chat():
         print(f"\n👤 User: {message}\n")
         print("🤖 DemoBot: ", end="", flush=True)
         
-        async for event in client.send_message(message):
-            # Handle different event types
-            if "result" in event:
-                # JSON-RPC result
-                result = event["result"]
-                if "type" in result:
-                    event_type = result["type"]
-                    
-                    if event_type == "text":
-                        # Text chunk
-                        print(result.get("text", ""), end="", flush=True)
-                    elif event_type == "thinking":
-                        # Thinking indicator
-                        print(f"\n[Thinking: {result.get('text', '')}]", flush=True)
-                    elif event_type == "tool_start":
-                        # Tool execution started
-                        tool = result.get("tool", {})
-                        print(f"\n[Tool: {tool.get('name', 'unknown')}]", flush=True)
-                    elif event_type == "tool_end":
-                        # Tool execution completed
-                        print("[Tool complete]", flush=True)
-                    elif event_type == "done":
-                        # Response complete
-                        print("\n\n✓ Complete")
-                        break
-                        
+        # One handler per event class; other events are ignored
+        handlers = {
+            TextEvent: lambda event: print(event.text, end="", flush=True),
+            ThinkingEvent: lambda event: print(f"\n[Thinking: {event.text}]", flush=True),
+            ToolStartEvent: lambda event: print(f"\n[Tool: {event.name}]", flush=True),
+            ToolEndEvent: lambda event: print("[Tool complete]", flush=True),
+            DoneEvent: lambda event: print("\n\n✓ Complete"),
+        }
+        
+        async for event in client.stream_events(message):
+            handler = handlers.get(type(event))
+            if handler is not None:
+                handler(event)
+                
     finally:
         await client.close()
 
@@ -135,33 +67,27 @@ async def example_tool_execution():
         print(f"\n👤 User: {message}\n")
         print("🤖 DemoBot:\n")
         
-        async for event in client.send_message(message):
-            if "result" in event:
-                result = event["result"]
-                event_type = result.get("type")
-                
-                if event_type == "text":
-                    print(result.get("text", ""), end="", flush=True)
-                elif event_type == "tool_start":
-                    tool = result.get("tool", {})
-                    print(f"\n[Executing: {tool.get('name')}]")
-                    print(f"Args: {json.dumps(tool.get('input', {}), indent=2)}")
-                elif event_type == "tool_end":
-                    output = result.get("output", {})
-                    print(f"[Result: {output.get('status', 'unknown')}]")
-                    if "stdout" in output:
-                        print(f"Output:\n{output['stdout']}")
-                elif event_type == "done":
-                    print("\n✓ Complete")
-                    break
-                    
+        async for event in client.stream_events(message):
+            if isinstance(event, TextEvent):
+                print(event.text, end="", flush=True)
+            elif isinstance(event, ToolStartEvent):
+                print(f"\n[Executing: {event.name}]")
+                print(f"Args: {json.dumps(event.input, indent=2)}")
+            elif isinstance(event, ToolEndEvent):
+                print(f"[Result: {event.status}]")
+                if "stdout" in event.output:
+                    print(f"Output:\n{event.output['stdout']}")
+            elif isinstance(event, DoneEvent):
+                print("\n✓ Complete")
+
     finally:
         await client.close()
 
 
 async def example_memory_search():
-    """Example: Search long-term memory"""
-    client = MoltisClient()
+    """Example: Search long-term memory, replaying the reply when run again"""
+    cache = ReplyCache(REPLY_CACHE_DIR, ttl=3600)
+    client = MoltisClient(reply_cache=cache)
     await client.connect()
     
     try:
@@ -172,17 +98,64 @@ async def example_memory_search():
         print(f"\n👤 User: {message}\n")
         print("🤖 DemoBot: ", end="", flush=True)
         
-        async for event in client.send_message(message):
-            if "result" in event:
-                result = event["result"]
-                event_type = result.get("type")
+        async for event in client.stream_events(message):
+            if isinstance(event, TextEvent):
+                print(event.text, end="", flush=True)
+            elif isinstance(event, DoneEvent):
+                print("\n\n✓ Complete")
                 
-                if event_type == "text":
-                    print(result.get("text", ""), end="", flush=True)
-                elif event_type == "done":
-                    print("\n\n✓ Complete")
-                    break
-                    
+        if cache.hits:
+            print("(Replayed from the reply cache)")
+        elif cache.stores:
+            print(f"(Reply cached in {REPLY_CACHE_DIR} for an hour)")
+        else:
+            print("(Not cached: the agent used tools, or the reply did not finish)")
+            
+    finally:
+        await client.close()
+
+
+async def example_concurrent_chats():
+    """Example: Several conversations at once over one WebSocket"""
+    client = MoltisClient()
+    await client.connect()
+    
+    try:
+        print("🤖 Moltis Concurrent Chats Example")
+        print("=" * 50)
+        
+        questions = [
+            "Summarize what Moltis is in one sentence",
+            "Name three tools DemoBot can use",
+            "What time zone is this machine in?",
+        ]
+        answers = await asyncio.gather(*(client.ask(question) for question in questions))
+        
+        for question, answer in zip(questions, answers):
+            print(f"\n👤 User: {question}")
+            print(f"🤖 DemoBot: {answer}")
+            
+    finally:
+        await client.close()
+
+
+async def example_scan_sessions():
+    """Example: Walk every session page by page, with details"""
+    client = MoltisClient()
+    await client.connect()
+    
+    try:
+        print("🤖 Moltis Session Scan Example")
+        print("=" * 50)
+        
+        sessions = 0
+        messages = 0
+        async for details in client.iter_sessions(page_size=100, with_details=True):
+            sessions += 1
+            messages += len(details.get("messages", []))
+            
+        print(f"\n{sessions} sessions, {messages} messages")
+        
     finally:
         await client.close()
 
@@ -194,9 +167,11 @@ async def main():
     print("\n1. Simple chat")
     print("2. Tool execution")
     print("3. Memory search")
-    print("4. Run all\n")
+    print("4. Concurrent chats (one connection)")
+    print("5. Scan all sessions")
+    print("6. Run all\n")
     
-    choice = input("Choose example (1-4): ").strip()
+    choice = input("Choose example (1-6): ").strip()
     
     if choice == "1":
         await example_chat()
@@ -205,11 +180,19 @@ async def main():
     elif choice == "3":
         await example_memory_search()
     elif choice == "4":
+        await example_concurrent_chats()
+    elif choice == "5":
+        await example_scan_sessions()
+    elif choice == "6":
         await example_chat()
         print("\n" + "=" * 50 + "\n")
         await example_tool_execution()
         print("\n" + "=" * 50 + "\n")
         await example_memory_search()
+        print("\n" + "=" * 50 + "\n")
+        await example_concurrent_chats()
+        print("\n" + "=" * 50 + "\n")
+        await example_scan_sessions()
     else:
         print("Invalid choice")
 
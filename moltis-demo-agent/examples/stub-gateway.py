@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Stub Moltis gateway for offline testing and load generation
+
+Speaks the same protocol as the real gateway, closely enough for
+MoltisClient: JSON-RPC chat.send over /ws, with the reply streamed as
+text events, plus GET /api/sessions (paginated with ?limit=&offset=) and
+/api/sessions/{id} with ETags.
+Replies are synthetic: a thinking event, then after --latency seconds
+--tokens text chunks streamed at --token-rate tokens per second per reply. A message containing
+"run " first goes through one tool_start/tool_end pair lasting --tool-latency
+seconds.
+
+Every result carries the reply's "run_id" (the one chat.send gave, if any)
+and a per-run "seq". A run outlives
+the socket it was started on (for --retention seconds after it ends), and
+chat.resume with {"run_id", "after": seq} replays the rest of it, so clients
+can resume after a dropped connection. --drop-after N aborts each connection
+after N events, to exercise that.
+
+Usage:
+    ./stub-gateway.py --port 13131 --token-rate 200 --latency 0.3
+    ./stub-gateway.py --port 0    # pick a free port; the URL is printed on stdout
+    ./stub-gateway.py --drop-after 100    # a flaky connection
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import sys
+import time
+from typing import Dict, List, Optional
+
+from aiohttp import WSMsgType, web
+
+
+class _Connection:
+    """One client socket and the events sent on it so far"""
+
+    __slots__ = ("ws", "transport", "sent")
+
+    def __init__(self, ws: web.WebSocketResponse, transport):
+        self.ws = ws
+        self.transport = transport
+        self.sent = 0
+
+
+class _Run:
+    """One reply's events, and where they are being delivered"""
+
+    __slots__ = ("run_id", "events", "connection", "request_id")
+
+    def __init__(self, run_id: str, connection: _Connection, request_id):
+        self.run_id = run_id
+        self.events: List[dict] = []
+        self.connection: Optional[_Connection] = connection
+        self.request_id = request_id
+
+
+class StubGateway:
+    """Synthetic chat streams and session listings"""
+
+    def __init__(self, tokens: int = 50, token_rate: float = 100.0, latency: float = 0.2,
+                 tool_latency: float = 0.5, sessions: int = 100, rest_latency: float = 0.0,
+                 drop_after: int = 0, retention: float = 60.0):
+        self.tokens = tokens
+        self.token_rate = token_rate
+        self.latency = latency
+        self.tool_latency = tool_latency
+        self.sessions = sessions
+        self.rest_latency = rest_latency
+        self.drop_after = drop_after
+        self.retention = retention
+        self.runs: Dict[str, _Run] = {}
+        self._run_ids = itertools.count(1)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/ws", self.handle_ws)
+        app.router.add_get("/api/sessions", self.handle_list)
+        app.router.add_get("/api/sessions/{session_id}", self.handle_get)
+        return app
+
+    async def handle_ws(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        connection = _Connection(ws, request.transport)
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            try:
+                rpc = json.loads(msg.data)
+            except json.JSONDecodeError:
+                await self.error(ws, None, -32700, "Parse error")
+                continue
+            method = rpc.get("method")
+            params = rpc.get("params") or {}
+            if method == "chat.send":
+                run_id = params.get("run_id") or f"run-{next(self._run_ids)}"
+                run = _Run(run_id, connection, rpc.get("id"))
+                self.runs[run.run_id] = run
+                # Replies stream concurrently, interleaved on the one socket,
+                # and carry on if it closes
+                asyncio.ensure_future(self.reply(run, str(params.get("message", ""))))
+            elif method == "chat.resume":
+                run = self.runs.get(params.get("run_id"))
+                if run is None:
+                    await self.error(ws, rpc.get("id"), -32602, "Unknown run")
+                else:
+                    await self.resume(run, connection, rpc.get("id"), params.get("after") or 0)
+            else:
+                await self.error(ws, rpc.get("id"), -32601, "Method not found")
+        return ws
+
+    async def error(self, ws: web.WebSocketResponse, request_id, code: int, message: str):
+        try:
+            await ws.send_json({"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}})
+        except ConnectionError:
+            pass
+
+    async def send(self, run: _Run, event: dict) -> bool:
+        """Deliver one event of a run to its connection; False if it has none"""
+        connection = run.connection
+        if connection is None or connection.ws.closed or connection.transport.is_closing():
+            run.connection = None
+            return False
+        try:
+            await connection.ws.send_json({"jsonrpc": "2.0", "id": run.request_id, "result": event})
+        except ConnectionError:
+            run.connection = None
+            return False
+        connection.sent += 1
+        if self.drop_after and connection.sent >= self.drop_after:
+            # Cut the connection without a close handshake, like a network failure
+            connection.transport.abort()
+        return True
+
+    async def emit(self, run: _Run, result: dict):
+        result.update(run_id=run.run_id, seq=len(run.events) + 1)
+        run.events.append(result)
+        await self.send(run, result)
+
+    async def resume(self, run: _Run, connection: _Connection, request_id, after: int):
+        """Replay a run's events after `after` to a new connection, then keep streaming there"""
+        run.connection = None
+        probe = _Run(run.run_id, connection, request_id)
+        sent = after
+        # Events emitted while replaying are picked up by the loop, then the
+        # run switches over with no await in between
+        while sent < len(run.events):
+            if not await self.send(probe, run.events[sent]):
+                return
+            sent += 1
+        run.connection = connection
+        run.request_id = request_id
+
+    async def reply(self, run: _Run, message: str):
+        # The first event goes out at once, telling the client the run id
+        await self.emit(run, {"type": "thinking", "text": "Working on it"})
+        await asyncio.sleep(self.latency)
+        if "run " in message:
+            await self.emit(run, {"type": "tool_start",
+                                  "tool": {"name": "exec", "input": {"command": message}}})
+            await asyncio.sleep(self.tool_latency)
+            await self.emit(run, {"type": "tool_end",
+                                  "output": {"status": "success", "stdout": "ok\n"}})
+
+        # Paced against a schedule rather than a fixed sleep per token, so
+        # send overhead does not lower the rate
+        started = time.monotonic()
+        for i in range(self.tokens):
+            delay = started + i / self.token_rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.emit(run, {"type": "text", "text": f"tok{i} "})
+        await self.emit(run, {"type": "done"})
+        asyncio.get_running_loop().call_later(self.retention, self.runs.pop, run.run_id, None)
+
+    async def handle_list(self, request: web.Request) -> web.Response:
+        """All sessions, or one page of them with ?limit=N&offset=M"""
+        await asyncio.sleep(self.rest_latency)
+        try:
+            offset = int(request.query.get("offset", 0))
+            limit = int(request.query.get("limit", self.sessions))
+        except ValueError:
+            raise web.HTTPBadRequest(text="limit and offset must be integers")
+        end = min(self.sessions, offset + max(limit, 0))
+        return web.json_response([{"id": f"session-{i}", "title": f"Session {i}"}
+                                  for i in range(max(offset, 0), end)])
+
+    async def handle_get(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.rest_latency)
+        session_id = request.match_info["session_id"]
+        if not session_id.startswith("session-"):
+            raise web.HTTPNotFound()
+        etag = f'"{session_id}-1"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        body = {"id": session_id, "messages": [{"role": "user", "content": "hello"},
+                                               {"role": "assistant", "content": "hi"}]}
+        return web.json_response(body, headers={"ETag": etag})
+
+
+async def serve(gateway: StubGateway, host: str, port: int):
+    runner = web.AppRunner(gateway.app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = runner.addresses[0][1]
+    # First line of stdout is the URL, for scripts that start the stub on port 0
+    print(f"http://{host}:{port}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline stub Moltis gateway")
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=13131, help="Port, or 0 for any free port")
+    parser.add_argument("--tokens", type=int, default=50, help="Text chunks per reply (default: 50)")
+    parser.add_argument("--token-rate", type=float, default=100.0,
+                        help="Text chunks per second per reply (default: 100)")
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="Seconds before the first event of a reply (default: 0.2)")
+    parser.add_argument("--tool-latency", type=float, default=0.5,
+                        help='Seconds a tool runs for messages containing "run " (default: 0.5)')
+    parser.add_argument("--sessions", type=int, default=100, help="Sessions listed (default: 100)")
+    parser.add_argument("--rest-latency", type=float, default=0.0,
+                        help="Seconds added to each REST response (default: 0)")
+    parser.add_argument("--drop-after", type=int, default=0,
+                        help="Abort each connection after this many events (default: never)")
+    parser.add_argument("--retention", type=float, default=60.0,
+                        help="Seconds a finished run can still be resumed (default: 60)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.drop_after:
+        # Writes racing a deliberate abort are expected; asyncio would warn about each
+        logging.getLogger("asyncio").setLevel(logging.ERROR)
+    gateway = StubGateway(args.tokens, args.token_rate, args.latency, args.tool_latency,
+                          args.sessions, args.rest_latency, args.drop_after, args.retention)
+    try:
+        asyncio.run(serve(gateway, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)